@@ -0,0 +1,47 @@
+from typing import Callable, Sequence, TypeVar, cast
+
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import database as db
+from . import db_helpers
+
+ResultT = TypeVar("ResultT")
+
+
+# Async counterparts of the db_helpers classes used by async endpoints. The
+# queries are shared: each helper runs the sync one through run_sync, which
+# awaits every database call on the event loop instead of blocking it.
+
+
+async def run_sync(
+    session: AsyncSession, call: Callable[[Session], ResultT]
+) -> ResultT:
+    # The sync session of a sqlmodel AsyncSession is a sqlmodel Session
+    return await session.run_sync(
+        lambda sync_session: call(cast(Session, sync_session))
+    )
+
+
+class AsyncGenresDBHelper:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_genre_stats(self) -> Sequence[tuple[str, int, int]]:
+        return await run_sync(
+            self.session,
+            lambda session: db_helpers.GenresDBHelper(session).get_genre_stats(),
+        )
+
+
+class AsyncPlaylistDBHelper:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_all_playlists(self, db_user: db.User | None) -> Sequence[db.Playlist]:
+        return await run_sync(
+            self.session,
+            lambda session: db_helpers.PlaylistDBHelper(session).get_all_playlists(
+                db_user
+            ),
+        )
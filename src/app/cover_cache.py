@@ -0,0 +1,26 @@
+import os
+
+from src.app.file_cache import FileCache
+
+
+COVER_CACHE_DIR = os.environ.get("MUSIC_RITMO_COVER_CACHE_DIR", "./cache/covers/")
+COVER_CACHE_MAX_BYTES = (
+    int(os.environ.get("MUSIC_RITMO_COVER_CACHE_MB", "256")) * 1024 * 1024
+)
+COVER_SIZE_BUCKETS = (32, 64, 128, 256, 512, 1024)
+DEFAULT_COVER_KEY = "default"
+
+
+def get_size_bucket(size: int | None) -> int:
+    """
+    Requested sizes are rounded up to the nearest bucket so that clients asking
+    for slightly different sizes share cache entries. 0 means the original image.
+    """
+    if size is not None:
+        for bucket in COVER_SIZE_BUCKETS:
+            if size <= bucket:
+                return bucket
+    return 0
+
+
+cover_cache = FileCache(COVER_CACHE_DIR, COVER_CACHE_MAX_BYTES)
@@ -1,13 +1,75 @@
-from typing import Any, Generator
-from sqlmodel import SQLModel, Session, create_engine, Field, Relationship
+import os
+import time
+from typing import Any, AsyncGenerator, Generator
+from sqlalchemy import DDL, Engine, Index, TableClause, column, event, table
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import SQLModel, Session, create_engine, Field, Relationship, col
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+DATABASE_URL = os.environ.get("MUSIC_RITMO_DATABASE_URL", "sqlite:///database.db")
+SQLITE_JOURNAL_MODE = os.environ.get("MUSIC_RITMO_SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("MUSIC_RITMO_SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(
+    os.environ.get("MUSIC_RITMO_SQLITE_BUSY_TIMEOUT_MS", "5000")
+)
+SQLITE_MMAP_SIZE_MB = int(os.environ.get("MUSIC_RITMO_SQLITE_MMAP_SIZE_MB", "256"))
+SQLITE_CACHE_SIZE_MB = int(os.environ.get("MUSIC_RITMO_SQLITE_CACHE_SIZE_MB", "64"))
+# Синхронные эндпоинты FastAPI выполняются в пуле потоков anyio на 40 потоков
+DB_POOL_SIZE = int(os.environ.get("MUSIC_RITMO_DB_POOL_SIZE", "40"))
+DB_POOL_OVERFLOW = int(os.environ.get("MUSIC_RITMO_DB_POOL_OVERFLOW", "10"))
+
+
+def set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    # Отрицательное значение задаёт размер кеша в КиБ, а не в страницах
+    cursor.execute(f"PRAGMA cache_size={-SQLITE_CACHE_SIZE_MB * 1024}")
+    cursor.close()
+
+
+def create_db_engine(url: str = DATABASE_URL) -> Engine:
+    engine = create_engine(
+        url,
+        echo=False,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_OVERFLOW,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+    )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+engine = create_db_engine()
+
+
+def create_async_db_engine(url: str = DATABASE_URL) -> AsyncEngine:
+    # Запросы выполняются в потоке aiosqlite и не блокируют цикл событий.
+    # Для файловых баз aiosqlite по умолчанию берёт NullPool без pool_size
+    engine = create_async_engine(
+        url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_OVERFLOW,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    )
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
 
-DATABASE_URL = "sqlite:///database.db"
-engine = create_engine(DATABASE_URL, echo=False)
 
+async_engine = create_async_db_engine()
 
-def init_db() -> None:
-    SQLModel.metadata.drop_all(engine)
-    SQLModel.metadata.create_all(engine)
+
+# Время добавления и последнего прослушивания хранится в секундах Unix
+def current_timestamp() -> int:
+    return int(time.time())
 
 
 def get_session() -> Generator[Session, Any, None]:
@@ -15,35 +77,40 @@ def get_session() -> Generator[Session, Any, None]:
         yield session
 
 
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(async_engine) as session:
+        yield session
+
+
 # Таблицы связи "многие к многим"
 class GenreTrack(SQLModel, table=True):
     __tablename__ = "Genre_Tracks"
     genre_id: int = Field(primary_key=True, foreign_key="Genres.id")
-    track_id: int = Field(primary_key=True, foreign_key="Tracks.id")
+    track_id: int = Field(primary_key=True, foreign_key="Tracks.id", index=True)
 
 
 class ArtistTrack(SQLModel, table=True):
     __tablename__ = "Artist_Tracks"
     artist_id: int = Field(primary_key=True, foreign_key="Artists.id")
-    track_id: int = Field(primary_key=True, foreign_key="Tracks.id")
+    track_id: int = Field(primary_key=True, foreign_key="Tracks.id", index=True)
 
 
 class ArtistAlbum(SQLModel, table=True):
     __tablename__ = "Artist_Albums"
     artist_id: int = Field(primary_key=True, foreign_key="Artists.id")
-    album_id: int = Field(primary_key=True, foreign_key="Albums.id")
+    album_id: int = Field(primary_key=True, foreign_key="Albums.id", index=True)
 
 
 class CustomTagTrack(SQLModel, table=True):
     __tablename__ = "CustomTag_Tracks"
     custom_tag_id: int = Field(primary_key=True, foreign_key="CustomTags.id")
-    track_id: int = Field(primary_key=True, foreign_key="Tracks.id")
+    track_id: int = Field(primary_key=True, foreign_key="Tracks.id", index=True)
 
 
 class PlaylistTrack(SQLModel, table=True):
     __tablename__ = "Playlist_Tracks"
     playlist_id: int = Field(primary_key=True, foreign_key="Playlists.id")
-    track_id: int = Field(primary_key=True, foreign_key="Tracks.id")
+    track_id: int = Field(primary_key=True, foreign_key="Tracks.id", index=True)
     added_at: str
 
     playlist: "Playlist" = Relationship(back_populates="playlist_tracks")
@@ -53,7 +120,7 @@ class PlaylistTrack(SQLModel, table=True):
 class FavouriteTrack(SQLModel, table=True):
     __tablename__ = "Favourite_Tracks"
     user_id: int = Field(primary_key=True, foreign_key="Users.id")
-    track_id: int = Field(primary_key=True, foreign_key="Tracks.id")
+    track_id: int = Field(primary_key=True, foreign_key="Tracks.id", index=True)
     added_at: str
 
     user: "User" = Relationship(back_populates="favourite_tracks")
@@ -63,7 +130,7 @@ class FavouriteTrack(SQLModel, table=True):
 class FavouriteAlbum(SQLModel, table=True):
     __tablename__ = "Favourite_Albums"
     user_id: int = Field(primary_key=True, foreign_key="Users.id")
-    album_id: int = Field(primary_key=True, foreign_key="Albums.id")
+    album_id: int = Field(primary_key=True, foreign_key="Albums.id", index=True)
     added_at: str
 
     user: "User" = Relationship(back_populates="favourite_albums")
@@ -73,7 +140,7 @@ class FavouriteAlbum(SQLModel, table=True):
 class FavouritePlaylist(SQLModel, table=True):
     __tablename__ = "Favourite_Playlists"
     user_id: int = Field(primary_key=True, foreign_key="Users.id")
-    playlist_id: int = Field(primary_key=True, foreign_key="Playlists.id")
+    playlist_id: int = Field(primary_key=True, foreign_key="Playlists.id", index=True)
     added_at: str
 
     user: "User" = Relationship(back_populates="favourite_playlists")
@@ -83,7 +150,7 @@ class FavouritePlaylist(SQLModel, table=True):
 class FavouriteArtist(SQLModel, table=True):
     __tablename__ = "Favourite_Artists"
     user_id: int = Field(primary_key=True, foreign_key="Users.id")
-    artist_id: int = Field(primary_key=True, foreign_key="Artists.id")
+    artist_id: int = Field(primary_key=True, foreign_key="Artists.id", index=True)
     added_at: str
 
     user: "User" = Relationship(back_populates="favourite_artists")
@@ -94,7 +161,7 @@ class FavouriteArtist(SQLModel, table=True):
 class User(SQLModel, table=True):
     __tablename__ = "Users"
     id: int = Field(primary_key=True)
-    login: str
+    login: str = Field(index=True)
     password: str
     avatar: str
 
@@ -108,17 +175,20 @@ class User(SQLModel, table=True):
 class Track(SQLModel, table=True):
     __tablename__ = "Tracks"
     id: int = Field(primary_key=True)
-    file_path: str
+    file_path: str = Field(index=True, unique=True)
     file_size: int
+    file_mtime: int = Field(default=0)
     type: str
     title: str = Field(index=True)
-    album_id: int | None = Field(foreign_key="Albums.id")
-    album_artist_id: int | None = Field(foreign_key="Artists.id")
+    album_id: int | None = Field(foreign_key="Albums.id", index=True)
+    album_artist_id: int | None = Field(foreign_key="Artists.id", index=True)
     album_position: int | None
     year: str | None
     plays_count: int
-    cover: bytes
-    cover_type: str
+    cover_id: str | None = Field(default=None, foreign_key="Covers.id")
+    cover_art_hash: str | None = Field(default=None)
+    created: int = Field(default_factory=current_timestamp)
+    last_played: int | None = Field(default=None)
 
     bit_rate: int
     bits_per_sample: int
@@ -159,11 +229,17 @@ class Album(SQLModel, table=True):
     __tablename__ = "Albums"
     id: int = Field(primary_key=True)
     name: str = Field(index=True)
-    album_artist_id: int | None = Field(foreign_key="Artists.id")
+    album_artist_id: int | None = Field(foreign_key="Artists.id", index=True)
     total_tracks: int
     year: str | None
-    cover: bytes | None
+    cover_id: str | None = Field(default=None, foreign_key="Covers.id")
+    # year и play_count индексируются составными индексами ниже
     play_count: int = Field(default=0)
+    # Имя исполнителя альбома для сортировки, обновляется при загрузке треков
+    artist_sort_name: str = Field(default="", index=True)
+    # Индексы для списков newest и recent
+    created: int = Field(default_factory=current_timestamp, index=True)
+    last_played: int | None = Field(default=None, index=True)
 
     tracks: list["Track"] = Relationship(back_populates="album")
     artists: list["Artist"] = Relationship(
@@ -172,11 +248,18 @@ class Album(SQLModel, table=True):
     album_favourites: list["FavouriteAlbum"] = Relationship(back_populates="album")
 
 
+# Составные индексы в порядке постраничных списков альбомов: страница после
+# курсора читается из индекса без сортировки
+Index("ix_Albums_year_name", col(Album.year), col(Album.name))
+Index("ix_Albums_year_desc_name", col(Album.year).desc(), col(Album.name))
+Index("ix_Albums_play_count_desc_name", col(Album.play_count).desc(), col(Album.name))
+
+
 class Playlist(SQLModel, table=True):
     __tablename__ = "Playlists"
     id: int = Field(primary_key=True)
     name: str = Field(index=True)
-    user_id: int = Field(foreign_key="Users.id")
+    user_id: int = Field(foreign_key="Users.id", index=True)
     total_tracks: int
     create_date: str
 
@@ -210,3 +293,69 @@ class CustomTag(SQLModel, table=True):
     tracks: list["Track"] = Relationship(
         back_populates="custom_tags", link_model=CustomTagTrack
     )
+
+
+# Превью обложек, общие для всех треков и альбомов с одинаковой картинкой.
+# Ключ — хеш содержимого превью
+class Cover(SQLModel, table=True):
+    __tablename__ = "Covers"
+    id: str = Field(primary_key=True)
+    data: bytes
+    type: str
+
+
+# Прогресс незавершённого сканирования: обновляется в одной транзакции с каждой
+# загруженной пачкой файлов и удаляется, когда сканирование закончено
+class ScanCheckpoint(SQLModel, table=True):
+    __tablename__ = "ScanCheckpoints"
+    id: int = Field(primary_key=True)
+    directory: str
+    started_at: str
+    loaded_files: int = Field(default=0)
+    last_file_path: str | None = Field(default=None)
+    starred_data: str | None = Field(default=None)
+    # Время добавления треков по пути файла, переносится через полное сканирование
+    created_data: str | None = Field(default=None)
+
+
+# Полнотекстовый поиск по названиям. FTS5-таблицы с внешним содержимым хранят
+# только индекс, а триггеры синхронизируют их с основными таблицами при любой
+# записи. Триграммы сохраняют поиск по подстроке и не учитывают регистр,
+# в том числе для кириллицы
+SEARCH_COLUMNS = {"Tracks": "title", "Albums": "name", "Artists": "name"}
+
+
+def get_search_table(model: type[SQLModel]) -> TableClause:
+    table_name = str(model.__tablename__)
+    return table(
+        f"{table_name}Search",
+        column("rowid"),
+        column(SEARCH_COLUMNS[table_name]),
+        column("rank"),
+    )
+
+
+def get_search_ddl(table_name: str) -> list[str]:
+    search = f"{table_name}Search"
+    name = SEARCH_COLUMNS[table_name]
+    insert = f'INSERT INTO "{search}"(rowid, {name}) VALUES (new.id, new.{name});'
+    delete = (
+        f'INSERT INTO "{search}"("{search}", rowid, {name}) '
+        f"VALUES ('delete', old.id, old.{name});"
+    )
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS "{search}" USING fts5({name}, '
+        f"content='{table_name}', content_rowid='id', tokenize='trigram')",
+        f'CREATE TRIGGER IF NOT EXISTS "{search}_insert" AFTER INSERT '
+        f'ON "{table_name}" BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS "{search}_delete" AFTER DELETE '
+        f'ON "{table_name}" BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS "{search}_update" AFTER UPDATE OF {name} '
+        f'ON "{table_name}" BEGIN {delete} {insert} END',
+    ]
+
+
+for table_name in SEARCH_COLUMNS:
+    for statement in get_search_ddl(table_name):
+        ddl = DDL(statement)  # type: ignore[no-untyped-call]
+        event.listen(SQLModel.metadata.tables[table_name], "after_create", ddl)
@@ -1,17 +1,270 @@
+import base64
+import json
+import math
+import random
+from dataclasses import dataclass
 from datetime import datetime
-from sqlalchemy import asc, desc, func
-from sqlmodel import Session, select
-from typing import List, Optional, Sequence
+from sqlalchemy import ColumnElement, and_, asc, desc, func, or_
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, SQLModel, col, select
+from sqlmodel.sql.expression import SelectOfScalar
+from typing import Any, List, Optional, Sequence
 
 from . import database as db
 
+# Trigram index matches only substrings of at least 3 characters
+MIN_SEARCH_LENGTH = 3
+# Rounds of random id draws before get_random_ids shuffles the matching rows,
+# and the most ids drawn in one round
+RANDOM_SAMPLE_ROUNDS = 4
+RANDOM_SAMPLE_MAX_DRAWS = 5000
+
+# Loader options for the relationships read by the fill_* functions of
+# service_layer, so that filling a list of rows takes a fixed number of queries
+TRACK_RELATIONS = (
+    joinedload(db.Track.album).selectinload(db.Album.artists),  # type: ignore[arg-type]
+    selectinload(db.Track.artists),  # type: ignore[arg-type]
+    selectinload(db.Track.genres),  # type: ignore[arg-type]
+    selectinload(db.Track.track_favourites),  # type: ignore[arg-type]
+)
+ALBUM_RELATIONS = (
+    selectinload(db.Album.artists),  # type: ignore[arg-type]
+    selectinload(db.Album.tracks).selectinload(db.Track.genres),  # type: ignore[arg-type]
+)
+ALBUM_WITH_TRACKS_RELATIONS = (
+    selectinload(db.Album.artists),  # type: ignore[arg-type]
+    selectinload(db.Album.tracks).options(  # type: ignore[arg-type]
+        selectinload(db.Track.artists),  # type: ignore[arg-type]
+        selectinload(db.Track.genres),  # type: ignore[arg-type]
+        selectinload(db.Track.track_favourites),  # type: ignore[arg-type]
+    ),
+)
+PLAYLIST_RELATIONS = (
+    joinedload(db.Playlist.user),  # type: ignore[arg-type]
+    selectinload(db.Playlist.playlist_tracks).joinedload(  # type: ignore[arg-type]
+        db.PlaylistTrack.track  # type: ignore[arg-type]
+    ),
+)
+PLAYLIST_WITH_TRACKS_RELATIONS = (
+    joinedload(db.Playlist.user),  # type: ignore[arg-type]
+    selectinload(db.Playlist.playlist_tracks)  # type: ignore[arg-type]
+    .joinedload(db.PlaylistTrack.track)  # type: ignore[arg-type]
+    .options(*TRACK_RELATIONS),
+)
+
+
+@dataclass(frozen=True)
+class SortColumn:
+    """Column of a list order. NULLs sort as `null_value` when it is set."""
+
+    column: Any
+    descending: bool = False
+    null_value: Any = None
+
+    @property
+    def expression(self) -> Any:
+        if self.null_value is None:
+            return self.column
+        return func.coalesce(self.column, self.null_value)
+
+    def value(self, row: Any) -> Any:
+        value = getattr(row, self.column.key)
+        return self.null_value if value is None else value
+
+
+# Orders of paged lists. Each ends with the id, so that every row has a unique
+# position and a cursor can point between any two rows
+ALBUMS_BY_NAME = (SortColumn(db.Album.name), SortColumn(db.Album.id))
+ALBUMS_BY_ARTIST = (SortColumn(db.Album.artist_sort_name), SortColumn(db.Album.id))
+ALBUMS_BY_YEAR = (
+    SortColumn(db.Album.year),
+    SortColumn(db.Album.name),
+    SortColumn(db.Album.id),
+)
+ALBUMS_BY_YEAR_REVERSED = (
+    SortColumn(db.Album.year, descending=True),
+    SortColumn(db.Album.name),
+    SortColumn(db.Album.id),
+)
+ALBUMS_BY_FREQUENCY = (
+    SortColumn(db.Album.play_count, descending=True),
+    SortColumn(db.Album.name),
+    SortColumn(db.Album.id),
+)
+ARTIST_ALBUMS = (
+    SortColumn(db.Album.year, descending=True, null_value=""),
+    SortColumn(db.Album.name),
+    SortColumn(db.Album.id),
+)
+# Single column indexes end with the rowid, so these are read backwards from them
+ALBUMS_BY_CREATED = (
+    SortColumn(db.Album.created, descending=True),
+    SortColumn(db.Album.id, descending=True),
+)
+ALBUMS_BY_LAST_PLAYED = (
+    SortColumn(db.Album.last_played, descending=True),
+    SortColumn(db.Album.id, descending=True),
+)
+
+
+def encode_cursor(list_name: str, order: Sequence[SortColumn], row: Any) -> str:
+    """
+    Opaque token pointing right after `row` in the list `list_name` sorted by
+    `order`.
+    """
+    data = {"list": list_name, "key": [column.value(row) for column in order]}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor: str, list_name: str) -> list[Any]:
+    """Sort key of the cursor, which must come from the list `list_name`."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+    if not isinstance(data, dict) or data.get("list") != list_name:
+        raise ValueError(f"Cursor {cursor!r} is not from the list {list_name}")
+    key = data.get("key")
+    if not isinstance(key, list) or not all(map(is_cursor_value, key)):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return key
+
+
+def is_cursor_value(value: Any) -> bool:
+    # Values are bound as SQLite parameters
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return -(2**63) <= value < 2**63
+    return value is None or isinstance(value, (str, float))
+
+
+def paginate(
+    query: SelectOfScalar[Any],
+    order: Sequence[SortColumn],
+    size: int,
+    offset: int,
+    after: Sequence[Any] | None = None,
+) -> SelectOfScalar[Any]:
+    """
+    Sorts the query by `order` and selects a page of it. With `after`, the key of
+    the last row of the previous page, the page starts right after that row with
+    an index seek; `offset` then counts from there.
+    """
+    query = query.order_by(
+        *(desc(c.expression) if c.descending else asc(c.expression) for c in order)
+    )
+    if after is not None:
+        if len(after) != len(order):
+            raise ValueError("Cursor does not match the list order")
+        conditions = []
+        for i, column in enumerate(order):
+            equal = [c.expression == value for c, value in zip(order[:i], after)]
+            if column.descending:
+                conditions.append(and_(*equal, column.expression < after[i]))
+            else:
+                conditions.append(and_(*equal, column.expression > after[i]))
+        first: ColumnElement[bool] = (
+            order[0].expression <= after[0]
+            if order[0].descending
+            else order[0].expression >= after[0]
+        )
+        # The bound on the first column alone is what SQLite seeks the index by
+        query = query.where(first, or_(*conditions))
+    return query.limit(size).offset(offset)
+
+
+def search(
+    model: type[SQLModel], query: str, size: int, offset: int
+) -> SelectOfScalar[Any]:
+    """
+    Select of `model` rows whose name contains `query`, best bm25 matches first.
+    """
+    search_table = db.get_search_table(model)
+    name = search_table.c[db.SEARCH_COLUMNS[str(model.__tablename__)]]
+    phrase = '"' + query.replace('"', '""') + '"'
+    model_id = model.id  # type: ignore[attr-defined]
+    return (
+        select(model)
+        .join(search_table, search_table.c.rowid == model_id)
+        .where(name.op("MATCH")(phrase))
+        .order_by(search_table.c.rank, model_id)
+        .limit(size)
+        .offset(offset)
+    )
+
+
+def get_by_ids(
+    session: Session,
+    model: type[SQLModel],
+    ids: Sequence[int],
+    options: Sequence[Any] = (),
+) -> list[Any]:
+    """`model` rows with the given ids, in the order of `ids`."""
+    model_id = model.id  # type: ignore[attr-defined]
+    rows = session.exec(select(model).where(model_id.in_(ids)).options(*options)).all()
+    rows_by_id = {row.id: row for row in rows}  # type: ignore[attr-defined]
+    return [rows_by_id[id] for id in ids if id in rows_by_id]
+
+
+def get_random_ids(
+    session: Session, model: type[SQLModel], size: int, *filters: Any
+) -> list[int]:
+    """
+    Ids of up to `size` distinct random `model` rows matching the filters, every
+    row equally likely. Random ids between the smallest and largest matching id
+    are looked up by primary key, more of them the sparser the matches are, so
+    at most RANDOM_SAMPLE_ROUNDS * RANDOM_SAMPLE_MAX_DRAWS lookups are made.
+    Only filters matching fewer than about one id in RANDOM_SAMPLE_MAX_DRAWS /
+    size are sampled by shuffling all matching rows.
+    """
+    model_id = model.id  # type: ignore[attr-defined]
+    query = select(model_id).where(*filters)
+    # SQLite reads min and max from the index only when they are queried apart
+    low = session.exec(select(func.min(model_id)).where(*filters)).one()
+    high = session.exec(select(func.max(model_id)).where(*filters)).one()
+    if low is None or size <= 0:
+        return []
+
+    ids: list[int] = []
+    picked: set[int] = set()
+    drawn = matched = 0
+    for _ in range(RANDOM_SAMPLE_ROUNDS):
+        density = max(matched, 1) / drawn if drawn else 1
+        count = min(math.ceil(2 * (size - len(ids)) / density), RANDOM_SAMPLE_MAX_DRAWS)
+        draws = [random.randint(low, high) for _ in range(count)]
+        found = set(session.exec(query.where(model_id.in_(draws))).all())
+        drawn += count
+        for id in draws:
+            if id not in found:
+                continue
+            matched += 1
+            if id not in picked and len(ids) < size:
+                ids.append(id)
+                picked.add(id)
+        if len(ids) == size:
+            return ids
+
+    if ids:
+        query = query.where(model_id.not_in(ids))
+    ids.extend(session.exec(query.order_by(func.random()).limit(size - len(ids))))
+    return ids
+
 
 class ArtistDBHelper:
     def __init__(self, session: Session):
         self.session = session
 
-    def get_all_artists(self, filter_name: str | None = None) -> Sequence[db.Artist]:
+    def get_all_artists(
+        self, filter_name: str | None = None, with_albums: bool = False
+    ) -> Sequence[db.Artist]:
         query = select(db.Artist)
+        if with_albums:
+            query = query.options(
+                selectinload(db.Artist.albums).options(  # type: ignore[arg-type]
+                    *ALBUM_WITH_TRACKS_RELATIONS
+                )
+            )
         if filter_name:
             query = query.where(
                 func.lower(db.Artist.name).like(f"%{filter_name.lower()}%")
@@ -29,9 +282,20 @@ class ArtistDBHelper:
         query = query.limit(size).offset(offset)
         return self.session.exec(query).all()
 
+    def search_artists(self, query: str, size: int, offset: int) -> Sequence[db.Artist]:
+        if len(query) < MIN_SEARCH_LENGTH:
+            return self.get_artists(size, offset, filter_name=query)
+        return self.session.exec(search(db.Artist, query, size, offset)).all()
+
     def get_artist_by_id(self, id: int) -> db.Artist | None:
         return self.session.exec(
-            select(db.Artist).where(db.Artist.id == id)
+            select(db.Artist)
+            .where(db.Artist.id == id)
+            .options(
+                selectinload(db.Artist.albums).options(  # type: ignore[arg-type]
+                    *ALBUM_WITH_TRACKS_RELATIONS
+                )
+            )
         ).one_or_none()
 
 
@@ -41,7 +305,7 @@ class AlbumDBHelper:
         self.track_db_helper = TrackDBHelper(session)
 
     def get_all_albums(self, filter_name: str | None = None) -> Sequence[db.Album]:
-        query = select(db.Album)
+        query = select(db.Album).options(*ALBUM_RELATIONS)
         if filter_name:
             query = query.where(
                 func.lower(db.Album.name).like(f"%{filter_name.lower()}%")
@@ -51,7 +315,7 @@ class AlbumDBHelper:
     def get_albums(
         self, size: int, offset: int, filter_name: str | None = None
     ) -> Sequence[db.Album]:
-        query = select(db.Album)
+        query = select(db.Album).options(*ALBUM_RELATIONS)
         if filter_name:
             query = query.where(
                 func.lower(db.Album.name).like(f"%{filter_name.lower()}%")
@@ -59,14 +323,30 @@ class AlbumDBHelper:
         query = query.limit(size).offset(offset)
         return self.session.exec(query).all()
 
+    def search_albums(self, query: str, size: int, offset: int) -> Sequence[db.Album]:
+        if len(query) < MIN_SEARCH_LENGTH:
+            return self.get_albums(size, offset, filter_name=query)
+        return self.session.exec(
+            search(db.Album, query, size, offset).options(*ALBUM_RELATIONS)
+        ).all()
+
     def get_album_by_id(self, id: int) -> db.Album | None:
         return self.session.exec(
-            select(db.Album).where(db.Album.id == id)
+            select(db.Album)
+            .where(db.Album.id == id)
+            .options(*ALBUM_WITH_TRACKS_RELATIONS)
         ).one_or_none()
 
-    def get_albums_by_name(self, size: int, offset: int) -> Sequence[db.Album]:
+    def get_random_albums(self, size: int) -> Sequence[db.Album]:
+        ids = get_random_ids(self.session, db.Album, size)
+        return get_by_ids(self.session, db.Album, ids, ALBUM_RELATIONS)
+
+    def get_albums_by_name(
+        self, size: int, offset: int, after: Sequence[Any] | None = None
+    ) -> Sequence[db.Album]:
+        query = select(db.Album).options(*ALBUM_RELATIONS)
         return self.session.exec(
-            select(db.Album).order_by(db.Album.name).limit(size).offset(offset)
+            paginate(query, ALBUMS_BY_NAME, size, offset, after)
         ).all()
 
     def get_first_track(self, albumId: int) -> db.Track | None:
@@ -77,22 +357,31 @@ class AlbumDBHelper:
             .limit(1)
         ).one_or_none()
 
-    def get_album_artist(self, albumId: int) -> db.Artist | None:
-        track = self.get_first_track(albumId)
-        return self.track_db_helper.get_album_artist(track.id) if track else None
+    def get_albums_by_artist(
+        self, size: int, offset: int, after: Sequence[Any] | None = None
+    ) -> Sequence[db.Album]:
+        query = select(db.Album).options(*ALBUM_RELATIONS)
+        return self.session.exec(
+            paginate(query, ALBUMS_BY_ARTIST, size, offset, after)
+        ).all()
 
     def get_sorted_artist_albums(
-        self, artist_id: int, size: int, offset: int
+        self,
+        artist_id: int,
+        size: int,
+        offset: int,
+        after: Sequence[Any] | None = None,
     ) -> Sequence[db.Album]:
-        return self.session.exec(
+        query = (
             select(db.Album)
             .join(db.ArtistAlbum)
             .where(db.ArtistAlbum.album_id == db.Album.id)
             .where(db.ArtistAlbum.artist_id == artist_id)
             .distinct()
-            .order_by(desc(db.Album.year), db.Album.name)  # type: ignore
-            .limit(size)
-            .offset(offset)
+            .options(*ALBUM_RELATIONS)
+        )
+        return self.session.exec(
+            paginate(query, ARTIST_ALBUMS, size, offset, after)
         ).all()
 
     def get_sorted_by_year_albums(
@@ -102,42 +391,67 @@ class AlbumDBHelper:
         size: int,
         offset: int,
         reversed_order: bool = False,
+        after: Sequence[Any] | None = None,
     ) -> Sequence[db.Album]:
-        order = asc if not reversed_order else desc
-        return self.session.exec(
+        query = (
             select(db.Album)
             .where(db.Album.year >= min_year)  # type: ignore
             .where(db.Album.year <= max_year)  # type: ignore
-            .order_by(order(db.Album.year))  # type: ignore
-            .order_by(db.Album.name)
-            .limit(size)
-            .offset(offset)
-        ).all()
+            .options(*ALBUM_RELATIONS)
+        )
+        order = ALBUMS_BY_YEAR_REVERSED if reversed_order else ALBUMS_BY_YEAR
+        return self.session.exec(paginate(query, order, size, offset, after)).all()
 
     def get_albums_by_genre(
-        self, genre: str, size: int, offset: int
+        self,
+        genre: str,
+        size: int,
+        offset: int,
+        after: Sequence[Any] | None = None,
     ) -> Sequence[db.Album]:
-        return self.session.exec(
-            select(db.Album)
-            .distinct()
-            .join(db.Track, db.Track.album_id == db.Album.id)  # type: ignore
+        # Subqueries instead of joins let SQLite start from the matching genres
+        # and walk Genre_Tracks by its primary key
+        genre_ids = select(db.Genre.id).where(func.lower(db.Genre.name).like(genre))
+        album_ids = (
+            select(db.Track.album_id)
             .join(db.GenreTrack, db.GenreTrack.track_id == db.Track.id)  # type: ignore
-            .join(db.Genre, db.Genre.id == db.GenreTrack.genre_id)  # type: ignore
-            .where(func.lower(db.Genre.name).like(genre))
-            .order_by(db.Album.name)
-            .limit(size)
-            .offset(offset)
+            .where(col(db.GenreTrack.genre_id).in_(genre_ids))
+        )
+        query = (
+            select(db.Album)
+            .where(col(db.Album.id).in_(album_ids))
+            .options(*ALBUM_RELATIONS)
+        )
+        return self.session.exec(
+            paginate(query, ALBUMS_BY_NAME, size, offset, after)
         ).all()
 
     def get_sorted_albums_by_frequency(
-        self, size: int, offset: int
+        self, size: int, offset: int, after: Sequence[Any] | None = None
     ) -> Sequence[db.Album]:
+        query = select(db.Album).options(*ALBUM_RELATIONS)
         return self.session.exec(
+            paginate(query, ALBUMS_BY_FREQUENCY, size, offset, after)
+        ).all()
+
+    def get_newest_albums(
+        self, size: int, offset: int, after: Sequence[Any] | None = None
+    ) -> Sequence[db.Album]:
+        query = select(db.Album).options(*ALBUM_RELATIONS)
+        return self.session.exec(
+            paginate(query, ALBUMS_BY_CREATED, size, offset, after)
+        ).all()
+
+    def get_recently_played_albums(
+        self, size: int, offset: int, after: Sequence[Any] | None = None
+    ) -> Sequence[db.Album]:
+        query = (
             select(db.Album)
-            .order_by(desc(db.Album.play_count))  # type: ignore
-            .order_by(db.Album.name)
-            .limit(size)
-            .offset(offset)
+            .where(col(db.Album.last_played).is_not(None))
+            .options(*ALBUM_RELATIONS)
+        )
+        return self.session.exec(
+            paginate(query, ALBUMS_BY_LAST_PLAYED, size, offset, after)
         ).all()
 
 
@@ -146,7 +460,7 @@ class TrackDBHelper:
         self.session = session
 
     def get_all_tracks(self, filter_title: str | None = None) -> Sequence[db.Track]:
-        query = select(db.Track)
+        query = select(db.Track).options(*TRACK_RELATIONS)
         if filter_title:
             query = query.where(
                 func.lower(db.Track.title).like(f"%{filter_title.lower()}%")
@@ -156,7 +470,7 @@ class TrackDBHelper:
     def get_tracks(
         self, size: int, offset: int, filter_title: str | None = None
     ) -> Sequence[db.Track]:
-        query = select(db.Track)
+        query = select(db.Track).options(*TRACK_RELATIONS)
         if filter_title:
             query = query.where(
                 func.lower(db.Track.title).like(f"%{filter_title.lower()}%")
@@ -164,6 +478,13 @@ class TrackDBHelper:
         query = query.limit(size).offset(offset)
         return self.session.exec(query).all()
 
+    def search_tracks(self, query: str, size: int, offset: int) -> Sequence[db.Track]:
+        if len(query) < MIN_SEARCH_LENGTH:
+            return self.get_tracks(size, offset, filter_title=query)
+        return self.session.exec(
+            search(db.Track, query, size, offset).options(*TRACK_RELATIONS)
+        ).all()
+
     def get_track_by_id(self, id: int) -> db.Track | None:
         return self.session.exec(
             select(db.Track).where(db.Track.id == id)
@@ -189,8 +510,37 @@ class TrackDBHelper:
             .limit(1)
         ).one()
 
+    def get_random_tracks(
+        self,
+        size: int,
+        genre_name: str | None = None,
+        from_year: str | None = None,
+        to_year: str | None = None,
+    ) -> Sequence[db.Track]:
+        filters: list[Any] = []
+        if genre_name:
+            filters.append(
+                col(db.Track.id).in_(
+                    select(db.GenreTrack.track_id)
+                    .join(db.Genre)
+                    .where(db.GenreTrack.genre_id == db.Genre.id)
+                    .where(db.Genre.name == genre_name)
+                )
+            )
+        if from_year or to_year:
+            filters.append(col(db.Track.year) != "")
+        if from_year:
+            filters.append(col(db.Track.year) >= from_year)
+        if to_year:
+            filters.append(col(db.Track.year) <= to_year)
+        ids = get_random_ids(self.session, db.Track, size, *filters)
+        return get_by_ids(self.session, db.Track, ids, TRACK_RELATIONS)
+
     def get_tracks_by_genre_name(
-        self, genre_name: str, size: int | None = None, offset: int | None = None
+        self,
+        genre_name: str,
+        size: int | None = None,
+        offset: int | None = None,
     ) -> Sequence[db.Track]:
         query = (
             select(db.Track)
@@ -199,6 +549,7 @@ class TrackDBHelper:
             .join(db.Genre)
             .where(db.GenreTrack.genre_id == db.Genre.id)
             .where(db.Genre.name == genre_name)
+            .options(*TRACK_RELATIONS)
         )
         if size:
             query = query.limit(size)
@@ -211,8 +562,19 @@ class GenresDBHelper:
     def __init__(self, session: Session):
         self.session = session
 
-    def get_all_genres(self) -> Sequence[db.Genre]:
-        return self.session.exec(select(db.Genre)).all()
+    def get_genre_stats(self) -> Sequence[tuple[str, int, int]]:
+        """Name, album count and track count of every genre, ordered by name."""
+        return self.session.exec(
+            select(
+                db.Genre.name,
+                func.count(col(db.Track.album_id).distinct()),
+                func.count(col(db.GenreTrack.track_id)),
+            )
+            .outerjoin(db.GenreTrack, col(db.GenreTrack.genre_id) == db.Genre.id)
+            .outerjoin(db.Track, col(db.Track.id) == db.GenreTrack.track_id)
+            .group_by(col(db.Genre.id))
+            .order_by(db.Genre.name)
+        ).all()
 
 
 class FavouriteDBHelper:
@@ -322,12 +684,14 @@ class FavouriteDBHelper:
 
     def get_starred_tracks(self, user_id: int) -> Sequence[db.Track]:
         return self.session.exec(
-            select(db.Track).where(
+            select(db.Track)
+            .where(
                 (
                     (db.FavouriteTrack.track_id == db.Track.id)
                     & (db.FavouriteTrack.user_id == user_id)
                 )
             )
+            .options(*TRACK_RELATIONS)
         ).all()
 
     def get_starred_artists(self, user_id: int) -> Sequence[db.Artist]:
@@ -342,22 +706,26 @@ class FavouriteDBHelper:
 
     def get_starred_albums(self, user_id: int) -> Sequence[db.Album]:
         return self.session.exec(
-            select(db.Album).where(
+            select(db.Album)
+            .where(
                 (
                     (db.FavouriteAlbum.album_id == db.Album.id)
                     & (db.FavouriteAlbum.user_id == user_id)
                 )
             )
+            .options(*ALBUM_RELATIONS)
         ).all()
 
     def get_starred_playlists(self, user_id: int) -> Sequence[db.Playlist]:
         return self.session.exec(
-            select(db.Playlist).where(
+            select(db.Playlist)
+            .where(
                 (
                     (db.FavouritePlaylist.playlist_id == db.Playlist.id)
                     & (db.FavouritePlaylist.user_id == user_id)
                 )
             )
+            .options(*PLAYLIST_RELATIONS)
         ).all()
 
 
@@ -430,16 +798,16 @@ class PlaylistDBHelper:
 
     def get_playlist(self, id: int) -> db.Playlist | None:
         return self.session.exec(
-            select(db.Playlist).where(db.Playlist.id == id)
+            select(db.Playlist)
+            .where(db.Playlist.id == id)
+            .options(*PLAYLIST_WITH_TRACKS_RELATIONS)
         ).one_or_none()
 
     def get_all_playlists(self, db_user: db.User | None) -> Sequence[db.Playlist]:
-        if db_user is None:
-            return self.session.exec(select(db.Playlist)).all()
-        else:
-            return self.session.exec(
-                select(db.Playlist).where(db.Playlist.user_id == db_user.id)
-            ).all()
+        query = select(db.Playlist).options(*PLAYLIST_RELATIONS)
+        if db_user is not None:
+            query = query.where(db.Playlist.user_id == db_user.id)
+        return self.session.exec(query).all()
 
 
 class UserDBHelper:
@@ -1,21 +1,49 @@
+import json
 import logging
+import multiprocessing
 import os
 import re
+import threading
+import time
 
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from collections import Counter
+from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator
 from mutagen.flac import FLAC
 from mutagen.mp3 import MP3
-from sqlmodel import Session, select
+from sqlalchemy import Connection, bindparam, delete, func, insert, or_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, SQLModel, col, select
 
 from src.app import database as db
 from src.app import utils
+from src.app.fuzzy_search import fuzzy_index
 
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
-scanStatus = {"scanning": True, "count": 0}
+scanStatus = {"scanning": False, "count": 0}
+# Held by every scan and reload, so that two loaders never write the library at once
+scan_lock = threading.Lock()
+
+SCAN_ON_STARTUP = os.environ.get("MUSIC_RITMO_SCAN_ON_STARTUP", "1") == "1"
+SCAN_WORKERS = int(os.environ.get("MUSIC_RITMO_SCAN_WORKERS", "1"))
+SCAN_CHUNK_SIZE = int(os.environ.get("MUSIC_RITMO_SCAN_CHUNK_SIZE", "16"))
+LOAD_BATCH_SIZE = int(os.environ.get("MUSIC_RITMO_LOAD_BATCH_SIZE", "500"))
+SCAN_PENDING_CHUNKS = 2
+SCAN_REPORT_INTERVAL = 1000
+COVER_PREVIEW_CACHE_SIZE = 256
+SUPPORTED_EXTENSIONS = (".mp3", ".flac")
 
 
 class AudioInfo:
@@ -31,16 +59,41 @@ class AudioInfo:
     year: str | None
     cover: bytes
     cover_type: str
+    cover_art_hash: str | None = None
     custom_tags: list[tuple[str, str]]
     bit_rate: int
     bits_per_sample: int
     sample_rate: int
     channels: int
     duration: int
+    file_mtime: int
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, file_mtime: int = 0):
         self.file_path = file_path
         self.file_size = os.path.getsize(file_path)
+        self.file_mtime = file_mtime
+
+
+def get_file_fingerprint(file_path: str) -> tuple[int, int]:
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+cover_previews: dict[str | None, tuple[bytes, str]] = {}
+
+
+def fill_cover(audio_info: AudioInfo, image_bytes: bytes | None) -> None:
+    """
+    Tracks of an album usually embed the same picture, so previews are cached by
+    the hash of the embedded image and resized only once per process.
+    """
+    key = None if image_bytes is None else utils.get_cover_hash(image_bytes)
+    if key not in cover_previews:
+        if len(cover_previews) >= COVER_PREVIEW_CACHE_SIZE:
+            del cover_previews[next(iter(cover_previews))]
+        cover_previews[key] = utils.get_cover_preview(image_bytes)
+    audio_info.cover, audio_info.cover_type = cover_previews[key]
+    audio_info.cover_art_hash = key
 
 
 def extract_metadata_mp3(audio_file: MP3, audio_info: AudioInfo) -> None:
@@ -70,9 +123,7 @@ def extract_metadata_mp3(audio_file: MP3, audio_info: AudioInfo) -> None:
         int(str(audio_file["TRCK"])) if "TRCK" in audio_file.tags else None
     )
     audio_info.year = str(audio_file["TDRC"]) if "TDRC" in audio_file.tags else None
-    audio_info.cover, audio_info.cover_type = utils.get_cover_preview(
-        utils.get_cover_from_audio(audio_file)
-    )
+    fill_cover(audio_info, utils.get_cover_from_audio(audio_file))
     audio_info.custom_tags = utils.get_custom_tags(audio_file)
 
 
@@ -103,174 +154,565 @@ def extract_metadata_flac(audio_file: FLAC, audio_info: AudioInfo) -> None:
         else None
     )
     audio_info.year = str(audio_file["DATE"][0]) if "DATE" in audio_file.tags else None  # type: ignore[operator]
-    audio_info.cover, audio_info.cover_type = utils.get_cover_preview(
-        utils.get_cover_from_audio(audio_file)
-    )
+    fill_cover(audio_info, utils.get_cover_from_audio(audio_file))
     audio_info.custom_tags = utils.get_custom_tags(audio_file)
 
 
-def scan_directory_for_audio_files(dir: str) -> list[AudioInfo]:
-    data = []
+def parse_audio_file(file_path: str, file_mtime: int = 0) -> AudioInfo:
+    audio_info = AudioInfo(file_path, file_mtime)
+
+    audio_file: MP3 | FLAC | None = None
+
+    if file_path.lower().endswith(".mp3"):
+        audio_file = MP3(file_path)
+        extract_metadata_mp3(audio_file, audio_info)
+        audio_info.bits_per_sample = int(
+            audio_file.info.bitrate
+            / (audio_file.info.sample_rate * audio_file.info.channels)
+        )
+
+        logger.info(f"Parsed mp3 file {file_path}")
+    elif file_path.lower().endswith(".flac"):
+        audio_file = FLAC(file_path)
+        extract_metadata_flac(audio_file, audio_info)
+        audio_info.bits_per_sample = audio_file.info.bits_per_sample
+
+        logger.info(f"Parsed flac file {file_path}")
+    else:
+        raise Exception("Unsupported file")
+
+    audio_info.bit_rate = audio_file.info.bitrate
+    audio_info.sample_rate = audio_file.info.sample_rate
+    audio_info.channels = audio_file.info.channels
+    audio_info.duration = audio_file.info.length
+
+    return audio_info
+
+
+def try_parse_audio_file(file: tuple[str, int]) -> AudioInfo | None:
+    file_path, file_mtime = file
+    try:
+        return parse_audio_file(file_path, file_mtime)
+    except Exception as e:
+        logger.warning(f"Error while parsing file {file_path}: {e}")
+        return None
+
 
+def try_parse_audio_files(files: list[tuple[str, int]]) -> list[AudioInfo]:
+    return [
+        audio_info
+        for audio_info in map(try_parse_audio_file, files)
+        if audio_info is not None
+    ]
+
+
+def find_audio_files(
+    dir: str, known_files: dict[str, tuple[int, int]] | None = None
+) -> Iterator[tuple[str, int]]:
+    """
+    Yields (path, mtime) of the files to parse. Found files are popped from
+    `known_files`, which then holds only deleted ones.
+    """
     for root, _, files in os.walk(dir):
         for file in files:
+            if not file.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+
             file_path = os.path.join(root, file)
             try:
-                audio_info = AudioInfo(file_path)
+                fingerprint = get_file_fingerprint(file_path)
+            except OSError as e:
+                logger.warning(f"Error while reading file {file_path}: {e}")
+                continue
 
-                audio_file: MP3 | FLAC | None = None
+            if (
+                known_files is not None
+                and known_files.pop(file_path, None) == fingerprint
+            ):
+                continue
+
+            yield file_path, fingerprint[1]
 
-                if file.lower().endswith(".mp3"):
-                    audio_file = MP3(file_path)
-                    extract_metadata_mp3(audio_file, audio_info)
-                    audio_info.bits_per_sample = int(
-                        audio_file.info.bitrate
-                        / (audio_file.info.sample_rate * audio_file.info.channels)
-                    )
 
-                    logger.info(f"Parsed mp3 file {file_path}")
-                elif file.lower().endswith(".flac"):
-                    audio_file = FLAC(file_path)
-                    extract_metadata_flac(audio_file, audio_info)
-                    audio_info.bits_per_sample = audio_file.info.bits_per_sample
+def chunked(
+    files: Iterable[tuple[str, int]], size: int
+) -> Iterator[list[tuple[str, int]]]:
+    iterator = iter(files)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
 
-                    logger.info(f"Parsed flac file {file_path}")
-                else:
-                    raise Exception("Unsupported file")
 
-                audio_info.bit_rate = audio_file.info.bitrate
-                audio_info.sample_rate = audio_file.info.sample_rate
-                audio_info.channels = audio_file.info.channels
-                audio_info.duration = audio_file.info.length
+def parse_audio_files(
+    files: Iterable[tuple[str, int]],
+    workers: int = SCAN_WORKERS,
+    chunk_size: int = SCAN_CHUNK_SIZE,
+) -> Iterator[AudioInfo]:
+    """
+    Yields parsed files in completion order, with at most SCAN_PENDING_CHUNKS
+    chunks per worker in flight.
+    """
+    if workers <= 1:
+        for file in files:
+            audio_info = try_parse_audio_file(file)
+            if audio_info is not None:
+                yield audio_info
+        return
 
-                data.append(audio_info)
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        pending: set[Future[list[AudioInfo]]] = set()
+        for chunk in chunked(files, max(chunk_size, 1)):
+            if len(pending) >= workers * SCAN_PENDING_CHUNKS:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            pending.add(executor.submit(try_parse_audio_files, chunk))
 
-            except Exception as e:
-                logger.warning(f"Error while parsing file {file_path}: {e}")
+        for future in as_completed(pending):
+            yield from future.result()
 
-    return data
 
+def scan_directory_for_audio_files(
+    dir: str,
+    known_files: dict[str, tuple[int, int]] | None = None,
+    workers: int = SCAN_WORKERS,
+    chunk_size: int = SCAN_CHUNK_SIZE,
+) -> Iterator[AudioInfo]:
+    return parse_audio_files(find_audio_files(dir, known_files), workers, chunk_size)
 
-def load_audio_data(audio_info: AudioInfo, session: Session) -> None:
-    artists = []
-    for name in audio_info.artists:
-        artist = session.exec(
-            select(db.Artist).where(db.Artist.name == name)
-        ).one_or_none()
-        if artist is None:
-            artist = db.Artist(name=name)
-            session.add(artist)
-            session.commit()
-            session.refresh(artist)
-        artists.append(artist)
-
-    album_artists = []
-    album_artist_id: int | None = None
-    if (
-        audio_info.album_artist is not None
-        and audio_info.album_artist != "Various Artists"
+
+class LibraryLoader:
+    """Single writer for scanned files, committing every `batch_size` files."""
+
+    def __init__(
+        self,
+        session: Session,
+        batch_size: int = LOAD_BATCH_SIZE,
+        preload: bool = False,
+        checkpoint_id: int | None = None,
+        created: dict[str, int] | None = None,
     ):
-        album_artist = session.exec(
-            select(db.Artist).where(db.Artist.name == audio_info.album_artist)
-        ).one_or_none()
-        if album_artist is None:
-            album_artist = db.Artist(name=audio_info.album_artist)
-            session.add(album_artist)
-            session.commit()
-            session.refresh(album_artist)
-        album_artist_id = album_artist.id
-        album_artists = [album_artist]
-    else:
-        album_artists = artists
-
-    album = session.exec(
-        select(db.Album).where(db.Album.name == audio_info.album)
-    ).one_or_none()
-    if album is None:
-        album = db.Album(
-            name=audio_info.album,
-            album_artist_id=album_artist_id,
-            total_tracks=0,
-            year=audio_info.year,
-            cover=audio_info.cover,
-            artists=album_artists,
+        self.session = session
+        self.connection = session.connection()
+        self.batch_size = batch_size
+        self.preloaded = preload
+        self.checkpoint_id = checkpoint_id
+        self.pending_files: list[AudioInfo] = []
+        # Times files were first added, kept from before a full rescan
+        self.created = created or {}
+
+        self.artist_ids: dict[str, int] = {}
+        self.album_ids: dict[str, int] = {}
+        self.album_artist_ids: dict[int, int | None] = {}
+        self.album_links: set[tuple[int, int]] = set()
+        self.genre_ids: dict[str, int] = {}
+        self.custom_tag_ids: dict[tuple[str, str], int] = {}
+        self.cover_ids: set[str] = set()
+        self.tracks: dict[str, tuple[int, int | None]] = {}
+
+        self.artist_tracks: list[dict[str, int]] = []
+        self.genre_tracks: list[dict[str, int]] = []
+        self.custom_tag_tracks: list[dict[str, int]] = []
+        self.artist_albums: list[dict[str, int]] = []
+        self.album_track_counts: Counter[int] = Counter()
+        self.album_created: dict[int, int] = {}
+        self.changed_albums: set[int] = set()
+        # Set when a track already in the library is rewritten, which may leave
+        # its old album, artists or genres without tracks
+        self.retagged = False
+
+        if preload:
+            self.preload()
+
+    def preload(self) -> None:
+        for id, name in self.session.exec(select(db.Artist.id, db.Artist.name)):
+            self.artist_ids[name] = id
+        for id, name, album_artist_id in self.session.exec(
+            select(db.Album.id, db.Album.name, db.Album.album_artist_id)
+        ):
+            self.album_ids[name] = id
+            self.album_artist_ids[id] = album_artist_id
+        for artist_id, album_id in self.session.exec(
+            select(db.ArtistAlbum.artist_id, db.ArtistAlbum.album_id)
+        ):
+            self.album_links.add((artist_id, album_id))
+        for id, name in self.session.exec(select(db.Genre.id, db.Genre.name)):
+            self.genre_ids[name] = id
+        for id, name, value in self.session.exec(
+            select(db.CustomTag.id, db.CustomTag.name, db.CustomTag.value)
+        ):
+            self.custom_tag_ids[(name, value)] = id
+        self.cover_ids.update(self.session.exec(select(db.Cover.id)))
+        for track_id, file_path, track_album_id in self.session.exec(
+            select(db.Track.id, db.Track.file_path, db.Track.album_id)
+        ):
+            self.tracks[file_path] = (track_id, track_album_id)
+
+    def insert(self, model: type[SQLModel], **values: Any) -> int:
+        result = self.connection.execute(insert(model), values)
+        assert result.lastrowid is not None
+        return int(result.lastrowid)
+
+    def get_artist_id(self, name: str) -> int:
+        if name not in self.artist_ids:
+            artist_id = None
+            if not self.preloaded:
+                artist_id = self.session.exec(
+                    select(db.Artist.id).where(db.Artist.name == name)
+                ).first()
+            if artist_id is None:
+                artist_id = self.insert(db.Artist, name=name)
+            self.artist_ids[name] = artist_id
+        return self.artist_ids[name]
+
+    def get_genre_id(self, name: str) -> int:
+        if name not in self.genre_ids:
+            genre_id = None
+            if not self.preloaded:
+                genre_id = self.session.exec(
+                    select(db.Genre.id).where(db.Genre.name == name)
+                ).first()
+            if genre_id is None:
+                genre_id = self.insert(db.Genre, name=name)
+            self.genre_ids[name] = genre_id
+        return self.genre_ids[name]
+
+    def get_custom_tag_id(self, name: str, value: str) -> int:
+        if (name, value) not in self.custom_tag_ids:
+            tag_id = None
+            if not self.preloaded:
+                tag_id = self.session.exec(
+                    select(db.CustomTag.id)
+                    .where(db.CustomTag.name == name)
+                    .where(db.CustomTag.value == value)
+                ).first()
+            if tag_id is None:
+                tag_id = self.insert(
+                    db.CustomTag, name=name, value=value, updated=False
+                )
+            self.custom_tag_ids[(name, value)] = tag_id
+        return self.custom_tag_ids[(name, value)]
+
+    def get_cover_id(self, data: bytes, type: str) -> str:
+        cover_id = utils.get_cover_hash(data)
+        if cover_id not in self.cover_ids:
+            if (
+                self.preloaded
+                or self.session.exec(
+                    select(db.Cover.id).where(db.Cover.id == cover_id)
+                ).first()
+                is None
+            ):
+                self.connection.execute(
+                    insert(db.Cover), {"id": cover_id, "data": data, "type": type}
+                )
+            self.cover_ids.add(cover_id)
+        return cover_id
+
+    def find_album(self, name: str) -> int | None:
+        if name not in self.album_ids and not self.preloaded:
+            album = self.session.exec(
+                select(db.Album.id, db.Album.album_artist_id).where(
+                    db.Album.name == name
+                )
+            ).first()
+            if album is not None:
+                album_id, album_artist_id = album
+                self.album_ids[name] = album_id
+                self.album_artist_ids[album_id] = album_artist_id
+                for artist_id in self.session.exec(
+                    select(db.ArtistAlbum.artist_id).where(
+                        db.ArtistAlbum.album_id == album_id
+                    )
+                ):
+                    self.album_links.add((artist_id, album_id))
+        return self.album_ids.get(name)
+
+    def link_album_artists(self, album_id: int, artist_ids: list[int]) -> None:
+        for artist_id in artist_ids:
+            if (artist_id, album_id) not in self.album_links:
+                self.album_links.add((artist_id, album_id))
+                self.artist_albums.append(
+                    {"artist_id": artist_id, "album_id": album_id}
+                )
+
+    def get_album_id(
+        self,
+        audio_info: AudioInfo,
+        album_artist_id: int | None,
+        album_artist_ids: list[int],
+        artist_ids: list[int],
+        cover_id: str,
+        created: int,
+    ) -> int:
+        album_id = self.find_album(audio_info.album)
+        if album_id is None:
+            album_id = self.insert(
+                db.Album,
+                name=audio_info.album,
+                album_artist_id=album_artist_id,
+                total_tracks=0,
+                year=audio_info.year,
+                cover_id=cover_id,
+                play_count=0,
+                created=created,
+            )
+            self.album_ids[audio_info.album] = album_id
+            self.album_artist_ids[album_id] = album_artist_id
+            self.link_album_artists(album_id, album_artist_ids)
+        elif (
+            album_artist_id is not None
+            and self.album_artist_ids[album_id] != album_artist_id
+        ):
+            self.connection.execute(
+                update(db.Album)
+                .where(col(db.Album.id) == album_id)
+                .values(album_artist_id=album_artist_id)
+            )
+            self.album_artist_ids[album_id] = album_artist_id
+        elif self.album_artist_ids[album_id] is None:
+            self.link_album_artists(album_id, artist_ids)
+        return album_id
+
+    def find_track(self, file_path: str) -> tuple[int, int | None] | None:
+        if file_path not in self.tracks and not self.preloaded:
+            track = self.session.exec(
+                select(db.Track.id, db.Track.album_id).where(
+                    db.Track.file_path == file_path
+                )
+            ).first()
+            if track is not None:
+                self.tracks[file_path] = (track[0], track[1])
+        return self.tracks.get(file_path)
+
+    def load(self, audio_info: AudioInfo) -> None:
+        self.pending_files.append(audio_info)
+        if len(self.pending_files) >= self.batch_size:
+            self.commit()
+
+    def write(self, audio_info: AudioInfo) -> None:
+        artist_ids = list(dict.fromkeys(map(self.get_artist_id, audio_info.artists)))
+
+        album_artist_id: int | None = None
+        album_artist_ids = artist_ids
+        if (
+            audio_info.album_artist is not None
+            and audio_info.album_artist != "Various Artists"
+        ):
+            album_artist_id = self.get_artist_id(audio_info.album_artist)
+            album_artist_ids = [album_artist_id]
+
+        cover_id = self.get_cover_id(audio_info.cover, audio_info.cover_type)
+        created = self.created.get(audio_info.file_path) or db.current_timestamp()
+        album_id = self.get_album_id(
+            audio_info,
+            album_artist_id,
+            album_artist_ids,
+            artist_ids,
+            cover_id,
+            created,
+        )
+        genre_ids = list(dict.fromkeys(map(self.get_genre_id, audio_info.genres)))
+        custom_tag_ids = list(
+            dict.fromkeys(
+                self.get_custom_tag_id(name, value)
+                for name, value in audio_info.custom_tags
+            )
         )
-        session.add(album)
-        session.commit()
-        session.refresh(album)
-    elif album.album_artist_id is None:
-        if album_artist_id is not None:
-            album.album_artist_id = album_artist_id
+
+        values = {
+            "file_size": audio_info.file_size,
+            "file_mtime": audio_info.file_mtime,
+            "type": audio_info.type,
+            "title": audio_info.title,
+            "album_id": album_id,
+            "album_artist_id": album_artist_id,
+            "album_position": audio_info.track_number,
+            "year": audio_info.year,
+            "cover_id": cover_id,
+            "cover_art_hash": audio_info.cover_art_hash,
+            "bit_rate": audio_info.bit_rate,
+            "bits_per_sample": audio_info.bits_per_sample,
+            "sample_rate": audio_info.sample_rate,
+            "channels": audio_info.channels,
+            "duration": audio_info.duration,
+        }
+
+        track = self.find_track(audio_info.file_path)
+        if track is None:
+            track_id = self.insert(
+                db.Track,
+                file_path=audio_info.file_path,
+                plays_count=0,
+                created=created,
+                **values,
+            )
+            self.album_track_counts[album_id] += 1
+            # An album was added when its oldest track was
+            self.album_created[album_id] = min(
+                created, self.album_created.get(album_id, created)
+            )
         else:
-            album.artists = list(set(album.artists).union(artists))
-    elif album_artist_id is not None and album.album_artist_id != album_artist_id:
-        album.album_artist_id = album_artist_id
-
-    genres = []
-    for name in audio_info.genres:
-        genre = session.exec(
-            select(db.Genre).where(db.Genre.name == name)
-        ).one_or_none()
-        if genre is None:
-            genre = db.Genre(name=name)
-            session.add(genre)
-            session.commit()
-            session.refresh(genre)
-        genres.append(genre)
-
-    custom_tags: list[db.CustomTag] = []
-    for name, value in audio_info.custom_tags:
-        tag = session.exec(
-            select(db.CustomTag)
-            .where(db.CustomTag.name == name)
-            .where(db.CustomTag.value == value)
-        ).one_or_none()
-        if tag is None:
-            tag = db.CustomTag(name=name, value=value, updated=False)
-            session.add(tag)
-            session.commit()
-            session.refresh(tag)
-        custom_tags.append(tag)
-
-    track = session.exec(
-        select(db.Track).where(db.Track.file_path == audio_info.file_path)
-    ).one_or_none()
-    if track is None:
-        track = db.Track(
-            file_path=audio_info.file_path,
-            file_size=audio_info.file_size,
-            type=audio_info.type,
-            title=audio_info.title,
-            album_id=album.id,
-            album_artist_id=album_artist_id,
-            album_position=audio_info.track_number,
-            year=audio_info.year,
-            plays_count=0,
-            cover=audio_info.cover,
-            cover_type=audio_info.cover_type,
-            bit_rate=audio_info.bit_rate,
-            bits_per_sample=audio_info.bits_per_sample,
-            sample_rate=audio_info.sample_rate,
-            channels=audio_info.channels,
-            duration=audio_info.duration,
-            genres=genres,
-            artists=artists,
-            custom_tags=custom_tags,
+            track_id, old_album_id = track
+            self.retagged = True
+            self.flush_links()
+            self.connection.execute(
+                update(db.Track).where(col(db.Track.id) == track_id).values(**values)
+            )
+            self.connection.execute(
+                delete(db.ArtistTrack).where(col(db.ArtistTrack.track_id) == track_id)
+            )
+            self.connection.execute(
+                delete(db.GenreTrack).where(col(db.GenreTrack.track_id) == track_id)
+            )
+            self.connection.execute(
+                delete(db.CustomTagTrack).where(
+                    col(db.CustomTagTrack.track_id) == track_id
+                )
+            )
+            if old_album_id != album_id:
+                if old_album_id is not None:
+                    self.album_track_counts[old_album_id] -= 1
+                self.album_track_counts[album_id] += 1
+        self.tracks[audio_info.file_path] = (track_id, album_id)
+        self.changed_albums.add(album_id)
+        if track is not None and track[1] is not None:
+            self.changed_albums.add(track[1])
+
+        self.artist_tracks.extend(
+            {"artist_id": artist_id, "track_id": track_id} for artist_id in artist_ids
         )
-        album.total_tracks = album.total_tracks + 1
-    else:
-        track.title = audio_info.title
-        track.artists = artists
-        track.album_id = album.id
-        track.album_artist_id = album_artist_id
-        track.album_position = audio_info.track_number
-        track.year = audio_info.year
-        track.genres = genres
-        track.custom_tags = custom_tags
-
-    session.add(track)
-    session.commit()
-    session.refresh(track)
+        self.genre_tracks.extend(
+            {"genre_id": genre_id, "track_id": track_id} for genre_id in genre_ids
+        )
+        self.custom_tag_tracks.extend(
+            {"custom_tag_id": tag_id, "track_id": track_id} for tag_id in custom_tag_ids
+        )
+
+    def flush_links(self) -> None:
+        links: list[tuple[type[SQLModel], list[dict[str, int]]]] = [
+            (db.ArtistTrack, self.artist_tracks),
+            (db.GenreTrack, self.genre_tracks),
+            (db.CustomTagTrack, self.custom_tag_tracks),
+            (db.ArtistAlbum, self.artist_albums),
+        ]
+        for model, rows in links:
+            if rows:
+                self.connection.execute(insert(model), rows)
+                rows.clear()
+
+        if self.album_track_counts:
+            self.connection.execute(
+                update(db.Album)
+                .where(col(db.Album.id) == bindparam("album"))
+                .values(total_tracks=db.Album.total_tracks + bindparam("delta")),
+                [
+                    {"album": album_id, "delta": delta}
+                    for album_id, delta in self.album_track_counts.items()
+                    if delta != 0
+                ],
+            )
+            self.album_track_counts.clear()
+
+        if self.album_created:
+            self.connection.execute(
+                update(db.Album)
+                .where(col(db.Album.id) == bindparam("album"))
+                .values(created=func.min(db.Album.created, bindparam("created"))),
+                [
+                    {"album": album_id, "created": created}
+                    for album_id, created in self.album_created.items()
+                ],
+            )
+            self.album_created.clear()
+
+    def commit(self) -> None:
+        for audio_info in self.pending_files:
+            self.write(audio_info)
+        self.flush_links()
+        if self.changed_albums:
+            update_artist_sort_names(self.connection, self.changed_albums)
+            self.changed_albums.clear()
+        if self.checkpoint_id is not None and self.pending_files:
+            self.connection.execute(
+                update(db.ScanCheckpoint)
+                .where(col(db.ScanCheckpoint.id) == self.checkpoint_id)
+                .values(
+                    loaded_files=db.ScanCheckpoint.loaded_files
+                    + len(self.pending_files),
+                    last_file_path=self.pending_files[-1].file_path,
+                )
+            )
+        self.session.commit()
+        self.connection = self.session.connection()
+        self.pending_files.clear()
+
+
+def update_artist_sort_names(
+    connection: Connection, album_ids: Iterable[int] | None = None
+) -> None:
+    """
+    Sets Album.artist_sort_name to the album artist of the first track of the
+    album, or to the first artist of that track if it has no album artist.
+    """
+    album_track = aliased(db.Track)
+    first_track = (
+        select(album_track.id)
+        .where(album_track.album_id == db.Album.id)
+        .order_by(col(album_track.album_position), col(album_track.id))
+        .limit(1)
+        .correlate(db.Album)
+        .scalar_subquery()
+    )
+    album_artist = (
+        select(db.Artist.name)
+        .join(db.Track, col(db.Track.album_artist_id) == db.Artist.id)
+        .where(db.Track.id == first_track)
+        .correlate(db.Album)
+        .scalar_subquery()
+    )
+    track_artist = (
+        select(db.Artist.name)
+        .join(db.ArtistTrack, col(db.ArtistTrack.artist_id) == db.Artist.id)
+        .where(db.ArtistTrack.track_id == first_track)
+        .limit(1)
+        .correlate(db.Album)
+        .scalar_subquery()
+    )
+    statement = update(db.Album).values(
+        artist_sort_name=func.coalesce(album_artist, track_artist, "")
+    )
+    if album_ids is not None:
+        statement = statement.where(col(db.Album.id).in_(list(album_ids)))
+    connection.execute(statement)
+
+
+def load_audio_data(audio_info: AudioInfo, session: Session) -> None:
+    loader = LibraryLoader(session)
+    loader.load(audio_info)
+    loader.commit()
+
+
+def find_favourite_ids(
+    session: Session,
+    key_column: Any,
+    id_column: Any,
+    favourites: list[Any],
+    user_id: int,
+) -> list[tuple[int, str]]:
+    """
+    Returns the ids and dates of the saved favourites that are still in the
+    library. Favourites without a match are logged and skipped.
+    """
+    found: dict[int, str] = {}
+    for key, added_at in favourites:
+        id = session.exec(select(id_column).where(key_column == key)).first()
+        if id is None:
+            logger.warning(f"Favourite {key} of user {user_id} is no longer found")
+        else:
+            found.setdefault(id, added_at)
+    return list(found.items())
 
 
 def load_starred_data(starred_data: list[Any], session: Session) -> None:
@@ -281,65 +723,367 @@ def load_starred_data(starred_data: list[Any], session: Session) -> None:
         starred_albums,
         starred_playlists,
     ) in starred_data:
-        for title, added_at in starred_tracks:
-            track = session.exec(
-                select(db.Track).where(db.Track.title == title)
-            ).one_or_none()
-            if track is not None:
-                session.add(
-                    db.FavouriteTrack(
-                        user_id=user_id, track_id=track.id, added_at=added_at
-                    )
-                )
+        for track_id, added_at in find_favourite_ids(
+            session, db.Track.file_path, db.Track.id, starred_tracks, user_id
+        ):
+            session.add(
+                db.FavouriteTrack(user_id=user_id, track_id=track_id, added_at=added_at)
+            )
 
-        for name, added_at in starred_artists:
-            artist = session.exec(
-                select(db.Artist).where(db.Artist.name == name)
-            ).one_or_none()
-            if artist is not None:
-                session.add(
-                    db.FavouriteArtist(
-                        user_id=user_id, artist_id=artist.id, added_at=added_at
-                    )
+        for artist_id, added_at in find_favourite_ids(
+            session, db.Artist.name, db.Artist.id, starred_artists, user_id
+        ):
+            session.add(
+                db.FavouriteArtist(
+                    user_id=user_id, artist_id=artist_id, added_at=added_at
                 )
+            )
 
-        for name, added_at in starred_albums:
-            album = session.exec(
-                select(db.Album).where(db.Album.name == name)
-            ).one_or_none()
-            if album is not None:
-                session.add(
-                    db.FavouriteAlbum(
-                        user_id=user_id, album_id=album.id, added_at=added_at
-                    )
+        for album_id, added_at in find_favourite_ids(
+            session, db.Album.name, db.Album.id, starred_albums, user_id
+        ):
+            session.add(
+                db.FavouriteAlbum(user_id=user_id, album_id=album_id, added_at=added_at)
+            )
+
+        for playlist_id, added_at in find_favourite_ids(
+            session, db.Playlist.name, db.Playlist.id, starred_playlists, user_id
+        ):
+            session.add(
+                db.FavouritePlaylist(
+                    user_id=user_id, playlist_id=playlist_id, added_at=added_at
                 )
+            )
+
+    session.commit()
+
+
+def get_known_files(session: Session) -> dict[str, tuple[int, int]]:
+    return {
+        file_path: (file_size, file_mtime)
+        for file_path, file_size, file_mtime in session.exec(
+            select(db.Track.file_path, db.Track.file_size, db.Track.file_mtime)
+        ).all()
+    }
+
+
+def delete_track(track: db.Track, session: Session) -> None:
+    for playlist_track in list(track.track_playlists):
+        playlist = playlist_track.playlist
+        playlist.playlist_tracks.remove(playlist_track)
+        track.track_playlists.remove(playlist_track)
+        playlist.total_tracks = max(playlist.total_tracks - 1, 0)
+    for track_favourite in list(track.track_favourites):
+        track.track_favourites.remove(track_favourite)
+        session.delete(track_favourite)
+
+    track.artists = []
+    track.genres = []
+    track.custom_tags = []
+    if track.album is not None:
+        track.album.total_tracks = max(track.album.total_tracks - 1, 0)
+
+    session.delete(track)
+
+
+def delete_orphans(session: Session) -> None:
+    for album in session.exec(
+        select(db.Album).where(
+            ~select(db.Track.id).where(db.Track.album_id == db.Album.id).exists()
+        )
+    ).all():
+        for album_favourite in list(album.album_favourites):
+            session.delete(album_favourite)
+        album.artists = []
+        session.delete(album)
+    session.flush()
+
+    for artist in session.exec(
+        select(db.Artist)
+        .where(
+            ~select(db.ArtistTrack.track_id)
+            .where(db.ArtistTrack.artist_id == db.Artist.id)
+            .exists()
+        )
+        .where(
+            ~select(db.ArtistAlbum.album_id)
+            .where(db.ArtistAlbum.artist_id == db.Artist.id)
+            .exists()
+        )
+        .where(
+            ~select(db.Track.id)
+            .where(db.Track.album_artist_id == db.Artist.id)
+            .exists()
+        )
+        .where(
+            ~select(db.Album.id)
+            .where(db.Album.album_artist_id == db.Artist.id)
+            .exists()
+        )
+    ).all():
+        for artist_favourite in list(artist.artist_favourites):
+            session.delete(artist_favourite)
+        session.delete(artist)
+
+    for genre in session.exec(
+        select(db.Genre).where(
+            ~select(db.GenreTrack.track_id)
+            .where(db.GenreTrack.genre_id == db.Genre.id)
+            .exists()
+        )
+    ).all():
+        session.delete(genre)
+
+    for tag in session.exec(
+        select(db.CustomTag).where(
+            ~select(db.CustomTagTrack.track_id)
+            .where(db.CustomTagTrack.custom_tag_id == db.CustomTag.id)
+            .exists()
+        )
+    ).all():
+        session.delete(tag)
+
+    session.flush()
+    session.connection().execute(
+        delete(db.Cover)
+        .where(~select(db.Track.id).where(db.Track.cover_id == db.Cover.id).exists())
+        .where(~select(db.Album.id).where(db.Album.cover_id == db.Cover.id).exists())
+    )
+
 
-        for name, added_at in starred_playlists:
-            playlist = session.exec(
-                select(db.Playlist).where(db.Playlist.name == name)
-            ).one_or_none()
-            if playlist is not None:
-                session.add(
-                    db.FavouritePlaylist(
-                        user_id=user_id, playlist_id=playlist.id, added_at=added_at
+def remove_missing_tracks(file_paths: list[str], session: Session) -> None:
+    album_ids: set[int] = set()
+    for file_path in file_paths:
+        track = session.exec(
+            select(db.Track).where(db.Track.file_path == file_path)
+        ).one_or_none()
+        if track is not None:
+            if track.album_id is not None:
+                album_ids.add(track.album_id)
+            delete_track(track, session)
+            logger.info(f"Removed track of deleted file {file_path}")
+    session.flush()
+
+    delete_orphans(session)
+    if album_ids:
+        update_artist_sort_names(session.connection(), album_ids)
+    session.commit()
+
+
+def reload_files(changed_paths: Iterable[str], removed_paths: Iterable[str]) -> None:
+    """
+    Applies filesystem changes without a full rescan. Paths may point to files
+    or to whole directories (e.g. an album folder moved in or out of the library).
+    Waits for a running scan to finish.
+    """
+    with scan_lock, Session(db.engine) as session:
+        removed_files: list[str] = []
+        for path in removed_paths:
+            removed_files.extend(
+                session.exec(
+                    select(db.Track.file_path).where(
+                        or_(
+                            col(db.Track.file_path) == path,
+                            col(db.Track.file_path).startswith(
+                                os.path.join(path, ""), autoescape=True
+                            ),
+                        )
                     )
-                )
+                ).all()
+            )
+        if removed_files:
+            remove_missing_tracks(removed_files, session)
+
+        loader = LibraryLoader(session)
+        for path in changed_paths:
+            if os.path.isdir(path):
+                files: Iterable[tuple[str, int]] = find_audio_files(path)
+            elif os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS):
+                files = [(path, get_file_fingerprint(path)[1])]
+            else:
+                continue
+
+            for file in files:
+                audio_info = try_parse_audio_file(file)
+                if audio_info is not None:
+                    loader.load(audio_info)
+        loader.commit()
+        if loader.retagged:
+            delete_orphans(session)
+            session.commit()
+        fuzzy_index.rebuild(session)
+
 
+def reload_track(file_path: str, session: Session) -> None:
+    """
+    Reloads a file whose tags were edited. The caller holds `scan_lock`, so the
+    loader cannot race a scan over new artists or genres.
+    """
+    _, file_mtime = get_file_fingerprint(file_path)
+    load_audio_data(parse_audio_file(file_path, file_mtime), session)
+    delete_orphans(session)
     session.commit()
+    fuzzy_index.rebuild(session)
+
+
+def log_scan_rate(loaded: int, started_at: float) -> None:
+    elapsed = max(time.monotonic() - started_at, 1e-6)
+    logger.info(
+        f"Loaded {loaded} files in {elapsed:.1f}s ({loaded / elapsed:.1f} files/sec)"
+    )
+
+
+def begin_scan(
+    directory_path: str,
+    session: Session,
+    starred_data: list[Any] | None = None,
+    fresh: bool = False,
+    created_data: dict[str, int] | None = None,
+) -> tuple[db.ScanCheckpoint, bool]:
+    """
+    Returns the checkpoint of an unfinished scan of the directory, or creates a new
+    one. The second value tells whether an earlier scan is being resumed, which is
+    never the case for a `fresh` scan of cleared tables.
+    """
+    checkpoint = session.exec(
+        select(db.ScanCheckpoint).where(db.ScanCheckpoint.directory == directory_path)
+    ).first()
+    resumed = checkpoint is not None and not fresh
+    if checkpoint is None:
+        checkpoint = db.ScanCheckpoint(
+            directory=directory_path, started_at=str(datetime.now())
+        )
+    elif fresh:
+        checkpoint.loaded_files = 0
+        checkpoint.last_file_path = None
+    if starred_data is not None and checkpoint.starred_data is None:
+        checkpoint.starred_data = json.dumps(starred_data, default=str)
+    if created_data is not None and checkpoint.created_data is None:
+        checkpoint.created_data = json.dumps(created_data)
+    session.add(checkpoint)
+    session.commit()
+    session.refresh(checkpoint)
+    return checkpoint, resumed
 
 
 def scan_and_load(
     directory_path: str = "./tracks/",
     starred_data: list[Any] | None = None,
+    incremental: bool = False,
+    workers: int = SCAN_WORKERS,
+    chunk_size: int = SCAN_CHUNK_SIZE,
 ) -> None:
-    audio_files = scan_directory_for_audio_files(directory_path)
+    with scan_lock:
+        load_directory(directory_path, starred_data, incremental, workers, chunk_size)
 
+
+def load_directory(
+    directory_path: str,
+    starred_data: list[Any] | None = None,
+    incremental: bool = False,
+    workers: int = SCAN_WORKERS,
+    chunk_size: int = SCAN_CHUNK_SIZE,
+    fresh: bool = False,
+) -> None:
+    """Body of `scan_and_load`, for callers that already hold `scan_lock`."""
     with Session(db.engine) as session:
-        for file in audio_files:
-            load_audio_data(file, session)
+        checkpoint, resumed = begin_scan(directory_path, session, starred_data, fresh)
+        if resumed:
+            # Files committed before the interruption are in Tracks with their
+            # fingerprints, so the incremental walk skips them
+            logger.info(
+                f"Resuming scan of {directory_path} after "
+                f"{checkpoint.loaded_files} loaded files"
+            )
+            incremental = True
+            scanStatus["count"] = checkpoint.loaded_files
+
+        known_files = get_known_files(session) if incremental else None
+        files = find_audio_files(directory_path, known_files)
+        logger.info(f"Scanning {directory_path} with {workers} worker(s)")
+
+        created = None
+        if checkpoint.created_data is not None:
+            created = json.loads(checkpoint.created_data)
+        loader = LibraryLoader(
+            session, preload=True, checkpoint_id=checkpoint.id, created=created
+        )
+        loaded = 0
+        started_at = time.monotonic()
+        for audio_info in parse_audio_files(files, workers, chunk_size):
+            loader.load(audio_info)
             scanStatus["count"] = scanStatus["count"] + 1
 
-        if starred_data is not None:
-            load_starred_data(starred_data, session)
+            loaded += 1
+            if loaded % SCAN_REPORT_INTERVAL == 0:
+                log_scan_rate(loaded, started_at)
+        loader.commit()
+        log_scan_rate(loaded, started_at)
+
+        if known_files or loader.retagged:
+            remove_missing_tracks(list(known_files or []), session)
+
+        # Deleted in the same transaction as the restored favourites, so they are
+        # never restored twice
+        saved_starred_data = checkpoint.starred_data
+        session.delete(checkpoint)
+        if saved_starred_data is not None:
+            load_starred_data(json.loads(saved_starred_data), session)
+        else:
+            session.commit()
+        fuzzy_index.rebuild(session)
 
     scanStatus["scanning"] = False
+
+
+def full_scan(directory_path: str = "./tracks/") -> None:
+    """Clears the library and scans it again, keeping users' favourites."""
+    with scan_lock:
+        reload_directory(directory_path)
+
+
+def reload_directory(directory_path: str) -> None:
+    """Body of `full_scan`, for callers that already hold `scan_lock`."""
+    with Session(db.engine) as session:
+        starred_data = utils.get_user_starred_data(session)
+        created_data = dict(
+            session.exec(select(db.Track.file_path, db.Track.created)).all()
+        )
+        # Favourites and the times tracks were added are kept in the checkpoint
+        # before the tables are cleared
+        begin_scan(
+            directory_path, session, starred_data, fresh=True, created_data=created_data
+        )
+        utils.clear_tables(session)
+    load_directory(directory_path, fresh=True)
+
+
+def start_background_scan(
+    directory_path: str = "./tracks/", full: bool = False
+) -> bool:
+    """
+    Starts a scan in a background thread, incremental unless `full`. Returns
+    False without starting one if a scan or reload is already running.
+    """
+    if not scan_lock.acquire(blocking=False):
+        return False
+    scanStatus["scanning"] = True
+    scanStatus["count"] = 0
+    threading.Thread(
+        target=run_background_scan, args=(directory_path, full), daemon=True
+    ).start()
+    return True
+
+
+def run_background_scan(directory_path: str, full: bool) -> None:
+    # scan_lock was acquired by start_background_scan for this thread
+    try:
+        if full:
+            reload_directory(directory_path)
+        else:
+            load_directory(directory_path, incremental=True)
+    except Exception as e:
+        logger.error(f"Scan of {directory_path} failed: {e}")
+    finally:
+        scanStatus["scanning"] = False
+        scan_lock.release()
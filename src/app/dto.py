@@ -47,6 +47,7 @@ class Track:
     path: str | None = None
     play_count: int = 0
     created: datetime | None = None
+    played: datetime | None = None
     starred: datetime | None = None
     bpm: int | None = None
     comment: str | None = None
@@ -65,6 +66,7 @@ class Album:
     artist_id: int | None = None
     cover_art_id: int | None = None
     play_count: int | None = None
+    played: datetime | None = None
     starred: datetime | None = None
     year: int | None = None
     genre: str | None = None
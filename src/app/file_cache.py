@@ -0,0 +1,111 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO
+
+
+class FileCache:
+    """
+    LRU cache of files in a directory, bounded by `max_bytes`. Files handed out
+    in the last `min_age` seconds are not evicted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, min_age: float = 10):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.lock = threading.Lock()
+        self.files: OrderedDict[str, tuple[str, int]] | None = None
+        self.used_at: dict[str, float] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def load_index(self) -> OrderedDict[str, tuple[str, int]]:
+        if self.files is None:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, entry.name, stat.st_size))
+
+            self.files = OrderedDict()
+            for _, name, size in sorted(entries):
+                self.files[os.path.splitext(name)[0]] = (name, size)
+                self.total_bytes += size
+        return self.files
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            files = self.load_index()
+            if key in files:
+                path = os.path.join(self.directory, files[key][0])
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    self.total_bytes -= files.pop(key)[1]
+                    self.used_at.pop(key, None)
+                else:
+                    files.move_to_end(key)
+                    self.used_at[key] = time.monotonic()
+                    self.hits += 1
+                    return path
+            self.misses += 1
+            return None
+
+    def create_temp_file(self) -> tuple[BinaryIO, str]:
+        with self.lock:
+            self.load_index()
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".")
+        return os.fdopen(fd, "wb"), temp_path
+
+    def add(self, key: str, temp_path: str, extension: str) -> str:
+        name = f"{key}.{extension}"
+        path = os.path.join(self.directory, name)
+        size = os.path.getsize(temp_path)
+        with self.lock:
+            files = self.load_index()
+            os.replace(temp_path, path)
+
+            if key in files:
+                self.total_bytes -= files.pop(key)[1]
+            files[key] = (name, size)
+            self.total_bytes += size
+            now = time.monotonic()
+            self.used_at[key] = now
+
+            while self.total_bytes > self.max_bytes and len(files) > 1:
+                old_key = next(iter(files))
+                # Files are in LRU order, so all the next ones are recent too
+                if (
+                    old_key in self.used_at
+                    and now - self.used_at[old_key] < self.min_age
+                ):
+                    break
+                _, (old_name, old_size) = files.popitem(last=False)
+                self.used_at.pop(old_key, None)
+                self.total_bytes -= old_size
+                try:
+                    os.remove(os.path.join(self.directory, old_name))
+                except FileNotFoundError:
+                    pass
+        return path
+
+    def put(self, key: str, data: bytes, extension: str) -> str:
+        file, temp_path = self.create_temp_file()
+        with file:
+            file.write(data)
+        return self.add(key, temp_path, extension)
+
+    def get_status(self) -> dict[str, int]:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "files": len(self.files or {}),
+                "size": self.total_bytes,
+                "maxSize": self.max_bytes,
+            }
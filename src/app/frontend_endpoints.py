@@ -2,8 +2,6 @@ from typing import Any
 from fastapi import APIRouter, Body, HTTPException, Depends
 from fastapi.responses import JSONResponse, Response
 from sqlmodel import Session, select
-from mutagen.mp3 import MP3
-from mutagen.flac import FLAC
 
 from src.app.open_subsonic_formatter import OpenSubsonicFormatter
 from .subsonic_response import SubsonicResponse
@@ -33,13 +31,19 @@ def get_sorted_artist_albums(
     id: int,
     size: int = 10,
     offset: int = 0,
+    cursor: str | None = None,
     session: Session = Depends(db.get_session),
 ) -> JSONResponse:
     album_service = service_layer.AlbumService(session)
-    sortedAlbums = album_service.get_sorted_artist_albums(id, size, offset)
+    page = album_service.get_sorted_artist_album_page(id, size, offset, cursor)
+    if page is None:
+        return JSONResponse({"detail": "Invalid arguments"}, status_code=400)
+    sortedAlbums, next_cursor = page
 
     rsp = SubsonicResponse()
     rsp.data["sortedAlbums"] = OpenSubsonicFormatter.format_albums(sortedAlbums)
+    if next_cursor is not None:
+        rsp.data["sortedAlbums"]["nextCursor"] = next_cursor
     return rsp.to_json_rsp()
 
 
@@ -47,11 +51,13 @@ def get_sorted_artist_albums(
 def get_cover_art_preview(
     id: int, session: Session = Depends(db.get_session)
 ) -> Response:
-    track = session.exec(select(db.Track).where(db.Track.id == id)).one_or_none()
-    if track is None:
+    cover = session.exec(
+        select(db.Cover).join(db.Track).where(db.Track.id == id)
+    ).one_or_none()
+    if cover is None:
         return JSONResponse({"detail": "No such id"}, status_code=404)
 
-    return Response(content=track.cover, media_type=f"image/{track.cover_type}")
+    return Response(content=cover.data, media_type=f"image/{cover.type}")
 
 
 @frontend_router.get("/getTags")
@@ -69,20 +75,18 @@ def update_tags(
     data: dict[str, Any] = Body(...),
     session: Session = Depends(db.get_session),
 ) -> JSONResponse:
-    track = session.exec(select(db.Track).where(db.Track.id == id)).one_or_none()
-    if track is None:
-        return JSONResponse({"detail": "No such id"}, status_code=404)
-
-    audio, audio_type = utils.update_tags(track, data)
-    audio.save()
-
-    audio_info = db_loading.AudioInfo(track.file_path)
-    match audio_type:
-        case utils.AudioType.MP3:
-            db_loading.extract_metadata_mp3(MP3(track.file_path), audio_info)
-        case utils.AudioType.FLAC:
-            db_loading.extract_metadata_flac(FLAC(track.file_path), audio_info)
-
-    db_loading.load_audio_data(audio_info, session)
+    if not db_loading.scan_lock.acquire(blocking=False):
+        return JSONResponse({"detail": "Library scan in progress"}, status_code=409)
+    try:
+        track = session.exec(select(db.Track).where(db.Track.id == id)).one_or_none()
+        if track is None:
+            return JSONResponse({"detail": "No such id"}, status_code=404)
+
+        audio, _ = utils.update_tags(track, data)
+        audio.save()
+
+        db_loading.reload_track(track.file_path, session)
+    finally:
+        db_loading.scan_lock.release()
 
     return JSONResponse({"detail": "success"})
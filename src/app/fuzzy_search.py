@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+from sqlmodel import Session, SQLModel, select
+
+from src.app import database as db
+
+
+logger = logging.getLogger(__name__)
+
+# exact: only the full-text index; fuzzy: only rapidfuzz;
+# auto: rapidfuzz for the result types the full-text index found nothing for
+SEARCH_MODE = os.environ.get("MUSIC_RITMO_SEARCH_MODE", "auto")
+FUZZY_SCORE_CUTOFF = float(os.environ.get("MUSIC_RITMO_FUZZY_SCORE_CUTOFF", "80"))
+
+
+@dataclass
+class Candidates:
+    """Unique normalized names and the ids of the rows having each of them."""
+
+    names: list[str] = field(default_factory=list)
+    ids: list[tuple[int, ...]] = field(default_factory=list)
+
+
+def load_candidates(session: Session, model: type[SQLModel]) -> Candidates:
+    name_column = getattr(model, db.SEARCH_COLUMNS[str(model.__tablename__)])
+    ids_by_name: dict[str, list[int]] = {}
+    for id, name in session.exec(
+        select(model.id, name_column)  # type: ignore[attr-defined]
+    ):
+        normalized = str(default_process(name))
+        if normalized:
+            ids_by_name.setdefault(normalized, []).append(id)
+    return Candidates(list(ids_by_name), [tuple(ids) for ids in ids_by_name.values()])
+
+
+class FuzzyIndex:
+    """
+    In-memory names of artists, albums and tracks for typo-tolerant search.
+    Rebuilt on startup and after scans, never by a search: searches use the
+    previous snapshot until a rebuild finishes and find nothing before the first.
+    """
+
+    def __init__(self) -> None:
+        self.candidates: dict[str, Candidates] | None = None
+        self.lock = threading.Lock()
+
+    def rebuild(self, session: Session) -> None:
+        started_at = time.monotonic()
+        with self.lock:
+            candidates = {
+                str(model.__tablename__): load_candidates(session, model)
+                for model in (db.Artist, db.Album, db.Track)
+            }
+            self.candidates = candidates
+        logger.info(
+            f"Rebuilt fuzzy search index of "
+            f"{sum(len(c.names) for c in candidates.values())} names "
+            f"in {time.monotonic() - started_at:.2f}s"
+        )
+
+    def start_rebuild(self) -> None:
+        def rebuild() -> None:
+            with Session(db.engine) as session:
+                self.rebuild(session)
+
+        threading.Thread(target=rebuild, daemon=True).start()
+
+    def find(
+        self,
+        model: type[SQLModel],
+        query: str,
+        size: int,
+        offset: int,
+        score_cutoff: float = FUZZY_SCORE_CUTOFF,
+    ) -> list[int]:
+        """Ids of the rows with names closest to the query, best first."""
+        normalized = default_process(query)
+        if self.candidates is None or not normalized or size <= 0:
+            return []
+        candidates = self.candidates[str(model.__tablename__)]
+        ids: list[int] = []
+        for _, _, index in process.extract(
+            normalized,
+            candidates.names,
+            scorer=fuzz.QRatio,
+            processor=None,
+            limit=None,
+            score_cutoff=score_cutoff,
+        ):
+            ids.extend(candidates.ids[index])
+            if len(ids) >= offset + size:
+                break
+        return ids[offset : offset + size]
+
+
+fuzzy_index = FuzzyIndex()
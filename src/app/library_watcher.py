@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    DirModifiedEvent,
+    DirMovedEvent,
+    FileClosedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+    FileSystemEventHandler,
+)
+from watchdog.observers import Observer
+
+from src.app import db_loading
+
+
+logger = logging.getLogger(__name__)
+
+WATCH_ENABLED = os.environ.get("MUSIC_RITMO_WATCH", "0") == "1"
+WATCH_DEBOUNCE_SECONDS = float(os.environ.get("MUSIC_RITMO_WATCH_DEBOUNCE", "2"))
+WATCH_MAX_RETRIES = 3
+
+
+def decode_path(path: bytes | str) -> str:
+    return os.fsdecode(path)
+
+
+class LibraryWatcher(FileSystemEventHandler):
+    """
+    Watches the music directory and applies changed files to the DB. Events are
+    collected until no new ones arrive for `debounce` seconds, so copying a whole
+    album in results in a single reload.
+    """
+
+    def __init__(
+        self, directory: str = "./tracks/", debounce: float = WATCH_DEBOUNCE_SECONDS
+    ):
+        self.directory = directory
+        self.debounce = debounce
+
+        self.changed: set[str] = set()
+        self.removed: set[str] = set()
+        self.last_event_at = 0.0
+        self.failures = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+
+        self.observer = Observer()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.observer.schedule(self, self.directory, recursive=True)
+        self.observer.start()
+        self.worker.start()
+        logger.info(f"Watching {self.directory} for changes")
+
+    def stop(self) -> None:
+        self.observer.stop()
+        self.observer.join()
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.worker.join()
+
+    def add_changes(
+        self, changed: list[str] | None = None, removed: list[str] | None = None
+    ) -> None:
+        with self.condition:
+            for path in removed or []:
+                self.changed.discard(path)
+                self.removed.add(path)
+            for path in changed or []:
+                # A file deleted and re-created in one window is reloaded in place,
+                # keeping its track id
+                self.removed.discard(path)
+                self.changed.add(path)
+            self.last_event_at = time.monotonic()
+            self.condition.notify()
+
+    def on_created(self, event: DirCreatedEvent | FileCreatedEvent) -> None:
+        self.add_changes(changed=[decode_path(event.src_path)])
+
+    def on_modified(self, event: DirModifiedEvent | FileModifiedEvent) -> None:
+        if not event.is_directory:
+            self.add_changes(changed=[decode_path(event.src_path)])
+
+    def on_closed(self, event: FileClosedEvent) -> None:
+        self.add_changes(changed=[decode_path(event.src_path)])
+
+    def on_deleted(self, event: DirDeletedEvent | FileDeletedEvent) -> None:
+        self.add_changes(removed=[decode_path(event.src_path)])
+
+    def on_moved(self, event: DirMovedEvent | FileMovedEvent) -> None:
+        self.add_changes(
+            changed=[decode_path(event.dest_path)],
+            removed=[decode_path(event.src_path)],
+        )
+
+    def return_changes(self, changed: set[str], removed: set[str]) -> None:
+        # Events that arrived in the meantime are newer and take precedence
+        with self.condition:
+            for path in removed - self.changed:
+                self.removed.add(path)
+            for path in changed - self.removed:
+                self.changed.add(path)
+            self.last_event_at = time.monotonic()
+            self.condition.notify()
+
+    def take_changes(self) -> tuple[set[str], set[str]] | None:
+        with self.condition:
+            while not (self.changed or self.removed):
+                if self.stopped:
+                    return None
+                self.condition.wait()
+
+            while not self.stopped:
+                remaining = self.last_event_at + self.debounce - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            changed, removed = self.changed, self.removed
+            self.changed, self.removed = set(), set()
+            return changed, removed
+
+    def run(self) -> None:
+        while (changes := self.take_changes()) is not None:
+            changed, removed = changes
+            started_at = time.monotonic()
+            try:
+                db_loading.reload_files(changed, removed)
+            except Exception as e:
+                self.failures += 1
+                if self.failures > WATCH_MAX_RETRIES:
+                    logger.error(
+                        f"Dropped library changes after {self.failures} failed "
+                        f"attempts: {e}; changed {sorted(changed)}, "
+                        f"removed {sorted(removed)}"
+                    )
+                    self.failures = 0
+                else:
+                    logger.warning(
+                        f"Error while applying library changes, retrying: {e}"
+                    )
+                    self.return_changes(changed, removed)
+                continue
+            self.failures = 0
+            logger.info(
+                f"Applied {len(changed)} changed and {len(removed)} removed paths "
+                f"in {time.monotonic() - started_at:.2f}s"
+            )
@@ -1,8 +1,21 @@
 from src.app.app import app
-from src.app.database import init_db
+from src.app.migrations import init_db
 from src.app.service_layer import create_default_user
-from src.app.db_loading import scan_and_load
+from src.app.db_loading import SCAN_ON_STARTUP, start_background_scan
+from src.app.fuzzy_search import fuzzy_index
+from src.app.library_watcher import WATCH_ENABLED, LibraryWatcher
+from src.app.scrobbles import scrobble_recorder
 
 init_db()
 create_default_user()
-scan_and_load()
+scrobble_recorder.start()
+fuzzy_index.start_rebuild()
+app.add_event_handler("shutdown", scrobble_recorder.stop)
+
+if SCAN_ON_STARTUP:
+    start_background_scan()
+
+if WATCH_ENABLED:
+    watcher = LibraryWatcher()
+    watcher.start()
+    app.add_event_handler("shutdown", watcher.stop)
@@ -0,0 +1,267 @@
+import logging
+from typing import Callable
+
+from sqlalchemy import Column, Connection, Engine, inspect
+from sqlmodel import SQLModel
+
+from src.app import database as db
+from src.app import db_loading
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_schema_version(connection: Connection) -> int:
+    version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    return int(version or 0)
+
+
+def set_schema_version(connection: Connection, version: int) -> None:
+    connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+
+
+def add_column(
+    connection: Connection,
+    table: type[SQLModel],
+    name: str,
+    default: str | None = None,
+) -> None:
+    table_name = str(table.__tablename__)
+    columns = [c["name"] for c in inspect(connection).get_columns(table_name)]
+    if name not in columns:
+        column: Column[object] = table.__table__.c[name]  # type: ignore[attr-defined]
+        definition = f'"{name}" {column.type.compile(connection.dialect)}'
+        if not column.nullable:
+            definition += " NOT NULL"
+        if default is not None:
+            definition += f" DEFAULT {default}"
+        for foreign_key in column.foreign_keys:
+            target = foreign_key.column
+            definition += f' REFERENCES "{target.table.name}" ("{target.name}")'
+        connection.exec_driver_sql(
+            f'ALTER TABLE "{table_name}" ADD COLUMN {definition}'
+        )
+
+
+def drop_column(connection: Connection, table: type[SQLModel], name: str) -> None:
+    table_name = str(table.__tablename__)
+    columns = [c["name"] for c in inspect(connection).get_columns(table_name)]
+    if name in columns:
+        connection.exec_driver_sql(f'ALTER TABLE "{table_name}" DROP COLUMN "{name}"')
+
+
+def create_table(connection: Connection, table: type[SQLModel]) -> None:
+    table.__table__.create(connection, checkfirst=True)  # type: ignore[attr-defined]
+
+
+def create_indexes(
+    connection: Connection, table: type[SQLModel], unique: bool = False
+) -> None:
+    table_name = str(table.__tablename__)
+    columns = {c["name"] for c in inspect(connection).get_columns(table_name)}
+    for index in table.__table__.indexes:  # type: ignore[attr-defined]
+        # Индексы по столбцам из следующих миграций создают те миграции,
+        # уникальные - миграция, которая сначала удаляет дубликаты
+        if index.unique and not unique:
+            continue
+        if {column.name for column in index.columns} <= columns:
+            index.create(connection, checkfirst=True)
+
+
+# Базы, созданные до миграций. При file_mtime = 0 следующее сканирование
+# перечитает все файлы, сохранив id треков, плейлисты и избранное
+def migrate_unversioned_schema(connection: Connection) -> None:
+    add_column(connection, db.Track, "file_mtime", "0")
+    create_table(connection, db.Cover)
+    create_table(connection, db.ScanCheckpoint)
+    add_column(connection, db.Track, "cover_id")
+    add_column(connection, db.Track, "cover_art_hash")
+    add_column(connection, db.Album, "cover_id")
+    drop_column(connection, db.Track, "cover")
+    drop_column(connection, db.Track, "cover_type")
+    drop_column(connection, db.Album, "cover")
+
+
+# Индексы внешних ключей и столбцов поиска
+def add_lookup_indexes(connection: Connection) -> None:
+    for table in (
+        db.GenreTrack,
+        db.ArtistTrack,
+        db.ArtistAlbum,
+        db.CustomTagTrack,
+        db.PlaylistTrack,
+        db.FavouriteTrack,
+        db.FavouriteAlbum,
+        db.FavouritePlaylist,
+        db.FavouriteArtist,
+        db.User,
+        db.Track,
+        db.Album,
+        db.Playlist,
+    ):
+        create_indexes(connection, table)
+
+
+def add_search_index(connection: Connection) -> None:
+    for table_name in db.SEARCH_COLUMNS:
+        for statement in db.get_search_ddl(table_name):
+            connection.exec_driver_sql(statement)
+        # Индекс строится заново по уже загруженным строкам
+        search = f"{table_name}Search"
+        connection.exec_driver_sql(
+            f'INSERT INTO "{search}"("{search}") VALUES (\'rebuild\')'
+        )
+
+
+# Имя исполнителя альбома для сортировки alphabeticalByArtist
+def add_artist_sort_names(connection: Connection) -> None:
+    add_column(connection, db.Album, "artist_sort_name", "''")
+    db_loading.update_artist_sort_names(connection)
+    create_indexes(connection, db.Album)
+
+
+# Составные индексы в порядке сортировки списков альбомов
+def add_album_list_indexes(connection: Connection) -> None:
+    create_indexes(connection, db.Album)
+
+
+# Время добавления и последнего прослушивания для списков newest и recent
+def add_timestamps(connection: Connection) -> None:
+    now = db.current_timestamp()
+    for table in (db.Track, db.Album):
+        add_column(connection, table, "created", "0")
+        add_column(connection, table, "last_played")
+    # Время добавления уже загруженных треков неизвестно, вместо него берётся
+    # время изменения файла. file_mtime хранится в наносекундах, 0 у файлов
+    # до первого пересканирования
+    connection.exec_driver_sql(
+        'UPDATE "Tracks" SET created = CASE WHEN file_mtime > 0 '
+        f"THEN file_mtime / 1000000000 ELSE {now} END"
+    )
+    connection.exec_driver_sql(
+        'UPDATE "Albums" SET created = coalesce('
+        '(SELECT min(created) FROM "Tracks" WHERE album_id = "Albums".id), '
+        f"{now})"
+    )
+    create_indexes(connection, db.Album)
+
+
+# Треки одного файла, добавленные параллельными сканированиями, сливаются
+# в первый из них
+def add_unique_track_paths(connection: Connection) -> None:
+    statements = [
+        """
+        CREATE TEMP TABLE "DuplicateTracks" AS
+        SELECT t.id AS id, k.keep AS keep
+        FROM "Tracks" t JOIN (
+            SELECT file_path, min(id) AS keep FROM "Tracks"
+            GROUP BY file_path HAVING count(*) > 1
+        ) k ON t.file_path = k.file_path
+        WHERE t.id != k.keep
+        """,
+        # Записи, которые уже есть у оставляемого трека, не переносятся
+        *(
+            f"""
+            UPDATE OR IGNORE "{table}"
+            SET track_id = (
+                SELECT keep FROM "DuplicateTracks" d WHERE d.id = track_id
+            )
+            WHERE track_id IN (SELECT id FROM "DuplicateTracks")
+            """
+            for table in ("Playlist_Tracks", "Favourite_Tracks")
+        ),
+        """
+        UPDATE "Playlists" SET total_tracks = total_tracks - (
+            SELECT count(*) FROM "Playlist_Tracks" p
+            WHERE p.playlist_id = "Playlists".id
+            AND p.track_id IN (SELECT id FROM "DuplicateTracks")
+        )
+        """,
+        """
+        UPDATE "Tracks" SET plays_count = plays_count + (
+            SELECT sum(t.plays_count) FROM "Tracks" t
+            JOIN "DuplicateTracks" d ON t.id = d.id
+            WHERE d.keep = "Tracks".id
+        )
+        WHERE id IN (SELECT keep FROM "DuplicateTracks")
+        """,
+        """
+        UPDATE "Albums" SET total_tracks = total_tracks - (
+            SELECT count(*) FROM "Tracks" t
+            WHERE t.album_id = "Albums".id
+            AND t.id IN (SELECT id FROM "DuplicateTracks")
+        )
+        """,
+        *(
+            f"""
+            DELETE FROM "{table}"
+            WHERE track_id IN (SELECT id FROM "DuplicateTracks")
+            """
+            for table in (
+                "Playlist_Tracks",
+                "Favourite_Tracks",
+                "Artist_Tracks",
+                "Genre_Tracks",
+                "CustomTag_Tracks",
+            )
+        ),
+        'DELETE FROM "Tracks" WHERE id IN (SELECT id FROM "DuplicateTracks")',
+        'DROP TABLE "DuplicateTracks"',
+        'DROP INDEX IF EXISTS "ix_Tracks_file_path"',
+    ]
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    create_indexes(connection, db.Track, unique=True)
+
+
+# Время добавления треков переносится через полное сканирование в контрольной
+# точке, как и избранное
+def add_scan_created_data(connection: Connection) -> None:
+    add_column(connection, db.ScanCheckpoint, "created_data")
+
+
+# Одностолбцовые индексы year и play_count - префиксы составных индексов
+# ix_Albums_year_name и ix_Albums_play_count_desc_name
+def drop_redundant_album_indexes(connection: Connection) -> None:
+    for name in ("ix_Albums_year", "ix_Albums_play_count"):
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+
+
+# Миграция с номером i переводит схему из версии i в версию i + 1.
+# Новые миграции добавляются только в конец списка
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    migrate_unversioned_schema,
+    add_lookup_indexes,
+    add_search_index,
+    add_artist_sort_names,
+    add_album_list_indexes,
+    add_timestamps,
+    add_unique_track_paths,
+    add_scan_created_data,
+    drop_redundant_album_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(engine: Engine) -> None:
+    with engine.begin() as connection:
+        version = get_schema_version(connection)
+        if version == 0 and not inspect(connection).has_table(db.Track.__tablename__):
+            SQLModel.metadata.create_all(connection)
+            set_schema_version(connection, SCHEMA_VERSION)
+            logger.info(f"Created database schema version {SCHEMA_VERSION}")
+            return
+
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database schema version {version} is newer than {SCHEMA_VERSION}"
+            )
+
+        for number in range(version, SCHEMA_VERSION):
+            logger.info(f"Migrating database schema to version {number + 1}")
+            MIGRATIONS[number](connection)
+            set_schema_version(connection, number + 1)
+
+
+def init_db() -> None:
+    migrate(db.engine)
@@ -1,11 +1,11 @@
 from typing import Optional, List
-import asyncio
+import os
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import JSONResponse, FileResponse, Response
 from pydantic import BaseModel, Field
 from sqlmodel import Session, select
-from PIL import Image
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.app.open_subsonic_formatter import OpenSubsonicFormatter
 from .subsonic_response import SubsonicResponse
@@ -16,6 +16,9 @@ from . import database as db
 from . import service_layer
 from . import db_helpers
 from . import db_loading
+from . import cover_cache
+from . import scrobbles
+from . import streaming
 from . import utils
 
 open_subsonic_router = APIRouter(prefix="/rest")
@@ -131,10 +134,10 @@ async def ping() -> JSONResponse:
 async def get_playlists(
     username: str = "",
     current_user: db.User = Depends(authenticate_user),
-    session: Session = Depends(db.get_session),
+    session: AsyncSession = Depends(db.get_async_session),
 ) -> JSONResponse:
-    service = service_layer.PlaylistService(session)
-    playlists = service.get_playlists(current_user)
+    service = service_layer.AsyncPlaylistService(session)
+    playlists = await service.get_playlists(current_user)
 
     rsp = SubsonicResponse()
     rsp.data["playlists"] = OpenSubsonicFormatter.format_playlists(playlists)
@@ -143,15 +146,11 @@ async def get_playlists(
 
 @open_subsonic_router.get("/scrobble")
 def scrobble(id: int, session: Session = Depends(db.get_session)) -> JSONResponse:
-    track_helper = db_helpers.TrackDBHelper(session)
-    track = track_helper.get_track_by_id(id)
-    if track is None:
+    if session.get(db.Track, id) is None:
         return JSONResponse({"detail": "No such id"}, status_code=404)
 
-    track.plays_count += 1
-    track.album.play_count += 1
-    session.add(track)
-    session.commit()
+    # Written to the DB in batches, see ScrobbleRecorder
+    scrobbles.scrobble_recorder.record(id)
 
     rsp = SubsonicResponse()
     return rsp.to_json_rsp()
@@ -170,22 +169,73 @@ def get_songs_by_genre(
     return rsp.to_json_rsp()
 
 
+def get_track_file_response(track: db.Track) -> Response:
+    try:
+        stat_result = os.stat(track.file_path)
+    except FileNotFoundError:
+        return JSONResponse({"detail": "No such file"}, status_code=404)
+
+    return streaming.AudioFileResponse(
+        track.file_path, stat_result, media_type=track.type
+    )
+
+
 @open_subsonic_router.get("/download")
-async def download(id: int, session: Session = Depends(db.get_session)) -> Response:
+def download(id: int, session: Session = Depends(db.get_session)) -> Response:
     track = session.exec(select(db.Track).where(db.Track.id == id)).first()
     if track is None:
         return JSONResponse({"detail": "No such id"}, status_code=404)
 
-    return FileResponse(track.file_path)
+    return get_track_file_response(track)
 
 
 @open_subsonic_router.get("/stream")
-async def stream(id: int, session: Session = Depends(db.get_session)) -> Response:
+def stream(
+    id: int,
+    maxBitRate: int = 0,
+    format: str | None = None,
+    session: Session = Depends(db.get_session),
+) -> Response:
     track = session.exec(select(db.Track).where(db.Track.id == id)).first()
     if track is None:
         return JSONResponse({"detail": "No such id"}, status_code=404)
 
-    return FileResponse(track.file_path)
+    transcoding = streaming.choose_transcoding(track, maxBitRate, format)
+    if transcoding is None:
+        return get_track_file_response(track)
+
+    try:
+        stat_result = os.stat(track.file_path)
+    except FileNotFoundError:
+        return JSONResponse({"detail": "No such file"}, status_code=404)
+
+    target_format, bit_rate = transcoding
+    media_type = streaming.TRANSCODE_PROFILES[target_format].media_type
+    cache_key = streaming.get_transcode_cache_key(
+        track, stat_result, target_format, bit_rate
+    )
+    cached_path = streaming.transcode_cache.get(cache_key)
+    if cached_path is not None:
+        try:
+            return streaming.AudioFileResponse(
+                cached_path, os.stat(cached_path), media_type=media_type
+            )
+        except FileNotFoundError:
+            pass
+
+    if not streaming.ffmpeg_available():
+        return get_track_file_response(track)
+
+    if not streaming.transcode_slots.acquire(blocking=False):
+        return JSONResponse({"detail": "Too many transcodes"}, status_code=503)
+    try:
+        return streaming.TranscodeResponse(
+            track.file_path, target_format, bit_rate, cache_key
+        )
+    except BaseException:
+        # Until the response exists nothing else releases the slot
+        streaming.transcode_slots.release()
+        raise
 
 
 @open_subsonic_router.get("/search2")
@@ -198,10 +248,10 @@ async def search2(
     songCount: int = Query(default=20),
     songOffset: int = Query(default=0),
     current_user: db.User = Depends(authenticate_user),
-    session: Session = Depends(db.get_session),
+    session: AsyncSession = Depends(db.get_async_session),
 ) -> JSONResponse:
-    service = service_layer.SearchService(session)
-    artists, albums, tracks = service.search2(
+    service = service_layer.AsyncSearchService(session)
+    artists, albums, tracks = await service.search2(
         query,
         artistCount,
         artistOffset,
@@ -229,10 +279,10 @@ async def search3(
     songCount: int = Query(default=20),
     songOffset: int = Query(default=0),
     current_user: db.User = Depends(authenticate_user),
-    session: Session = Depends(db.get_session),
+    session: AsyncSession = Depends(db.get_async_session),
 ) -> JSONResponse:
-    service = service_layer.SearchService(session)
-    artists, albums, tracks = service.search3(
+    service = service_layer.AsyncSearchService(session)
+    artists, albums, tracks = await service.search3(
         query,
         artistCount,
         artistOffset,
@@ -251,9 +301,11 @@ async def search3(
 
 
 @open_subsonic_router.get("/getGenres")
-async def get_genres(session: Session = Depends(db.get_session)) -> JSONResponse:
-    service = service_layer.GenreService(session)
-    genres: List[dto.Genre] = service.get_genres()
+async def get_genres(
+    session: AsyncSession = Depends(db.get_async_session),
+) -> JSONResponse:
+    service = service_layer.AsyncGenreService(session)
+    genres: List[dto.Genre] = await service.get_genres()
 
     rsp = SubsonicResponse()
     rsp.data["genres"] = OpenSubsonicFormatter.format_genres(genres)
@@ -501,16 +553,9 @@ def get_starred2(
 
 
 @open_subsonic_router.get("/startScan")
-async def start_scan(session: Session = Depends(db.get_session)) -> JSONResponse:
-    db_loading.scanStatus["scanning"] = True
-    db_loading.scanStatus["count"] = 0
-
-    starred_data = utils.get_user_starred_data(session)
-
-    utils.clear_tables(session)
-    asyncio.get_running_loop().run_in_executor(
-        None, db_loading.scan_and_load, "./tracks/", starred_data
-    )
+async def start_scan(fullScan: bool = False) -> JSONResponse:
+    # If a scan is already running, its status is returned
+    db_loading.start_background_scan("./tracks/", full=fullScan)
 
     rsp = SubsonicResponse()
     rsp.data["scanStatus"] = db_loading.scanStatus
@@ -524,6 +569,13 @@ def get_scan_status() -> JSONResponse:
     return rsp.to_json_rsp()
 
 
+@open_subsonic_router.get("/getTranscodeCacheStatus")
+def get_transcode_cache_status() -> JSONResponse:
+    rsp = SubsonicResponse()
+    rsp.data["transcodeCacheStatus"] = streaming.transcode_cache.get_status()
+    return rsp.to_json_rsp()
+
+
 @open_subsonic_router.get("/getAlbumList")
 def get_album_list(
     type: str,
@@ -533,6 +585,7 @@ def get_album_list(
     toYear: Optional[str] = None,
     genre: Optional[str] = None,
     musicFolderId: Optional[str] = None,
+    cursor: Optional[str] = None,
     session: Session = Depends(db.get_session),
 ) -> JSONResponse:
     album_service = service_layer.AlbumService(session)
@@ -551,20 +604,27 @@ def get_album_list(
             request_type = service_layer.RequestType.BY_GENRE
         case "frequent":
             request_type = service_layer.RequestType.FREQUENT
-        case "newest" | "highest" | "recent":
-            # Not implemented
-            request_type = service_layer.RequestType.BY_NAME
+        case "newest":
+            request_type = service_layer.RequestType.NEWEST
+        case "highest":
+            request_type = service_layer.RequestType.HIGHEST
+        case "recent":
+            request_type = service_layer.RequestType.RECENT
         case _:
             return JSONResponse({"detail": "Invalid arguments"}, status_code=400)
 
-    albums = album_service.get_album_list(
-        request_type, size, offset, fromYear, toYear, genre, musicFolderId
+    page = album_service.get_album_page(
+        request_type, size, offset, fromYear, toYear, genre, musicFolderId, cursor
     )
-    if albums is None:
+    if page is None:
         return JSONResponse({"detail": "Invalid arguments"}, status_code=400)
+    albums, next_cursor = page
 
     rsp = SubsonicResponse()
     rsp.data["albumList"] = OpenSubsonicFormatter.format_albums(albums)
+    if next_cursor is not None:
+        # Continuation token for keyset paging, unknown to Subsonic clients
+        rsp.data["albumList"]["nextCursor"] = next_cursor
     return rsp.to_json_rsp()
 
 
@@ -577,6 +637,7 @@ def get_album_list2(
     toYear: Optional[str] = None,
     genre: Optional[str] = None,
     musicFolderId: Optional[str] = None,
+    cursor: Optional[str] = None,
     session: Session = Depends(db.get_session),
 ) -> JSONResponse:
     album_service = service_layer.AlbumService(session)
@@ -595,20 +656,27 @@ def get_album_list2(
             request_type = service_layer.RequestType.BY_GENRE
         case "frequent":
             request_type = service_layer.RequestType.FREQUENT
-        case "newest" | "highest" | "recent":
-            # Not implemented
-            request_type = service_layer.RequestType.BY_NAME
+        case "newest":
+            request_type = service_layer.RequestType.NEWEST
+        case "highest":
+            request_type = service_layer.RequestType.HIGHEST
+        case "recent":
+            request_type = service_layer.RequestType.RECENT
         case _:
             return JSONResponse({"detail": "Invalid arguments"}, status_code=400)
 
-    albums = album_service.get_album_list(
-        request_type, size, offset, fromYear, toYear, genre, musicFolderId
+    page = album_service.get_album_page(
+        request_type, size, offset, fromYear, toYear, genre, musicFolderId, cursor
     )
-    if albums is None:
+    if page is None:
         return JSONResponse({"detail": "Invalid arguments"}, status_code=400)
+    albums, next_cursor = page
 
     rsp = SubsonicResponse()
     rsp.data["albumList2"] = OpenSubsonicFormatter.format_albums(albums)
+    if next_cursor is not None:
+        # Continuation token for keyset paging, unknown to Subsonic clients
+        rsp.data["albumList2"]["nextCursor"] = next_cursor
     return rsp.to_json_rsp()
 
 
@@ -655,7 +723,7 @@ def get_lyrics_by_song_id(
 def get_cover_art(
     id: str, size: int | None = None, session: Session = Depends(db.get_session)
 ) -> Response:
-    image_bytes: bytes | None = None
+    track: db.Track | None = None
 
     prefix, right = id.split("-")
     if not right.isdigit():
@@ -667,8 +735,6 @@ def get_cover_art(
         track = track_helper.get_track_by_id(parsed_id)
         if track is None:
             return JSONResponse({"detail": "No such track id"}, status_code=404)
-        audio, _ = utils.get_audio_object(track)
-        image_bytes = utils.get_cover_from_audio(audio)
 
     elif prefix == "al":
         album_helper = db_helpers.AlbumDBHelper(session)
@@ -679,8 +745,6 @@ def get_cover_art(
         track = album_helper.get_first_track(album.id)
         if track is None:
             return JSONResponse({"detail": "No such track id"}, status_code=404)
-        audio, _ = utils.get_audio_object(track)
-        image_bytes = utils.get_cover_from_audio(audio)
 
     elif prefix == "ar":
         artist_helper = db_helpers.ArtistDBHelper(session)
@@ -691,21 +755,27 @@ def get_cover_art(
     else:
         return JSONResponse({"detail": "No such prefix"}, status_code=404)
 
-    image: Image.Image
-    if image_bytes is None:
-        image = Image.open(utils.DEFAULT_COVER_PATH)
-        image_bytes = utils.image_to_bytes(image)
-    else:
-        image = utils.bytes_to_image(image_bytes)
-
-    if size is not None:
-        if size <= 0:
-            return JSONResponse({"detail": "Invalid size"}, status_code=400)
-        image.thumbnail((size, size))
-        image_bytes = utils.image_to_bytes(image)
+    if size is not None and size <= 0:
+        return JSONResponse({"detail": "Invalid size"}, status_code=400)
+
+    cover_hash = cover_cache.DEFAULT_COVER_KEY
+    if track is not None and track.cover_art_hash is not None:
+        cover_hash = track.cover_art_hash
+    bucket = cover_cache.get_size_bucket(size)
+    key = f"{cover_hash}-{bucket}"
+
+    path = cover_cache.cover_cache.get(key)
+    if path is None:
+        image_bytes: bytes | None = None
+        if cover_hash != cover_cache.DEFAULT_COVER_KEY and track is not None:
+            audio, _ = utils.get_audio_object(track)
+            image_bytes = utils.get_cover_from_audio(audio)
+        path = cover_cache.cover_cache.put(
+            key, *utils.resize_cover(image_bytes, bucket)
+        )
 
-    return Response(
-        content=image_bytes, media_type=f"image/{str(image.format).lower()}"
+    return FileResponse(
+        path, media_type=f"image/{os.path.splitext(path)[1].removeprefix('.')}"
     )
 
 
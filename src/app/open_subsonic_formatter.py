@@ -118,6 +118,7 @@ class OpenSubsonicFormatter:
         add_if_not_none(result, "playCount", track.play_count)
 
         add_datetime_if_not_none(result, "created", track.created)
+        add_datetime_if_not_none(result, "played", track.played)
         add_datetime_if_not_none(result, "starred", track.starred)
 
         result["artists"] = list(
@@ -156,6 +157,7 @@ class OpenSubsonicFormatter:
         add_if_not_none(result, "genre", album.genre)
 
         add_if_not_none(result, "playCount", album.play_count)
+        add_datetime_if_not_none(result, "played", album.played)
 
         add_datetime_if_not_none(result, "starred", album.starred)
 
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import Engine, bindparam, func, update
+from sqlmodel import col, select
+
+from src.app import database as db
+
+
+logger = logging.getLogger(__name__)
+
+SCROBBLE_FLUSH_SECONDS = float(
+    os.environ.get("MUSIC_RITMO_SCROBBLE_FLUSH_SECONDS", "5")
+)
+SCROBBLE_FLUSH_EVENTS = int(os.environ.get("MUSIC_RITMO_SCROBBLE_FLUSH_EVENTS", "100"))
+
+
+class ScrobbleRecorder:
+    """
+    Buffers plays and writes them every `interval` seconds or `max_events`
+    plays, and on stop.
+    """
+
+    def __init__(
+        self,
+        engine: Engine = db.engine,
+        interval: float = SCROBBLE_FLUSH_SECONDS,
+        max_events: int = SCROBBLE_FLUSH_EVENTS,
+    ):
+        self.engine = engine
+        self.interval = interval
+        self.max_events = max_events
+
+        self.plays: Counter[int] = Counter()
+        self.last_played: dict[int, int] = {}
+        self.events = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.worker: threading.Thread | None = None
+
+    def start(self) -> None:
+        self.stopped = False
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def stop(self) -> None:
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+        self.flush()
+
+    def record(self, track_id: int) -> None:
+        with self.condition:
+            self.plays[track_id] += 1
+            self.last_played[track_id] = db.current_timestamp()
+            self.events += 1
+            if self.events >= self.max_events:
+                self.condition.notify()
+
+    def take_plays(self) -> tuple[Counter[int], dict[int, int]]:
+        with self.condition:
+            plays, last_played = self.plays, self.last_played
+            self.plays, self.last_played = Counter(), {}
+            self.events = 0
+            return plays, last_played
+
+    def return_plays(self, plays: Counter[int], last_played: dict[int, int]) -> None:
+        # Not counted as new events, so a failing write is retried after the
+        # interval instead of right away
+        with self.condition:
+            self.plays.update(plays)
+            for track_id, played in last_played.items():
+                self.last_played[track_id] = max(
+                    played, self.last_played.get(track_id, played)
+                )
+
+    def flush(self) -> None:
+        plays, last_played = self.take_plays()
+        if not plays:
+            return
+        rows = [
+            {"track": track_id, "count": count, "played": last_played[track_id]}
+            for track_id, count in plays.items()
+        ]
+        album_id = (
+            select(db.Track.album_id)
+            .where(col(db.Track.id) == bindparam("track"))
+            .scalar_subquery()
+        )
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(
+                    update(db.Track)
+                    .where(col(db.Track.id) == bindparam("track"))
+                    .values(
+                        plays_count=db.Track.plays_count + bindparam("count"),
+                        last_played=func.max(
+                            func.coalesce(db.Track.last_played, 0),
+                            bindparam("played"),
+                        ),
+                    ),
+                    rows,
+                )
+                connection.execute(
+                    update(db.Album)
+                    .where(col(db.Album.id) == album_id)
+                    .values(
+                        play_count=db.Album.play_count + bindparam("count"),
+                        last_played=func.max(
+                            func.coalesce(db.Album.last_played, 0),
+                            bindparam("played"),
+                        ),
+                    ),
+                    rows,
+                )
+        except Exception as e:
+            # Kept for the next flush instead of being lost
+            logger.warning(f"Error while writing {len(rows)} scrobbled tracks: {e}")
+            self.return_plays(plays, last_played)
+
+    def wait(self) -> bool:
+        """Waits until the buffer is due to be flushed, False once stopped."""
+        with self.condition:
+            deadline = time.monotonic() + self.interval
+            while not self.stopped and self.events < self.max_events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return not self.stopped
+
+    def run(self) -> None:
+        while self.wait():
+            self.flush()
+
+
+scrobble_recorder = ScrobbleRecorder()
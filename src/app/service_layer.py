@@ -1,18 +1,34 @@
+import asyncio
 import random
 import py_avataaars as pa  # type: ignore
 from enum import Enum
 from dataclasses import dataclass
 from datetime import datetime
 from functools import partial
-from typing import List, Optional, Dict, Sequence, Set, Tuple, Union, Any, cast
-
-from sqlmodel import Session, select
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+
+from sqlmodel import Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from mutagen.id3 import USLT  # type: ignore
 
 from src.app import dto
 
+from . import async_db_helpers
 from . import database as db
 from . import db_helpers
+from .fuzzy_search import SEARCH_MODE, fuzzy_index
 from .utils import get_audio_object, AudioType
 
 
@@ -54,7 +70,8 @@ def fill_album(
         name=db_album.name,
         song_count=db_album.total_tracks,
         duration=get_tracklist_duration(db_album.tracks),
-        created=datetime.now(),
+        created=datetime.fromtimestamp(db_album.created),
+        played=from_timestamp(db_album.last_played),
         artist=join_artist_names(db_album.artists),
         artist_id=get_album_artist_id_by_album(db_album),
         cover_art_id=db_album.id,
@@ -143,7 +160,8 @@ def fill_track(db_track: db.Track, db_user: db.User | None) -> dto.Track:
         channel_count=db_track.channels,
         path=db_track.file_path,
         play_count=db_track.plays_count,
-        created=datetime.now(),
+        created=datetime.fromtimestamp(db_track.created),
+        played=from_timestamp(db_track.last_played),
         starred=set_track_starred(db_track, db_user),
         bpm=None,
         comment=None,
@@ -153,24 +171,12 @@ def fill_track(db_track: db.Track, db_user: db.User | None) -> dto.Track:
 
 
 def fill_tracks(
-    db_tracks: Sequence[db.Track], db_user: db.User | None
+    db_tracks: Sequence[db.Track], db_user: db.User | None, need_sort: bool = True
 ) -> List[dto.Track]:
-    return list(
-        sorted(
-            map(partial(fill_track, db_user=db_user), db_tracks),
-            key=lambda track: track.id,
-        )
-    )
-
-
-def fill_genre(db_genre: db.Genre) -> dto.Genre:
-    albumCount = len(set([t.album_id for t in db_genre.tracks]))
-    songCount = len(db_genre.tracks)
-    return dto.Genre(albumCount=albumCount, songCount=songCount, name=db_genre.name)
-
-
-def fill_genres(db_genres: Sequence[db.Genre]) -> List[dto.Genre]:
-    return list(sorted(map(fill_genre, db_genres), key=lambda genre: genre.name))
+    tracks = map(partial(fill_track, db_user=db_user), db_tracks)
+    if not need_sort:
+        return list(tracks)
+    return list(sorted(tracks, key=lambda track: track.id))
 
 
 def fill_artists(
@@ -178,21 +184,20 @@ def fill_artists(
     db_user: db.User | None,
     with_albums: bool = True,
     with_songs: bool = False,
+    need_sort: bool = True,
 ) -> List[dto.Artist]:
-    return list(
-        sorted(
-            map(
-                partial(
-                    fill_artist,
-                    db_user=db_user,
-                    with_albums=with_albums,
-                    with_songs=with_songs,
-                ),
-                db_artists,
-            ),
-            key=lambda artist: artist.id,
-        )
+    artists = map(
+        partial(
+            fill_artist,
+            db_user=db_user,
+            with_albums=with_albums,
+            with_songs=with_songs,
+        ),
+        db_artists,
     )
+    if not need_sort:
+        return list(artists)
+    return list(sorted(artists, key=lambda artist: artist.id))
 
 
 def fill_playlist(
@@ -295,47 +300,158 @@ class AlbumService:
         genre: Optional[str] = None,
         music_folder_id: Optional[str] = None,
     ) -> Optional[List[dto.Album]]:
+        page = self.get_album_page(
+            type, size, offset, from_year, to_year, genre, music_folder_id
+        )
+        return None if page is None else page[0]
+
+    def get_album_page(
+        self,
+        type: RequestType,
+        size: int = 10,
+        offset: int = 0,
+        from_year: Optional[str] = None,
+        to_year: Optional[str] = None,
+        genre: Optional[str] = None,
+        music_folder_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> Optional[Tuple[List[dto.Album], Optional[str]]]:
+        """
+        Albums of the list and the cursor of its next page. A cursor from the
+        previous page makes `offset` count from the end of that page.
+        """
+        list_name = get_album_list_name(type, from_year, to_year, genre)
+        try:
+            after = db_helpers.decode_cursor(cursor, list_name) if cursor else None
+            return self.get_album_rows(
+                type, size, offset, from_year, to_year, genre, after
+            )
+        except ValueError:
+            return None
+
+    def get_album_rows(
+        self,
+        type: RequestType,
+        size: int,
+        offset: int,
+        from_year: Optional[str],
+        to_year: Optional[str],
+        genre: Optional[str],
+        after: Optional[List[Any]],
+    ) -> Optional[Tuple[List[dto.Album], Optional[str]]]:
         result: Sequence[db.Album] = []
+        order: Optional[Sequence[db_helpers.SortColumn]] = None
         match type:
             case RequestType.RANDOM:
-                albums = self.album_db_helper.get_all_albums()
-                result = random.sample(albums, min(size, len(albums)))
+                result = self.album_db_helper.get_random_albums(size)
             case RequestType.BY_NAME:
-                result = list(self.album_db_helper.get_albums_by_name(size, offset))
+                order = db_helpers.ALBUMS_BY_NAME
+                result = self.album_db_helper.get_albums_by_name(
+                    size, offset, after=after
+                )
             case RequestType.BY_ARTIST:
-                albums = list(self.album_db_helper.get_all_albums())
-                albums.sort(key=lambda album: self.compare_albums_by_artist(album.id))
-                result = albums[offset : offset + size]
+                order = db_helpers.ALBUMS_BY_ARTIST
+                result = self.album_db_helper.get_albums_by_artist(
+                    size, offset, after=after
+                )
             case RequestType.BY_YEAR if from_year is not None and to_year is not None:
                 min_year: str = min(from_year, to_year)
                 max_year: str = max(from_year, to_year)
                 reversed_order = from_year > to_year
 
+                order = (
+                    db_helpers.ALBUMS_BY_YEAR_REVERSED
+                    if reversed_order
+                    else db_helpers.ALBUMS_BY_YEAR
+                )
                 result = self.album_db_helper.get_sorted_by_year_albums(
-                    min_year, max_year, size, offset, reversed_order
+                    min_year, max_year, size, offset, reversed_order, after=after
                 )
             case RequestType.BY_GENRE if genre is not None:
-                result = self.album_db_helper.get_albums_by_genre(genre, size, offset)
-            case RequestType.FREQUENT:
+                order = db_helpers.ALBUMS_BY_NAME
+                result = self.album_db_helper.get_albums_by_genre(
+                    genre, size, offset, after=after
+                )
+            case RequestType.NEWEST:
+                order = db_helpers.ALBUMS_BY_CREATED
+                result = self.album_db_helper.get_newest_albums(
+                    size, offset, after=after
+                )
+            case RequestType.RECENT:
+                order = db_helpers.ALBUMS_BY_LAST_PLAYED
+                result = self.album_db_helper.get_recently_played_albums(
+                    size, offset, after=after
+                )
+            case RequestType.FREQUENT | RequestType.HIGHEST:
+                # Albums have no ratings, the most played ones rank highest
+                order = db_helpers.ALBUMS_BY_FREQUENCY
                 result = self.album_db_helper.get_sorted_albums_by_frequency(
-                    size, offset
+                    size, offset, after=after
                 )
-            case RequestType.NEWEST | RequestType.HIGHEST | RequestType.RECENT:
-                raise NotImplementedError()
             case _:  # validation error
                 return None
 
-        return fill_albums(result, None, with_songs=False, need_sort=False)
-
-    def compare_albums_by_artist(self, album_id: int) -> str:
-        artist: Optional[db.Artist] = self.album_db_helper.get_album_artist(album_id)
-        return "" if artist is None else artist.name
+        list_name = get_album_list_name(type, from_year, to_year, genre)
+        return (
+            fill_albums(result, None, with_songs=False, need_sort=False),
+            get_next_cursor(list_name, order, result, size),
+        )
 
     def get_sorted_artist_albums(
         self, artistId: int, size: int = 10, offset: int = 0
     ) -> List[dto.Album]:
-        albums = self.album_db_helper.get_sorted_artist_albums(artistId, size, offset)
-        return fill_albums(albums, None, with_songs=False)
+        page = self.get_sorted_artist_album_page(artistId, size, offset)
+        return [] if page is None else page[0]
+
+    def get_sorted_artist_album_page(
+        self,
+        artistId: int,
+        size: int = 10,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+    ) -> Optional[Tuple[List[dto.Album], Optional[str]]]:
+        list_name = f"artistAlbums:{artistId}"
+        try:
+            after = db_helpers.decode_cursor(cursor, list_name) if cursor else None
+            albums = self.album_db_helper.get_sorted_artist_albums(
+                artistId, size, offset, after=after
+            )
+        except ValueError:
+            return None
+        # Pages are taken in ARTIST_ALBUMS order, but the endpoint has always
+        # returned the albums of a page by id
+        return (
+            fill_albums(albums, None, with_songs=False),
+            get_next_cursor(list_name, db_helpers.ARTIST_ALBUMS, albums, size),
+        )
+
+
+def get_album_list_name(
+    type: RequestType,
+    from_year: Optional[str],
+    to_year: Optional[str],
+    genre: Optional[str],
+) -> str:
+    # Cursors of another list, or of the same list with other filters, are rejected
+    match type:
+        case RequestType.BY_YEAR:
+            return f"{type.name}:{from_year}:{to_year}"
+        case RequestType.BY_GENRE:
+            return f"{type.name}:{genre}"
+        case _:
+            return type.name
+
+
+def get_next_cursor(
+    list_name: str,
+    order: Optional[Sequence[db_helpers.SortColumn]],
+    rows: Sequence[Any],
+    size: int,
+) -> Optional[str]:
+    # A short page is the last one
+    if order is None or not rows or len(rows) < size:
+        return None
+    return db_helpers.encode_cursor(list_name, order, rows[-1])
 
 
 def join_artist_names(artists: Sequence[db.Artist]) -> Optional[str]:
@@ -363,6 +479,12 @@ def get_album_artist_id_by_artist(db_artist: Optional[db.Artist]) -> Optional[in
     return None
 
 
+def from_timestamp(timestamp: int | None) -> datetime | None:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp)
+
+
 def extract_year(str_year: str | None) -> int | None:
     if str_year and len(str_year) == 4 and str_year.isnumeric():
         return int(str_year)
@@ -404,18 +526,9 @@ class TrackService:
     ) -> List[dto.Track]:
         if size < 0:
             return []
-        tracks = self.track_db_helper.get_all_tracks()
-        if genre:
-            tracks = self.track_db_helper.get_tracks_by_genre_name(genre)
-        if from_year:
-            tracks = list(
-                filter(lambda track: track.year and track.year >= from_year, tracks)
-            )
-        if to_year:
-            tracks = list(
-                filter(lambda track: track.year and track.year <= to_year, tracks)
-            )
-        random_tracks = random.sample(tracks, min(size, len(tracks)))
+        random_tracks = self.track_db_helper.get_random_tracks(
+            size, genre, from_year, to_year
+        )
         return fill_tracks(random_tracks, db_user)
 
     def extract_lyrics(self, id: int) -> Optional[List[Dict[str, Any]]]:
@@ -445,9 +558,21 @@ class GenreService:
         self.DBHelper = db_helpers.GenresDBHelper(session)
 
     def get_genres(self) -> List[dto.Genre]:
-        db_genres = self.DBHelper.get_all_genres()
-        genres = fill_genres(db_genres)
-        return genres
+        return [
+            dto.Genre(albumCount=album_count, songCount=song_count, name=name)
+            for name, album_count, song_count in self.DBHelper.get_genre_stats()
+        ]
+
+
+class AsyncGenreService:
+    def __init__(self, session: AsyncSession):
+        self.DBHelper = async_db_helpers.AsyncGenresDBHelper(session)
+
+    async def get_genres(self) -> List[dto.Genre]:
+        return [
+            dto.Genre(albumCount=album_count, songCount=song_count, name=name)
+            for name, album_count, song_count in await self.DBHelper.get_genre_stats()
+        ]
 
 
 class ArtistService:
@@ -465,11 +590,116 @@ class ArtistService:
         return None
 
 
+SearchResult = Tuple[Sequence[dto.Artist], Sequence[dto.Album], Sequence[dto.Track]]
+
+
+@dataclass
+class SearchPage:
+    model: type[SQLModel]
+    size: int
+    offset: int
+    # None while the page is to be filled with fuzzy matches
+    rows: Sequence[Any] | None = None
+    fuzzy_ids: Sequence[int] = ()
+
+
+def get_search_pages(
+    artist_count: int,
+    artist_offset: int,
+    album_count: int,
+    album_offset: int,
+    song_count: int,
+    song_offset: int,
+) -> List[SearchPage]:
+    return [
+        SearchPage(db.Artist, artist_count, artist_offset),
+        SearchPage(db.Album, album_count, album_offset),
+        SearchPage(db.Track, song_count, song_offset),
+    ]
+
+
+def find_fuzzy_matches(query: str, pages: Sequence[SearchPage]) -> None:
+    for page in pages:
+        if page.rows is None:
+            page.fuzzy_ids = fuzzy_index.find(page.model, query, page.size, page.offset)
+
+
+def fill_search_result(
+    pages: Sequence[SearchPage], db_user: db.User | None
+) -> SearchResult:
+    artists, albums, tracks = (page.rows or [] for page in pages)
+    # Best matches first
+    return (
+        fill_artists(
+            artists, None, with_albums=False, with_songs=False, need_sort=False
+        ),
+        fill_albums(albums, None, with_songs=False, need_sort=False),
+        fill_tracks(tracks, db_user, need_sort=False),
+    )
+
+
+def fill_all_search_result(
+    rows: Tuple[Sequence[db.Artist], Sequence[db.Album], Sequence[db.Track]],
+    db_user: db.User | None,
+) -> SearchResult:
+    db_artists, db_albums, db_tracks = rows
+    return (
+        fill_artists(db_artists, None, with_albums=False, with_songs=False),
+        fill_albums(db_albums, None, with_songs=False),
+        fill_tracks(db_tracks, db_user),
+    )
+
+
 class SearchService:
-    def __init__(self, session: Session):
+    """
+    search2 and search3 in steps: AsyncSearchService runs the database ones
+    through run_sync, fuzzy matching and filling in worker threads.
+    """
+
+    def __init__(self, session: Session, mode: str = SEARCH_MODE):
+        self.session = session
         self.artist_db_helper = db_helpers.ArtistDBHelper(session)
         self.album_db_helper = db_helpers.AlbumDBHelper(session)
         self.track_db_helper = db_helpers.TrackDBHelper(session)
+        self.mode = mode
+
+    def find_exact_matches(self, query: str, pages: Sequence[SearchPage]) -> None:
+        searches: dict[type[SQLModel], Callable[[str, int, int], Sequence[Any]]] = {
+            db.Artist: self.artist_db_helper.search_artists,
+            db.Album: self.album_db_helper.search_albums,
+            db.Track: self.track_db_helper.search_tracks,
+        }
+        for page in pages:
+            if self.mode == "fuzzy":
+                continue
+            exact = searches[page.model]
+            rows = exact(query, page.size, page.offset)
+            if self.mode == "auto" and not rows and page.size > 0:
+                # An empty page after the last exact match is not a typo
+                if page.offset == 0 or not exact(query, 1, 0):
+                    continue
+            page.rows = rows
+
+    def load_fuzzy_matches(self, pages: Sequence[SearchPage]) -> None:
+        relations: dict[type[SQLModel], Sequence[Any]] = {
+            db.Artist: (),
+            db.Album: db_helpers.ALBUM_RELATIONS,
+            db.Track: db_helpers.TRACK_RELATIONS,
+        }
+        for page in pages:
+            if page.rows is None:
+                page.rows = db_helpers.get_by_ids(
+                    self.session, page.model, page.fuzzy_ids, relations[page.model]
+                )
+
+    def get_all(
+        self,
+    ) -> Tuple[Sequence[db.Artist], Sequence[db.Album], Sequence[db.Track]]:
+        return (
+            self.artist_db_helper.get_all_artists(),
+            self.album_db_helper.get_all_albums(),
+            self.track_db_helper.get_all_tracks(),
+        )
 
     def search2(
         self,
@@ -481,23 +711,19 @@ class SearchService:
         song_count: int,
         song_offset: int,
         db_user: db.User | None = None,
-    ) -> Tuple[Sequence[dto.Artist], Sequence[dto.Album], Sequence[dto.Track]]:
-
-        db_artists = self.artist_db_helper.get_artists(
-            artist_count, artist_offset, filter_name=query
-        )
-        db_albums = self.album_db_helper.get_albums(
-            album_count, album_offset, filter_name=query
-        )
-        db_tracks = self.track_db_helper.get_tracks(
-            song_count, song_offset, filter_title=query
-        )
-
-        return (
-            fill_artists(db_artists, None, with_albums=False, with_songs=False),
-            fill_albums(db_albums, None, with_songs=False),
-            fill_tracks(db_tracks, db_user),
+    ) -> SearchResult:
+        pages = get_search_pages(
+            artist_count,
+            artist_offset,
+            album_count,
+            album_offset,
+            song_count,
+            song_offset,
         )
+        self.find_exact_matches(query, pages)
+        find_fuzzy_matches(query, pages)
+        self.load_fuzzy_matches(pages)
+        return fill_search_result(pages, db_user)
 
     def search3(
         self,
@@ -509,7 +735,7 @@ class SearchService:
         song_count: int,
         song_offset: int,
         db_user: db.User | None = None,
-    ) -> Tuple[Sequence[dto.Artist], Sequence[dto.Album], Sequence[dto.Track]]:
+    ) -> SearchResult:
         if query != "":
             return self.search2(
                 query,
@@ -521,15 +747,72 @@ class SearchService:
                 song_offset,
                 db_user,
             )
-        db_artists = self.artist_db_helper.get_all_artists()
-        db_albums = self.album_db_helper.get_all_albums()
-        db_tracks = self.track_db_helper.get_all_tracks()
+        return fill_all_search_result(self.get_all(), db_user)
 
-        return (
-            fill_artists(db_artists, None, with_albums=False, with_songs=False),
-            fill_albums(db_albums, None, with_songs=False),
-            fill_tracks(db_tracks, db_user),
+
+class AsyncSearchService:
+    def __init__(self, session: AsyncSession, mode: str = SEARCH_MODE):
+        self.session = session
+        self.mode = mode
+
+    async def search2(
+        self,
+        query: str,
+        artist_count: int,
+        artist_offset: int,
+        album_count: int,
+        album_offset: int,
+        song_count: int,
+        song_offset: int,
+        db_user: db.User | None = None,
+    ) -> SearchResult:
+        pages = get_search_pages(
+            artist_count,
+            artist_offset,
+            album_count,
+            album_offset,
+            song_count,
+            song_offset,
+        )
+        await async_db_helpers.run_sync(
+            self.session,
+            lambda session: SearchService(session, self.mode).find_exact_matches(
+                query, pages
+            ),
         )
+        await asyncio.to_thread(find_fuzzy_matches, query, pages)
+        await async_db_helpers.run_sync(
+            self.session,
+            lambda session: SearchService(session).load_fuzzy_matches(pages),
+        )
+        return await asyncio.to_thread(fill_search_result, pages, db_user)
+
+    async def search3(
+        self,
+        query: str,
+        artist_count: int,
+        artist_offset: int,
+        album_count: int,
+        album_offset: int,
+        song_count: int,
+        song_offset: int,
+        db_user: db.User | None = None,
+    ) -> SearchResult:
+        if query != "":
+            return await self.search2(
+                query,
+                artist_count,
+                artist_offset,
+                album_count,
+                album_offset,
+                song_count,
+                song_offset,
+                db_user,
+            )
+        rows = await async_db_helpers.run_sync(
+            self.session, lambda session: SearchService(session).get_all()
+        )
+        return await asyncio.to_thread(fill_all_search_result, rows, db_user)
 
 
 def playlist_tracks_to_tracks(
@@ -631,6 +914,17 @@ class PlaylistService:
         return fill_playlists(db_playlists, db_user, with_songs=False)
 
 
+class AsyncPlaylistService:
+    def __init__(self, session: AsyncSession):
+        self.playlist_db_helper = async_db_helpers.AsyncPlaylistDBHelper(session)
+
+    async def get_playlists(self, db_user: db.User | None) -> List[dto.Playlist]:
+        db_playlists = await self.playlist_db_helper.get_all_playlists(db_user)
+        return await asyncio.to_thread(
+            fill_playlists, db_playlists, db_user, with_songs=False
+        )
+
+
 class IndexService:
     def __init__(self, session: Session):
         self.artist_db_helper = db_helpers.ArtistDBHelper(session)
@@ -646,7 +940,7 @@ class IndexService:
             last_modified=datetime.now()
         )  #  TODO MUS-208 fill last_modified
         artists: List[dto.Artist] = fill_artists(
-            self.artist_db_helper.get_all_artists(),
+            self.artist_db_helper.get_all_artists(with_albums=True),
             None,
             with_albums=True,
             with_songs=with_childs,
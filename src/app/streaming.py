@@ -0,0 +1,267 @@
+import asyncio
+import os
+import shutil
+import threading
+import typing
+from dataclasses import dataclass
+from subprocess import DEVNULL, PIPE
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from src.app import database as db
+from src.app.file_cache import FileCache
+
+
+ZERO_COPY_SEND = "http.response.zerocopysend"
+PATH_SEND = "http.response.pathsend"
+
+FFMPEG_PATH = os.environ.get("MUSIC_RITMO_FFMPEG", "ffmpeg")
+MAX_TRANSCODES = int(
+    os.environ.get("MUSIC_RITMO_MAX_TRANSCODES", str(os.cpu_count() or 1))
+)
+DEFAULT_TRANSCODE_FORMAT = os.environ.get("MUSIC_RITMO_TRANSCODE_FORMAT", "mp3")
+TRANSCODE_CACHE_DIR = os.environ.get(
+    "MUSIC_RITMO_TRANSCODE_CACHE_DIR", "./cache/transcodes/"
+)
+TRANSCODE_CACHE_MAX_BYTES = (
+    int(os.environ.get("MUSIC_RITMO_TRANSCODE_CACHE_MB", "2048")) * 1024 * 1024
+)
+
+
+@dataclass
+class TranscodeProfile:
+    codec_args: list[str]
+    container: str
+    media_type: str
+    default_bit_rate: int
+
+
+TRANSCODE_PROFILES = {
+    "mp3": TranscodeProfile(["-c:a", "libmp3lame"], "mp3", "audio/mpeg", 192),
+    "aac": TranscodeProfile(["-c:a", "aac"], "adts", "audio/aac", 192),
+    "ogg": TranscodeProfile(["-c:a", "libvorbis"], "ogg", "audio/ogg", 160),
+    "opus": TranscodeProfile(["-c:a", "libopus"], "ogg", "audio/ogg", 128),
+}
+SOURCE_FORMATS = {"audio/mpeg": "mp3", "audio/flac": "flac"}
+
+transcode_slots = threading.BoundedSemaphore(MAX_TRANSCODES)
+transcode_cache = FileCache(TRANSCODE_CACHE_DIR, TRANSCODE_CACHE_MAX_BYTES)
+
+
+def get_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+class AudioFileResponse(FileResponse):
+    """
+    FileResponse with ETags, sendfile when the server supports it and larger
+    read chunks.
+    """
+
+    # _should_use_range, _handle_simple and _handle_single_range override private
+    # hooks of FileResponse in starlette 0.41.2, which requirements.txt pins.
+    # test_starlette_hooks_are_unchanged fails if an upgrade changes them
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, stat_result: os.stat_result, **kwargs: typing.Any):
+        self.zero_copy = False
+        self.path_send = False
+        super().__init__(path, stat_result=stat_result, **kwargs)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        self.headers.setdefault("etag", get_etag(stat_result))
+        super().set_stat_headers(stat_result)
+
+    @classmethod
+    def _should_use_range(cls, http_if_range: str, stat_result: os.stat_result) -> bool:
+        return http_if_range == get_etag(stat_result) or super()._should_use_range(
+            http_if_range, stat_result
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        if if_none_match is not None and self.headers["etag"] in [
+            etag.strip() for etag in if_none_match.split(",")
+        ]:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [
+                        (name, value)
+                        for name, value in self.raw_headers
+                        if name in (b"etag", b"last-modified")
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        extensions = scope.get("extensions") or {}
+        self.zero_copy = ZERO_COPY_SEND in extensions
+        self.path_send = PATH_SEND in extensions
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if send_header_only or not (self.zero_copy or self.path_send):
+            return await super()._handle_simple(send, send_header_only)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if self.path_send:
+            await send({"type": PATH_SEND, "path": os.path.abspath(self.path)})
+        else:
+            with open(self.path, "rb") as file:
+                await send({"type": ZERO_COPY_SEND, "file": file, "more_body": False})
+
+    async def _handle_single_range(
+        self, send: Send, start: int, end: int, file_size: int, send_header_only: bool
+    ) -> None:
+        if send_header_only or not self.zero_copy:
+            return await super()._handle_single_range(
+                send, start, end, file_size, send_header_only
+            )
+
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send(
+            {"type": "http.response.start", "status": 206, "headers": self.raw_headers}
+        )
+        with open(self.path, "rb") as file:
+            await send(
+                {
+                    "type": ZERO_COPY_SEND,
+                    "file": file,
+                    "offset": start,
+                    "count": end - start,
+                    "more_body": False,
+                }
+            )
+
+
+def choose_transcoding(
+    track: db.Track, max_bit_rate: int, format: str | None
+) -> tuple[str, int] | None:
+    """
+    Returns the target format and bit rate in kbps, or None if the original
+    file satisfies the request. `format` is a preference, formats without a
+    transcode profile fall back to the original file or the default format.
+    """
+    if format == "raw":
+        return None
+    if format not in TRANSCODE_PROFILES:
+        format = None
+
+    within_limit = max_bit_rate <= 0 or track.bit_rate <= max_bit_rate * 1000
+    if within_limit and format in (None, SOURCE_FORMATS.get(track.type)):
+        return None
+
+    target = format or DEFAULT_TRANSCODE_FORMAT
+    bit_rate = TRANSCODE_PROFILES[target].default_bit_rate
+    if max_bit_rate > 0:
+        bit_rate = min(bit_rate, max_bit_rate)
+    return target, bit_rate
+
+
+def ffmpeg_available() -> bool:
+    # Checked before a transcode starts, as a missing binary would otherwise show
+    # up only after the 200 status is sent
+    return shutil.which(FFMPEG_PATH) is not None
+
+
+def get_transcode_cache_key(
+    track: db.Track, stat_result: os.stat_result, format: str, bit_rate: int
+) -> str:
+    return (
+        f"{track.id}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+        f"-{format}-{bit_rate}"
+    )
+
+
+class TranscodeResponse(StreamingResponse):
+    """
+    Streams ffmpeg output and releases the `transcode_slots` slot held by the
+    caller when done.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self, path: str, format: str, bit_rate: int, cache_key: str | None = None
+    ):
+        profile = TRANSCODE_PROFILES[format]
+        self.command = [
+            FFMPEG_PATH,
+            "-v",
+            "error",
+            "-i",
+            path,
+            "-map",
+            "0:a:0",
+            *profile.codec_args,
+            "-b:a",
+            f"{bit_rate}k",
+            "-f",
+            profile.container,
+            "pipe:1",
+        ]
+        self.format = format
+        self.cache_key = cache_key
+        self.cache_file: typing.BinaryIO | None = None
+        self.cache_temp_path: str | None = None
+        self.process: asyncio.subprocess.Process | None = None
+        super().__init__(self.read_output(), media_type=profile.media_type)
+
+    async def read_output(self) -> typing.AsyncIterator[bytes]:
+        # Cache files are written, committed and evicted in worker threads, so
+        # disk I/O does not block the event loop
+        if self.cache_key is not None:
+            self.cache_file, self.cache_temp_path = await asyncio.to_thread(
+                transcode_cache.create_temp_file
+            )
+
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command, stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL
+        )
+        assert self.process.stdout is not None
+        while chunk := await self.process.stdout.read(self.chunk_size):
+            if self.cache_file is not None:
+                await asyncio.to_thread(self.cache_file.write, chunk)
+            yield chunk
+        await self.process.wait()
+
+        if self.cache_file is not None and self.process.returncode == 0:
+            await asyncio.to_thread(self.save_cache_file)
+
+    def save_cache_file(self) -> None:
+        assert self.cache_file is not None
+        assert self.cache_key is not None and self.cache_temp_path is not None
+        self.cache_file.close()
+        transcode_cache.add(self.cache_key, self.cache_temp_path, self.format)
+        self.cache_file = None
+
+    def discard_cache_file(self) -> None:
+        assert self.cache_file is not None and self.cache_temp_path is not None
+        self.cache_file.close()
+        self.cache_file = None
+        os.remove(self.cache_temp_path)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.process is not None and self.process.returncode is None:
+                self.process.kill()
+                await self.process.wait()
+            try:
+                if self.cache_file is not None:
+                    await asyncio.to_thread(self.discard_cache_file)
+            finally:
+                transcode_slots.release()
@@ -1,3 +1,4 @@
+import hashlib
 import re
 from typing import Any, cast
 from PIL import Image
@@ -47,6 +48,24 @@ def get_cover_preview(image_bytes: bytes | None) -> tuple[bytes, str]:
     return image_to_bytes(image), str(image.format).lower()
 
 
+def resize_cover(image_bytes: bytes | None, size: int) -> tuple[bytes, str]:
+    image: Image.Image
+    if image_bytes is None:
+        image = Image.open(DEFAULT_COVER_PATH)
+        image_bytes = image_to_bytes(image)
+    else:
+        image = bytes_to_image(image_bytes)
+
+    if size > 0:
+        image.thumbnail((size, size))
+        image_bytes = image_to_bytes(image)
+    return image_bytes, str(image.format).lower()
+
+
+def get_cover_hash(image_bytes: bytes) -> str:
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+
 def get_cover_from_audio(audio: MP3 | FLAC) -> bytes | None:
     cover: bytes | None = None
     match audio:
@@ -196,7 +215,7 @@ def get_user_starred_data(session: Session) -> list[Any]:
                 user.id,
                 [
                     (
-                        favourite_track.track.title,
+                        favourite_track.track.file_path,
                         favourite_track.added_at,
                     )
                     for favourite_track in user.favourite_tracks
@@ -238,6 +257,7 @@ def clear_tables(session: Session) -> None:
         db.Genre,
         db.CustomTag,
         db.Track,
+        db.Cover,
         db.GenreTrack,
         db.ArtistTrack,
         db.ArtistAlbum,
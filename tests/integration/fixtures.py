@@ -1,8 +1,15 @@
 import os
 import pytest
 import tempfile
+from typing import Callable
+from unittest.mock import patch
+
+from mutagen.id3 import TIT2  # type: ignore[attr-defined]
+from mutagen.mp3 import MP3
 from sqlmodel import SQLModel, create_engine, Session, select
 
+from src.app.db_loading import AudioInfo, load_audio_data
+
 
 @pytest.fixture
 def session():
@@ -24,3 +31,58 @@ def db_uri():
 
     yield uri
     os.remove(file.name)
+
+
+def get_default_audio_info(file_path="tracks/t1.mp3") -> AudioInfo:
+    audio_info = None
+    with patch("os.path.getsize") as mock_getsize:
+        mock_getsize.return_value = 1984500
+        audio_info = AudioInfo(file_path)
+    audio_info.type = "audio/mpeg"
+    audio_info.title = "track1"
+    audio_info.artists = ["ar1", "ar2"]
+    audio_info.album_artist = "ar1"
+    audio_info.album = "al1"
+    audio_info.genres = ["g1", "g2"]
+    audio_info.track_number = 1
+    audio_info.year = 2020
+    audio_info.cover = bytes()
+    audio_info.cover_type = ""
+    audio_info.custom_tags = []
+    audio_info.bit_rate = 128 * 1024
+    audio_info.bits_per_sample = 3
+    audio_info.sample_rate = 44100
+    audio_info.channels = 2
+    audio_info.duration = 60
+
+    return audio_info
+
+
+def fill_library(
+    session: Session,
+    track_count: int,
+    set_tags: Callable[[int, AudioInfo], None] | None = None,
+) -> None:
+    """Loads tracks "track{i}" from tracks/t{i}.mp3, `set_tags` changes the
+    other tags of track i."""
+    for i in range(track_count):
+        audio_info = get_default_audio_info(f"tracks/t{i}.mp3")
+        audio_info.title = f"track{i}"
+        if set_tags is not None:
+            set_tags(i, audio_info)
+        load_audio_data(audio_info, session)
+    session.commit()
+
+
+def write_file(path: str, content: bytes = b"data") -> None:
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def write_mp3(path: str, title: str) -> None:
+    # 40 silent MPEG-1 Layer III frames, 128 kbps, 44.1 kHz, stereo
+    write_file(path, (bytes([0xFF, 0xFB, 0x90, 0x00]) + bytes(413)) * 40)
+    audio = MP3(path)
+    audio.add_tags()
+    audio["TIT2"] = TIT2(text=[title])
+    audio.save()
@@ -1,17 +1,24 @@
+import base64
+import os
 import pytest
 from fastapi.testclient import TestClient
 from functools import partial
 from sqlalchemy import Engine, create_engine
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from unittest.mock import MagicMock, patch
 
+from src.app import cover_cache, scrobbles, streaming, utils
 from src.app import database as db
+from src.app.file_cache import FileCache
 from src.app.db_loading import AudioInfo, load_audio_data
+from src.app.fuzzy_search import FuzzyIndex
 from src.app.app import app
 
-from tests.integration.fixtures import session, db_uri
+from tests.integration.fixtures import session, db_uri, get_default_audio_info
 from src.app.service_layer import create_user
 from datetime import datetime
+from threading import BoundedSemaphore
 
 
 def get_session_gen(db_uri: str):
@@ -24,29 +31,13 @@ def get_session_gen(db_uri: str):
         engine.dispose()
 
 
-def get_default_audio_info(file_path="tracks/t1.mp3") -> AudioInfo:
-    audio_info = None
-    with patch("os.path.getsize") as mock_getsize:
-        mock_getsize.return_value = 1984500
-        audio_info = AudioInfo(file_path)
-    audio_info.type = "audio/mpeg"
-    audio_info.title = "track1"
-    audio_info.artists = ["ar1", "ar2"]
-    audio_info.album_artist = "ar1"
-    audio_info.album = "al1"
-    audio_info.genres = ["g1", "g2"]
-    audio_info.track_number = 1
-    audio_info.year = 2020
-    audio_info.cover = bytes()
-    audio_info.cover_type = ""
-    audio_info.custom_tags = []
-    audio_info.bit_rate = 128 * 1024
-    audio_info.bits_per_sample = 3
-    audio_info.sample_rate = 44100
-    audio_info.channels = 2
-    audio_info.duration = 60
-
-    return audio_info
+async def get_async_session_gen(db_uri: str):
+    engine = db.create_async_db_engine(db_uri)
+    try:
+        async with AsyncSession(engine) as session:
+            yield session
+    finally:
+        await engine.dispose()
 
 
 def test_get_existing_song(db_uri: str):
@@ -347,6 +338,53 @@ def test_get_album_list_by_play_count(db_uri: str):
     assert album_list["album"][2]["name"] == "al1"
 
 
+def test_get_album_list_newest_and_recent(db_uri: str):
+    session_gen = partial(get_session_gen, db_uri=db_uri)
+    g = session_gen()
+    session = next(g)
+
+    create_user(session, "admin", "admin")
+
+    for i in range(1, 4):
+        audio_info = get_default_audio_info(f"tracks/t{i}.mp3")
+        audio_info.title = f"track{i}"
+        audio_info.album = f"al{i}"
+        load_audio_data(audio_info, session)
+
+    album = session.exec(select(db.Album).where(db.Album.name == "al1")).one()
+    album.created += 100
+    session.add(album)
+    session.commit()
+
+    g.close()
+
+    app.dependency_overrides[db.get_session] = session_gen
+    client = TestClient(app)
+
+    response = client.get("/rest/getAlbumList2?type=newest&u=admin&p=admin")
+    assert response.status_code == 200
+    album_list = response.json()["subsonic-response"]["albumList2"]
+    # Albums added in the same second keep the order they were added in
+    assert [a["name"] for a in album_list["album"]] == ["al1", "al3", "al2"]
+
+    response = client.get("/rest/getAlbumList2?type=recent&u=admin&p=admin")
+    assert response.status_code == 200
+    assert response.json()["subsonic-response"]["albumList2"]["album"] == []
+
+    recorder = scrobbles.ScrobbleRecorder(create_engine(db_uri))
+    with patch("src.app.scrobbles.scrobble_recorder", recorder):
+        for id in (3, 1):
+            response = client.get(f"/rest/scrobble?id={id}&u=admin&p=admin")
+            assert response.status_code == 200
+    recorder.flush()
+
+    response = client.get("/rest/getAlbumList2?type=recent&u=admin&p=admin")
+    assert response.status_code == 200
+    albums = response.json()["subsonic-response"]["albumList2"]["album"]
+    assert {a["name"] for a in albums} == {"al1", "al3"}
+    assert all("played" in a for a in albums)
+
+
 def test_get_album_list_alphabetical_by_name(db_uri: str):
     session_gen = partial(get_session_gen, db_uri=db_uri)
     g = session_gen()
@@ -389,6 +427,27 @@ def test_get_album_list_alphabetical_by_name(db_uri: str):
     assert album_list["album"][1]["name"] == "al3"
     assert album_list["album"][2]["name"] == "bl1"
 
+    cursor = base64.urlsafe_b64encode(b"[{}, 1]").decode()
+    response = client.get(
+        f"/rest/getAlbumList2?type=alphabeticalByName&cursor={cursor}&u=admin&p=admin"
+    )
+    assert response.status_code == 400
+
+    response = client.get(
+        "/rest/getAlbumList2?type=alphabeticalByName&size=2&u=admin&p=admin"
+    )
+    cursor = response.json()["subsonic-response"]["albumList2"]["nextCursor"]
+    response = client.get(
+        f"/rest/getAlbumList2?type=alphabeticalByName&cursor={cursor}&u=admin&p=admin"
+    )
+    album_list = response.json()["subsonic-response"]["albumList2"]
+    assert [album["name"] for album in album_list["album"]] == ["bl1"]
+    # A cursor of another list is rejected instead of returning a wrong page
+    response = client.get(
+        f"/rest/getAlbumList2?type=alphabeticalByArtist&cursor={cursor}&u=admin&p=admin"
+    )
+    assert response.status_code == 400
+
 
 def test_get_album_list_alphabetical_by_artist(db_uri: str):
     session_gen = partial(get_session_gen, db_uri=db_uri)
@@ -591,6 +650,9 @@ def test_search3(db_uri: str):
     g.close()
 
     app.dependency_overrides[db.get_session] = session_gen
+    app.dependency_overrides[db.get_async_session] = partial(
+        get_async_session_gen, db_uri=db_uri
+    )
     client = TestClient(app)
 
     response = client.get("/rest/search3?query=a&u=admin&p=admin")
@@ -614,6 +676,58 @@ def test_search3(db_uri: str):
     assert "track32" in song_titles
 
 
+def test_search3_full_text(db_uri: str, monkeypatch):
+    index = FuzzyIndex()
+    monkeypatch.setattr("src.app.service_layer.fuzzy_index", index)
+    session_gen = partial(get_session_gen, db_uri=db_uri)
+    g = session_gen()
+    session = next(g)
+
+    create_user(session, "admin", "admin")
+
+    for i, title in enumerate(["Группа крови", "Кровь", "Blood", "Звезда"]):
+        audio = get_default_audio_info(f"tracks/t{i}.mp3")
+        audio.title = title
+        audio.album = "Неизвестный альбом"
+        audio.artists = ["Неизвестный исполнитель"]
+        audio.album_artist = "Неизвестный исполнитель"
+        load_audio_data(audio, session)
+
+    session.commit()
+    index.rebuild(session)
+    g.close()
+
+    app.dependency_overrides[db.get_session] = session_gen
+    app.dependency_overrides[db.get_async_session] = partial(
+        get_async_session_gen, db_uri=db_uri
+    )
+    client = TestClient(app)
+
+    def search(query: str, song_count: int = 20, song_offset: int = 0) -> dict:
+        response = client.get(
+            f"/rest/search3?query={query}&songCount={song_count}"
+            f"&songOffset={song_offset}&u=admin&p=admin"
+        )
+        assert response.status_code == 200
+        return response.json()["subsonic-response"]["searchResult3"]
+
+    result = search("КРОВ")
+    assert {s["title"] for s in result["song"]} == {"Группа крови", "Кровь"}
+    assert result["album"] == result["artist"] == []
+
+    result = search("НЕИЗВЕСТН")
+    assert [a["name"] for a in result["artist"]] == ["Неизвестный исполнитель"]
+    assert [a["name"] for a in result["album"]] == ["Неизвестный альбом"]
+
+    first = search("кров", song_count=1)["song"]
+    second = search("кров", song_count=1, song_offset=1)["song"]
+    assert len(first) == len(second) == 1
+    assert first[0]["title"] != second[0]["title"]
+
+    # Typos are matched by the fuzzy index
+    assert [s["title"] for s in search("Звизда")["song"]] == ["Звезда"]
+
+
 def test_get_genres(db_uri: str):
     session_gen = partial(get_session_gen, db_uri=db_uri)
     g = session_gen()
@@ -649,6 +763,9 @@ def test_get_genres(db_uri: str):
     g.close()
 
     app.dependency_overrides[db.get_session] = session_gen
+    app.dependency_overrides[db.get_async_session] = partial(
+        get_async_session_gen, db_uri=db_uri
+    )
     client = TestClient(app)
 
     response = client.get("/rest/getGenres?u=admin&p=admin")
@@ -833,3 +950,184 @@ def test_get_starred2(db_uri: str):
     assert len(starred["playlist"]) == 1
     assert starred["playlist"][0]["id"] == "1"
     assert starred["playlist"][0]["name"] == "myplaylist"
+
+
+def test_get_cover_art_is_cached(db_uri: str, tmp_path):
+    session_gen = partial(get_session_gen, db_uri=db_uri)
+
+    audio_info = get_default_audio_info()
+    audio_info.cover_art_hash = "abc"
+
+    g = session_gen()
+    session = next(g)
+    create_user(session, "admin", "admin")
+    load_audio_data(audio_info, session)
+    g.close()
+
+    app.dependency_overrides[db.get_session] = session_gen
+    client = TestClient(app)
+
+    with open(utils.DEFAULT_COVER_PATH, "rb") as f:
+        cover = f.read()
+    cache = FileCache(str(tmp_path), max_bytes=2**20)
+    with patch.object(cover_cache, "cover_cache", cache), patch.object(
+        utils, "get_audio_object", return_value=(MagicMock(), None)
+    ) as get_audio_object, patch.object(
+        utils, "get_cover_from_audio", return_value=cover
+    ):
+        for _ in range(2):
+            response = client.get("/rest/getCoverArt?id=al-1&size=100")
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "image/jpeg"
+            image = utils.bytes_to_image(response.content)
+            assert max(image.size) == 128
+
+        response = client.get("/rest/getCoverArt?id=mf-1&size=120")
+        assert response.status_code == 200
+
+    get_audio_object.assert_called_once()
+    assert os.listdir(tmp_path) == ["abc-128.jpeg"]
+
+
+def test_stream_ranges(db_uri: str, tmp_path):
+    session_gen = partial(get_session_gen, db_uri=db_uri)
+
+    file_path = str(tmp_path / "t1.mp3")
+    content = bytes(range(256)) * 1024
+    with open(file_path, "wb") as f:
+        f.write(content)
+
+    g = session_gen()
+    session = next(g)
+    load_audio_data(get_default_audio_info(file_path), session)
+    g.close()
+
+    app.dependency_overrides[db.get_session] = session_gen
+    client = TestClient(app)
+
+    response = client.get("/rest/stream?id=1")
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert response.headers["accept-ranges"] == "bytes"
+    etag = response.headers["etag"]
+
+    response = client.get("/rest/stream?id=1", headers={"Range": "bytes=1000-1999"})
+    assert response.status_code == 206
+    assert response.content == content[1000:2000]
+    assert response.headers["content-range"] == f"bytes 1000-1999/{len(content)}"
+
+    response = client.get(
+        "/rest/download?id=1", headers={"Range": "bytes=-10", "If-Range": etag}
+    )
+    assert response.status_code == 206
+    assert response.content == content[-10:]
+
+    response = client.get(
+        "/rest/stream?id=1", headers={"Range": "bytes=0-9", "If-Range": '"stale"'}
+    )
+    assert response.status_code == 200
+    assert response.content == content
+
+    response = client.get("/rest/stream?id=1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    os.remove(file_path)
+    response = client.get("/rest/stream?id=1")
+    assert response.status_code == 404
+
+
+def test_stream_transcoding_limits(db_uri: str, tmp_path):
+    session_gen = partial(get_session_gen, db_uri=db_uri)
+
+    file_path = str(tmp_path / "t1.mp3")
+    with open(file_path, "wb") as f:
+        f.write(bytes(1024))
+
+    g = session_gen()
+    session = next(g)
+    load_audio_data(get_default_audio_info(file_path), session)
+    g.close()
+
+    app.dependency_overrides[db.get_session] = session_gen
+    client = TestClient(app)
+
+    # A format without a transcode profile is only a preference
+    response = client.get("/rest/stream?id=1&format=flac")
+    assert response.status_code == 200
+    assert response.content == bytes(1024)
+
+    response = client.get("/rest/stream?id=1&maxBitRate=320")
+    assert response.status_code == 200
+    assert response.content == bytes(1024)
+
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nprintf transcoded\n")
+    ffmpeg.chmod(0o755)
+    with patch.object(streaming, "FFMPEG_PATH", str(ffmpeg)), patch.object(
+        streaming, "transcode_slots", BoundedSemaphore(1)
+    ) as slots:
+        slots.acquire()
+        response = client.get("/rest/stream?id=1&maxBitRate=64")
+        assert response.status_code == 503
+        slots.release()
+
+        # The slot is given back if the response cannot be created
+        with patch.object(
+            streaming, "TranscodeResponse", MagicMock(side_effect=OSError)
+        ):
+            with pytest.raises(OSError):
+                client.get("/rest/stream?id=1&maxBitRate=64")
+        assert slots.acquire(blocking=False)
+        slots.release()
+
+    # Without ffmpeg the original file is streamed
+    with patch.object(streaming, "FFMPEG_PATH", str(tmp_path / "missing")):
+        response = client.get("/rest/stream?id=1&maxBitRate=64")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "audio/mpeg"
+        assert response.content == bytes(1024)
+
+
+def test_stream_transcode_cache(db_uri: str, tmp_path):
+    session_gen = partial(get_session_gen, db_uri=db_uri)
+
+    file_path = str(tmp_path / "t1.flac")
+    with open(file_path, "wb") as f:
+        f.write(bytes(1024))
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nprintf transcoded\n")
+    ffmpeg.chmod(0o755)
+
+    g = session_gen()
+    session = next(g)
+    load_audio_data(get_default_audio_info(file_path), session)
+    g.close()
+
+    app.dependency_overrides[db.get_session] = session_gen
+    client = TestClient(app)
+
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=2**20)
+    with patch.object(streaming, "FFMPEG_PATH", str(ffmpeg)), patch.object(
+        streaming, "transcode_cache", cache
+    ):
+        response = client.get("/rest/stream?id=1&maxBitRate=64&format=opus")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "audio/ogg"
+        assert response.content == b"transcoded"
+
+        ffmpeg.unlink()
+        response = client.get(
+            "/rest/stream?id=1&maxBitRate=64&format=opus",
+            headers={"Range": "bytes=5-"},
+        )
+        assert response.status_code == 206
+        assert response.content == b"coded"
+
+        response = client.get("/rest/getTranscodeCacheStatus")
+        status = response.json()["subsonic-response"]["transcodeCacheStatus"]
+        assert status["hits"] == 1
+        assert status["misses"] == 1
+        assert status["files"] == 1
+        assert status["size"] == len(b"transcoded")
@@ -0,0 +1,523 @@
+import os
+from functools import partial
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlmodel import Session, select
+
+from src.app import database as db
+from src.app import db_helpers, db_loading, migrations
+from src.app.db_loading import AudioInfo, load_audio_data
+
+from tests.integration.fixtures import db_uri, write_file, write_mp3
+
+
+def make_audio_info(file_path: str, title: str, file_mtime: int = 0) -> AudioInfo:
+    audio_info = AudioInfo(file_path, file_mtime)
+    audio_info.type = "audio/mpeg"
+    audio_info.title = title
+    audio_info.artists = ["ar1"]
+    audio_info.album_artist = "ar1"
+    audio_info.album = "al1"
+    audio_info.genres = ["g1"]
+    audio_info.track_number = 1
+    audio_info.year = "2020"
+    audio_info.cover = bytes()
+    audio_info.cover_type = ""
+    audio_info.custom_tags = []
+    audio_info.bit_rate = 128 * 1024
+    audio_info.bits_per_sample = 3
+    audio_info.sample_rate = 44100
+    audio_info.channels = 2
+    audio_info.duration = 60
+    return audio_info
+
+
+def fake_parse_audio_file(file_path: str, file_mtime: int = 0) -> AudioInfo:
+    return make_audio_info(
+        file_path, "parsed " + os.path.basename(file_path), file_mtime
+    )
+
+
+def test_incremental_scan(db_uri: str, tmp_path):
+    unchanged = str(tmp_path / "unchanged.mp3")
+    changed = str(tmp_path / "changed.mp3")
+    deleted = str(tmp_path / "deleted.mp3")
+    new = str(tmp_path / "new.mp3")
+    for path in [unchanged, changed, deleted]:
+        write_file(path)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        session.add(db.User(login="admin", password="admin", avatar=""))
+        for path in [unchanged, changed, deleted]:
+            _, mtime = db_loading.get_file_fingerprint(path)
+            load_audio_data(make_audio_info(path, "old", mtime), session)
+        session.add(db.FavouriteTrack(user_id=1, track_id=1, added_at="2024-01-01"))
+        session.commit()
+
+    write_file(changed, b"changed data")
+    write_file(new)
+    os.remove(deleted)
+
+    with patch.object(db, "engine", engine), patch.object(
+        db_loading, "parse_audio_file", side_effect=fake_parse_audio_file
+    ) as parse_mock:
+        db_loading.scan_and_load(str(tmp_path), incremental=True)
+
+    parsed = sorted(call.args[0] for call in parse_mock.call_args_list)
+    assert parsed == sorted([changed, new])
+
+    with Session(engine) as session:
+        tracks = {t.file_path: t for t in session.exec(select(db.Track)).all()}
+        assert set(tracks) == {unchanged, changed, new}
+        assert tracks[unchanged].title == "old"
+        assert tracks[unchanged].id == 1
+        assert tracks[changed].title == "parsed changed.mp3"
+        assert tracks[changed].file_size == len(b"changed data")
+        assert tracks[new].title == "parsed new.mp3"
+
+        favourites = session.exec(select(db.FavouriteTrack)).all()
+        assert [(f.user_id, f.track_id) for f in favourites] == [(1, 1)]
+
+        album = session.exec(select(db.Album)).one()
+        assert album.total_tracks == 3
+    engine.dispose()
+
+
+def test_incremental_scan_removes_orphans(db_uri: str, tmp_path):
+    kept = str(tmp_path / "kept.mp3")
+    deleted = str(tmp_path / "deleted.mp3")
+    write_file(kept)
+    write_file(deleted)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        session.add(db.User(login="admin", password="admin", avatar=""))
+        _, mtime = db_loading.get_file_fingerprint(kept)
+        load_audio_data(make_audio_info(kept, "kept", mtime), session)
+
+        audio_info = make_audio_info(deleted, "deleted")
+        audio_info.album = "al2"
+        audio_info.artists = ["ar2"]
+        audio_info.album_artist = "ar2"
+        audio_info.genres = ["g2"]
+        load_audio_data(audio_info, session)
+
+        playlist = db.Playlist(
+            name="p1", user_id=1, total_tracks=2, create_date="2024-01-01"
+        )
+        playlist.playlist_tracks = [
+            db.PlaylistTrack(track_id=1, added_at="2024-01-01"),
+            db.PlaylistTrack(track_id=2, added_at="2024-01-01"),
+        ]
+        session.add(playlist)
+        session.commit()
+
+    os.remove(deleted)
+
+    with patch.object(db, "engine", engine):
+        db_loading.scan_and_load(str(tmp_path), incremental=True)
+
+    with Session(engine) as session:
+        assert [t.title for t in session.exec(select(db.Track)).all()] == ["kept"]
+        assert [a.name for a in session.exec(select(db.Album)).all()] == ["al1"]
+        assert [a.name for a in session.exec(select(db.Artist)).all()] == ["ar1"]
+        assert [g.name for g in session.exec(select(db.Genre)).all()] == ["g1"]
+
+        playlist = session.exec(select(db.Playlist)).one()
+        assert playlist.total_tracks == 1
+        assert [pt.track_id for pt in playlist.playlist_tracks] == [1]
+    engine.dispose()
+
+
+def test_incremental_scan_removes_retagged_album(db_uri: str, tmp_path):
+    paths = [str(tmp_path / f"{n}.mp3") for n in "ab"]
+    for path in paths:
+        write_file(path)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        for path in paths:
+            _, mtime = db_loading.get_file_fingerprint(path)
+            load_audio_data(make_audio_info(path, "old", mtime), session)
+
+    def parse_retagged(file_path: str, file_mtime: int = 0) -> AudioInfo:
+        audio_info = make_audio_info(file_path, "new", file_mtime)
+        audio_info.artists = ["ar2"]
+        audio_info.album_artist = "ar2"
+        audio_info.album = "al2"
+        audio_info.genres = ["g2"]
+        return audio_info
+
+    # Retagged in place, no file is deleted
+    for path in paths:
+        write_file(path, b"retagged")
+    with patch.object(db, "engine", engine), patch.object(
+        db_loading, "parse_audio_file", side_effect=parse_retagged
+    ):
+        db_loading.scan_and_load(str(tmp_path), incremental=True)
+
+    with Session(engine) as session:
+        albums = db_helpers.AlbumDBHelper(session).get_albums(10, 0)
+        assert [(a.name, a.total_tracks) for a in albums] == [("al2", 2)]
+        artists = db_helpers.ArtistDBHelper(session).get_all_artists()
+        assert [a.name for a in artists] == ["ar2"]
+        genres = db_helpers.GenresDBHelper(session).get_genre_stats()
+        assert list(genres) == [("g2", 1, 2)]
+    engine.dispose()
+
+
+def test_parallel_scan(tmp_path):
+    os.makedirs(tmp_path / "album")
+    for i in range(5):
+        write_mp3(str(tmp_path / "album" / f"{i}.mp3"), f"track{i}")
+    write_file(str(tmp_path / "album" / "cover.jpg"))
+    write_file(str(tmp_path / "broken.mp3"))
+
+    audio_files = list(
+        db_loading.scan_directory_for_audio_files(
+            str(tmp_path), workers=2, chunk_size=2
+        )
+    )
+
+    assert sorted(a.title for a in audio_files) == [f"track{i}" for i in range(5)]
+    assert all(a.bit_rate == 128000 and a.sample_rate == 44100 for a in audio_files)
+
+
+def test_parallel_scan_is_bounded(tmp_path):
+    file_path = str(tmp_path / "track.mp3")
+    write_mp3(file_path, "track")
+
+    consumed = 0
+
+    def endless_files():
+        nonlocal consumed
+        while True:
+            consumed += 1
+            yield file_path, 0
+
+    parsed = db_loading.parse_audio_files(endless_files(), workers=2, chunk_size=3)
+    assert next(parsed).title == "track"
+    parsed.close()
+
+    assert consumed <= (2 * db_loading.SCAN_PENDING_CHUNKS + 1) * 3
+
+
+def test_library_loader_commits_in_batches(db_uri: str, tmp_path):
+    file_path = str(tmp_path / "t.mp3")
+    write_file(file_path)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session, Session(engine) as reader:
+        loader = db_loading.LibraryLoader(session, batch_size=2, preload=True)
+        for i in range(3):
+            audio_info = make_audio_info(file_path, f"track{i}")
+            audio_info.file_path = f"tracks/t{i}.mp3"
+            audio_info.artists = ["ar1", f"ar{i + 2}"]
+            audio_info.genres = ["g1", "g2"]
+            loader.load(audio_info)
+
+        assert len(reader.exec(select(db.Track)).all()) == 2
+        reader.rollback()
+
+        loader.commit()
+
+        assert len(reader.exec(select(db.Track)).all()) == 3
+        assert [a.name for a in reader.exec(select(db.Artist)).all()] == [
+            "ar1",
+            "ar2",
+            "ar3",
+            "ar4",
+        ]
+        assert len(reader.exec(select(db.Genre)).all()) == 2
+        assert len(reader.exec(select(db.ArtistTrack)).all()) == 6
+        assert len(reader.exec(select(db.GenreTrack)).all()) == 6
+
+        album = reader.exec(select(db.Album)).one()
+        assert album.total_tracks == 3
+        assert [a.name for a in album.artists] == ["ar1"]
+    engine.dispose()
+
+
+def test_library_loader_updates_changed_track(db_uri: str, tmp_path):
+    file_path = str(tmp_path / "t.mp3")
+    write_file(file_path)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        load_audio_data(make_audio_info(file_path, "old"), session)
+
+        audio_info = make_audio_info(file_path, "new")
+        audio_info.album = "al2"
+        audio_info.genres = ["g2"]
+        audio_info.custom_tags = [("mood", "calm")]
+        load_audio_data(audio_info, session)
+
+        track = session.exec(select(db.Track)).one()
+        assert track.title == "new"
+        assert track.album.name == "al2"
+        assert [g.name for g in track.genres] == ["g2"]
+        assert [(t.name, t.value) for t in track.custom_tags] == [("mood", "calm")]
+        assert {a.name: a.total_tracks for a in session.exec(select(db.Album))} == {
+            "al1": 0,
+            "al2": 1,
+        }
+    engine.dispose()
+
+
+def test_album_artist_sort_names(db_uri: str, tmp_path):
+    paths = [str(tmp_path / f"t{i}.mp3") for i in range(3)]
+    for path in paths:
+        write_file(path)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        first = make_audio_info(paths[0], "first")
+        first.album_artist = None
+        first.artists = ["bob", "amy"]
+        second = make_audio_info(paths[1], "second")
+        second.album_artist = "zed"
+        second.track_number = 2
+        other = make_audio_info(paths[2], "other")
+        other.album = "al2"
+        other.album_artist = "cat"
+        loader = db_loading.LibraryLoader(session)
+        for audio_info in (second, first, other):
+            loader.load(audio_info)
+        loader.commit()
+
+        helper = db_helpers.AlbumDBHelper(session)
+        albums = helper.get_albums_by_artist(10, 0)
+        assert [(a.name, a.artist_sort_name) for a in albums] == [
+            ("al1", "bob"),
+            ("al2", "cat"),
+        ]
+
+        db_loading.remove_missing_tracks([paths[0]], session)
+        session.expire_all()
+        albums = helper.get_albums_by_artist(10, 0)
+        assert [(a.name, a.artist_sort_name) for a in albums] == [
+            ("al2", "cat"),
+            ("al1", "zed"),
+        ]
+        assert [a.name for a in helper.get_albums_by_artist(1, 1)] == ["al1"]
+    engine.dispose()
+
+
+class ScanInterrupted(BaseException):
+    pass
+
+
+def test_full_rescan_keeps_created(db_uri: str, tmp_path):
+    # Copies that keep an old mtime, like cp -a, are still new to the library
+    for name in ["a", "b"]:
+        path = str(tmp_path / f"{name}.mp3")
+        write_file(path)
+        os.utime(path, ns=(10**18, 10**18))
+
+    engine = create_engine(db_uri)
+
+    def get_created() -> tuple[list[tuple[str, int]], list[int]]:
+        with Session(engine) as session:
+            tracks = session.exec(
+                select(db.Track.title, db.Track.created).order_by(db.Track.title)
+            ).all()
+            albums = session.exec(select(db.Album.created)).all()
+        return list(tracks), list(albums)
+
+    with patch.object(db, "engine", engine), patch.object(
+        db_loading, "parse_audio_file", side_effect=fake_parse_audio_file
+    ):
+        with patch.object(db, "current_timestamp", return_value=1_600_000_000):
+            db_loading.reload_directory(str(tmp_path))
+        created = get_created()
+        assert created == (
+            [("parsed a.mp3", 1_600_000_000), ("parsed b.mp3", 1_600_000_000)],
+            [1_600_000_000],
+        )
+
+        write_file(str(tmp_path / "c.mp3"))
+        with patch.object(db, "current_timestamp", return_value=1_700_000_000):
+            db_loading.reload_directory(str(tmp_path))
+        assert get_created() == (
+            [*created[0], ("parsed c.mp3", 1_700_000_000)],
+            created[1],
+        )
+    engine.dispose()
+
+
+def test_full_rescan_is_not_resumed(db_uri: str, tmp_path, caplog):
+    write_file(str(tmp_path / "a.mp3"))
+    engine = create_engine(db_uri)
+    get_known_files = MagicMock(side_effect=db_loading.get_known_files)
+    with patch.object(db, "engine", engine), patch.object(
+        db_loading, "parse_audio_file", side_effect=fake_parse_audio_file
+    ), patch.object(db_loading, "get_known_files", get_known_files):
+        with caplog.at_level("INFO"):
+            db_loading.reload_directory(str(tmp_path))
+
+    assert "Resuming" not in caplog.text
+    get_known_files.assert_not_called()
+    with Session(engine) as session:
+        assert session.exec(select(db.ScanCheckpoint)).all() == []
+    engine.dispose()
+
+
+def test_full_rescan_keeps_favourites_of_same_titles(db_uri: str, tmp_path, caplog):
+    intro_1, intro_2, intro_3 = (str(tmp_path / f"{n}.mp3") for n in "123")
+    for path in [intro_1, intro_2, intro_3]:
+        write_file(path)
+
+    def parse_intro(file_path: str, file_mtime: int = 0) -> AudioInfo:
+        return make_audio_info(file_path, "Intro", file_mtime)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        session.add(db.User(login="admin", password="admin", avatar=""))
+        for path in [intro_1, intro_2, intro_3]:
+            load_audio_data(parse_intro(path), session)
+        for path in [intro_1, intro_2]:
+            track = session.exec(select(db.Track).where(db.Track.file_path == path))
+            session.add(
+                db.FavouriteTrack(
+                    user_id=1, track_id=track.one().id, added_at="2024-01-01"
+                )
+            )
+        session.commit()
+    os.remove(intro_1)
+
+    with patch.object(db, "engine", engine), patch.object(
+        db_loading, "parse_audio_file", side_effect=parse_intro
+    ):
+        # The favourite of the deleted file is skipped instead of failing the scan
+        with caplog.at_level("WARNING"):
+            db_loading.reload_directory(str(tmp_path))
+
+    assert intro_1 in caplog.text
+    with Session(engine) as session:
+        assert session.exec(select(db.ScanCheckpoint)).all() == []
+        favourite = session.exec(select(db.FavouriteTrack)).one()
+        assert favourite.track.file_path == intro_2
+    engine.dispose()
+
+
+def test_interrupted_scan_resumes(db_uri: str, tmp_path):
+    for name in ["a", "b", "c", "d"]:
+        write_file(str(tmp_path / f"{name}.mp3"))
+    parsed: list[str] = []
+
+    def parse_until_crash(file_path: str, file_mtime: int = 0) -> AudioInfo:
+        if len(parsed) == 3:
+            raise ScanInterrupted()
+        parsed.append(file_path)
+        return fake_parse_audio_file(file_path, file_mtime)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        session.add(db.User(login="admin", password="admin", avatar=""))
+        session.commit()
+    starred_data = [(1, [(str(tmp_path / "a.mp3"), "2024-01-01")], [], [], [])]
+
+    with patch.object(db, "engine", engine), patch.object(
+        db_loading, "LibraryLoader", partial(db_loading.LibraryLoader, batch_size=2)
+    ):
+        with patch.object(
+            db_loading, "parse_audio_file", side_effect=parse_until_crash
+        ), pytest.raises(ScanInterrupted):
+            db_loading.scan_and_load(str(tmp_path), starred_data)
+
+        migrations.init_db()
+        with Session(engine) as session:
+            assert len(session.exec(select(db.Track)).all()) == 2
+            checkpoint = session.exec(select(db.ScanCheckpoint)).one()
+            assert checkpoint.loaded_files == 2
+            assert checkpoint.last_file_path == parsed[1]
+
+        with patch.object(
+            db_loading, "parse_audio_file", side_effect=fake_parse_audio_file
+        ) as parse_mock:
+            db_loading.scan_and_load(str(tmp_path))
+        assert len(parse_mock.call_args_list) == 2
+
+        with Session(engine) as session:
+            assert session.exec(select(db.ScanCheckpoint)).all() == []
+            titles = session.exec(select(db.Track.title)).all()
+            assert sorted(titles) == [f"parsed {n}.mp3" for n in "abcd"]
+            favourite = session.exec(select(db.FavouriteTrack)).one()
+            assert favourite.track.title == "parsed a.mp3"
+    engine.dispose()
+
+
+def test_covers_are_deduplicated(db_uri: str, tmp_path):
+    file_path = str(tmp_path / "t.mp3")
+    write_file(file_path)
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        loader = db_loading.LibraryLoader(session)
+        for i, cover in enumerate([b"cover1", b"cover1", b"cover2"]):
+            audio_info = make_audio_info(file_path, f"track{i}")
+            audio_info.file_path = f"tracks/t{i}.mp3"
+            audio_info.album = "al1" if i < 2 else "al2"
+            audio_info.cover, audio_info.cover_type = cover, "jpeg"
+            loader.load(audio_info)
+        loader.commit()
+
+        covers = {c.id: c.data for c in session.exec(select(db.Cover))}
+        assert sorted(covers.values()) == [b"cover1", b"cover2"]
+        tracks = session.exec(select(db.Track).order_by(db.Track.id)).all()
+        assert tracks[0].cover_id == tracks[1].cover_id == tracks[0].album.cover_id
+        assert covers[tracks[2].cover_id] == b"cover2"
+
+        db_loading.remove_missing_tracks(["tracks/t2.mp3"], session)
+        assert [c.data for c in session.exec(select(db.Cover))] == [b"cover1"]
+    engine.dispose()
+
+
+def test_reload_track_removes_old_tags(db_uri: str, tmp_path):
+    file_path = str(tmp_path / "t.mp3")
+    write_file(file_path)
+
+    def parse_retagged(file_path: str, file_mtime: int = 0) -> AudioInfo:
+        audio_info = make_audio_info(file_path, "retagged", file_mtime)
+        audio_info.artists = ["ar2"]
+        audio_info.album_artist = "ar2"
+        audio_info.album = "al2"
+        audio_info.genres = ["g2"]
+        return audio_info
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session, patch.object(
+        db_loading, "parse_audio_file", side_effect=parse_retagged
+    ):
+        load_audio_data(make_audio_info(file_path, "old"), session)
+        db_loading.reload_track(file_path, session)
+
+        assert session.exec(select(db.Track.title)).all() == ["retagged"]
+        assert session.exec(select(db.Artist.name)).all() == ["ar2"]
+        assert session.exec(select(db.Album.name)).all() == ["al2"]
+        assert session.exec(select(db.Genre.name)).all() == ["g2"]
+    engine.dispose()
+
+
+def test_background_scan_runs_once(db_uri: str, tmp_path):
+    write_file(str(tmp_path / "1.mp3"))
+    engine = create_engine(db_uri)
+    with patch.object(db, "engine", engine), patch.object(
+        db_loading, "parse_audio_file", side_effect=fake_parse_audio_file
+    ):
+        with db_loading.scan_lock:
+            assert not db_loading.start_background_scan(str(tmp_path))
+            assert not db_loading.scanStatus["scanning"]
+
+        assert db_loading.start_background_scan(str(tmp_path))
+        # The reload waits for the scan instead of writing the library alongside it
+        db_loading.reload_files([], [])
+        assert not db_loading.scanStatus["scanning"]
+
+    with Session(engine) as session:
+        assert session.exec(select(db.Track.title)).all() == ["parsed 1.mp3"]
+    engine.dispose()
@@ -0,0 +1,47 @@
+from sqlmodel import Session
+
+from src.app import database as db
+from src.app.fuzzy_search import FuzzyIndex
+from src.app.service_layer import SearchService
+
+from tests.integration.fixtures import session
+
+
+def add_artists(session: Session, names: list[str]) -> None:
+    for name in names:
+        session.add(db.Artist(name=name))
+    session.commit()
+
+
+def test_fuzzy_index(session: Session):
+    add_artists(session, ["Metallica", "Megadeth", "Земфира", "Metallica"])
+    index = FuzzyIndex()
+    # Searches never build the index themselves
+    assert index.find(db.Artist, "metalica", 10, 0) == []
+
+    index.rebuild(session)
+    assert index.find(db.Artist, "metalica", 10, 0) == [1, 4]
+    assert index.find(db.Artist, "metalica", 1, 1) == [4]
+    assert index.find(db.Artist, "ЗИМФИРА", 10, 0) == [3]
+    assert index.find(db.Artist, "slayer", 10, 0) == []
+
+    add_artists(session, ["Slayer"])
+    assert index.find(db.Artist, "slayer", 10, 0) == []
+    index.rebuild(session)
+    assert index.find(db.Artist, "slayr", 10, 0) == [5]
+
+
+def test_search_modes(session: Session, monkeypatch):
+    add_artists(session, ["Metallica", "Megadeth"])
+    index = FuzzyIndex()
+    index.rebuild(session)
+    monkeypatch.setattr("src.app.service_layer.fuzzy_index", index)
+
+    def artists(mode: str, query: str) -> list[str]:
+        result = SearchService(session, mode).search2(query, 10, 0, 0, 0, 0, 0)
+        return [artist.name for artist in result[0]]
+
+    assert artists("exact", "metalica") == []
+    assert artists("auto", "metalica") == ["Metallica"]
+    assert artists("auto", "mega") == ["Megadeth"]
+    assert artists("fuzzy", "mega") == []
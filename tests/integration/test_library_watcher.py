@@ -0,0 +1,152 @@
+import os
+import shutil
+import time
+from typing import Callable
+from unittest.mock import patch
+
+from mutagen.id3 import TALB, TCON, TPE1
+from mutagen.mp3 import MP3
+from sqlalchemy import create_engine
+from sqlmodel import Session, select
+
+from src.app import database as db
+from src.app import db_loading
+from src.app.library_watcher import LibraryWatcher
+
+from tests.integration.fixtures import db_uri, write_mp3
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_reload_files(db_uri: str, tmp_path):
+    album = tmp_path / "album"
+    os.makedirs(album)
+    write_mp3(str(album / "1.mp3"), "track1")
+    write_mp3(str(album / "2.mp3"), "track2")
+    single = str(tmp_path / "single.mp3")
+    write_mp3(single, "single")
+
+    engine = create_engine(db_uri)
+    with patch.object(db, "engine", engine):
+        db_loading.reload_files([str(album), single], [])
+        with Session(engine) as session:
+            titles = session.exec(select(db.Track.title)).all()
+            assert sorted(titles) == ["single", "track1", "track2"]
+
+        shutil.rmtree(album)
+        db_loading.reload_files([], [str(album)])
+        with Session(engine) as session:
+            assert session.exec(select(db.Track.title)).all() == ["single"]
+            album_row = session.exec(select(db.Album)).one()
+            assert album_row.total_tracks == 1
+    engine.dispose()
+
+
+def test_reload_files_removes_retagged_album(db_uri: str, tmp_path):
+    path = str(tmp_path / "1.mp3")
+    write_mp3(path, "track1")
+
+    def set_tags(album: str, artist: str, genre: str) -> None:
+        audio = MP3(path)
+        audio["TALB"] = TALB(text=[album])
+        audio["TPE1"] = TPE1(text=[artist])
+        audio["TCON"] = TCON(text=[genre])
+        audio.save()
+
+    engine = create_engine(db_uri)
+    with patch.object(db, "engine", engine):
+        set_tags("al1", "ar1", "g1")
+        db_loading.reload_files([path], [])
+        set_tags("al2", "ar2", "g2")
+        db_loading.reload_files([path], [])
+
+    with Session(engine) as session:
+        albums = session.exec(select(db.Album.name, db.Album.total_tracks)).all()
+        assert albums == [("al2", 1)]
+        assert session.exec(select(db.Artist.name)).all() == ["ar2"]
+        assert session.exec(select(db.Genre.name)).all() == ["g2"]
+    engine.dispose()
+
+
+def test_library_watcher(db_uri: str, tmp_path):
+    engine = create_engine(db_uri)
+
+    def titles() -> list[str]:
+        with Session(engine) as session:
+            return sorted(session.exec(select(db.Track.title)).all())
+
+    with patch.object(db, "engine", engine):
+        watcher = LibraryWatcher(str(tmp_path), debounce=0.2)
+        watcher.start()
+        try:
+            write_mp3(str(tmp_path / "1.mp3"), "track1")
+            write_mp3(str(tmp_path / "2.mp3"), "track2")
+            assert wait_until(lambda: titles() == ["track1", "track2"])
+
+            os.rename(tmp_path / "2.mp3", tmp_path / "3.mp3")
+            os.remove(tmp_path / "1.mp3")
+            assert wait_until(lambda: titles() == ["track2"])
+            with Session(engine) as session:
+                track = session.exec(select(db.Track)).one()
+                assert track.file_path == str(tmp_path / "3.mp3")
+        finally:
+            watcher.stop()
+    engine.dispose()
+
+
+def test_library_watcher_keeps_recreated_track(db_uri: str, tmp_path):
+    engine = create_engine(db_uri)
+
+    def tracks() -> list[tuple[int, str]]:
+        with Session(engine) as session:
+            return list(session.exec(select(db.Track.id, db.Track.title)).all())
+
+    with patch.object(db, "engine", engine):
+        watcher = LibraryWatcher(str(tmp_path), debounce=0.5)
+        watcher.start()
+        try:
+            write_mp3(str(tmp_path / "1.mp3"), "track1")
+            assert wait_until(lambda: len(tracks()) == 1)
+            write_mp3(str(tmp_path / "2.mp3"), "track2")
+            assert wait_until(lambda: len(tracks()) == 2)
+            track_ids = dict((title, id) for id, title in tracks())
+
+            # Rewritten by deleting and re-creating the file, as re-taggers do
+            os.remove(tmp_path / "1.mp3")
+            write_mp3(str(tmp_path / "1.mp3"), "retagged")
+            assert wait_until(
+                lambda: sorted(tracks())
+                == [(track_ids["track1"], "retagged"), (track_ids["track2"], "track2")]
+            )
+        finally:
+            watcher.stop()
+    engine.dispose()
+
+
+def test_library_watcher_retries_failed_changes(tmp_path):
+    watcher = LibraryWatcher(str(tmp_path), debounce=0.1)
+    calls: list[tuple[set[str], set[str]]] = []
+
+    def reload_files(changed: set[str], removed: set[str]) -> None:
+        calls.append((set(changed), set(removed)))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    with patch.object(db_loading, "reload_files", reload_files):
+        watcher.worker.start()
+        try:
+            watcher.add_changes(changed=["a.mp3"], removed=["b.mp3"])
+            assert wait_until(lambda: len(calls) == 2)
+        finally:
+            with watcher.condition:
+                watcher.stopped = True
+                watcher.condition.notify()
+            watcher.worker.join()
+    assert calls == [({"a.mp3"}, {"b.mp3"}), ({"a.mp3"}, {"b.mp3"})]
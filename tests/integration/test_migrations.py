@@ -0,0 +1,192 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlmodel import Session, SQLModel, select
+
+from src.app import database as db
+from src.app import db_helpers, migrations
+
+
+UNVERSIONED_TABLES = """
+CREATE TABLE "Albums" (
+    id INTEGER NOT NULL,
+    name VARCHAR NOT NULL,
+    album_artist_id INTEGER,
+    total_tracks INTEGER NOT NULL,
+    year VARCHAR,
+    cover BLOB,
+    play_count INTEGER NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(album_artist_id) REFERENCES "Artists" (id)
+);
+CREATE TABLE "Tracks" (
+    id INTEGER NOT NULL,
+    file_path VARCHAR NOT NULL,
+    file_size INTEGER NOT NULL,
+    type VARCHAR NOT NULL,
+    title VARCHAR NOT NULL,
+    album_id INTEGER,
+    album_artist_id INTEGER,
+    album_position INTEGER,
+    year VARCHAR,
+    plays_count INTEGER NOT NULL,
+    cover BLOB NOT NULL,
+    cover_type VARCHAR NOT NULL,
+    bit_rate INTEGER NOT NULL,
+    bits_per_sample INTEGER NOT NULL,
+    sample_rate INTEGER NOT NULL,
+    channels INTEGER NOT NULL,
+    duration INTEGER NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(album_id) REFERENCES "Albums" (id),
+    FOREIGN KEY(album_artist_id) REFERENCES "Artists" (id)
+);
+INSERT INTO "Albums" VALUES (1, 'al1', NULL, 1, '2020', x'00', 0);
+INSERT INTO "Tracks" VALUES (1, 'tracks/t1.mp3', 10, 'audio/mpeg', 'track1', 1,
+    NULL, 1, '2020', 5, x'00', 'jpeg', 128000, 16, 44100, 2, 60);
+"""
+
+
+@pytest.fixture
+def db_file():
+    file = tempfile.NamedTemporaryFile(delete=False)
+    file.close()
+    yield file.name
+    os.remove(file.name)
+
+
+def test_migrate_creates_schema(db_file: str):
+    engine = create_engine(f"sqlite:///{db_file}")
+    migrations.migrate(engine)
+
+    with engine.connect() as connection:
+        assert migrations.get_schema_version(connection) == migrations.SCHEMA_VERSION
+    tables = set(inspect(engine).get_table_names())
+    assert set(SQLModel.metadata.tables) <= tables
+    assert {"TracksSearch", "AlbumsSearch", "ArtistsSearch"} <= tables
+
+    with Session(engine) as session:
+        session.add(db.User(login="admin", password="admin", avatar=""))
+        session.commit()
+
+    migrations.migrate(engine)
+    with Session(engine) as session:
+        assert [u.login for u in session.exec(select(db.User))] == ["admin"]
+    engine.dispose()
+
+
+def test_migrate_unversioned_schema(db_file: str):
+    engine = create_engine(f"sqlite:///{db_file}")
+    with engine.begin() as connection:
+        for statement in UNVERSIONED_TABLES.split(";"):
+            if statement.strip():
+                connection.exec_driver_sql(statement)
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in ("Tracks", "Albums", "Covers", "ScanCheckpoints"):
+                table.create(connection)
+        connection.exec_driver_sql("INSERT INTO Users VALUES (1, 'admin', 'admin', '')")
+        connection.exec_driver_sql(
+            "INSERT INTO Favourite_Tracks VALUES (1, 1, '2024-01-01')"
+        )
+
+    migrations.migrate(engine)
+
+    with engine.connect() as connection:
+        assert migrations.get_schema_version(connection) == migrations.SCHEMA_VERSION
+    columns = {c["name"] for c in inspect(engine).get_columns("Tracks")}
+    assert {"file_mtime", "cover_id", "cover_art_hash"} <= columns
+    assert not {"cover", "cover_type"} & columns
+    assert "cover" not in {c["name"] for c in inspect(engine).get_columns("Albums")}
+    assert inspect(engine).has_table("Covers")
+    indexes = {i["name"] for i in inspect(engine).get_indexes("Tracks")}
+    assert {"ix_Tracks_file_path", "ix_Tracks_album_id"} <= indexes
+
+    with Session(engine) as session:
+        track = session.exec(select(db.Track)).one()
+        assert (track.title, track.plays_count, track.file_mtime) == ("track1", 5, 0)
+        assert track.album.artist_sort_name == ""
+        favourite = session.exec(select(db.FavouriteTrack)).one()
+        assert favourite.track_id == track.id
+        assert db_helpers.TrackDBHelper(session).search_tracks("ACK", 10, 0) == [track]
+    engine.dispose()
+
+
+def test_migrate_drops_redundant_album_indexes(db_file: str):
+    engine = create_engine(f"sqlite:///{db_file}")
+    with engine.begin() as connection:
+        SQLModel.metadata.create_all(connection)
+        connection.exec_driver_sql('CREATE INDEX "ix_Albums_year" ON "Albums" (year)')
+        connection.exec_driver_sql(
+            'CREATE INDEX "ix_Albums_play_count" ON "Albums" (play_count)'
+        )
+        migrations.set_schema_version(
+            connection,
+            migrations.MIGRATIONS.index(migrations.drop_redundant_album_indexes),
+        )
+
+    migrations.migrate(engine)
+
+    indexes = {i["name"] for i in inspect(engine).get_indexes("Albums")}
+    assert not {"ix_Albums_year", "ix_Albums_play_count"} & indexes
+    assert {"ix_Albums_year_name", "ix_Albums_play_count_desc_name"} <= indexes
+    engine.dispose()
+
+
+def test_migrate_merges_duplicate_tracks(db_file: str):
+    engine = create_engine(f"sqlite:///{db_file}")
+    with engine.begin() as connection:
+        SQLModel.metadata.create_all(connection)
+        connection.exec_driver_sql('DROP INDEX "ix_Tracks_file_path"')
+        connection.exec_driver_sql(
+            'CREATE INDEX "ix_Tracks_file_path" ON "Tracks" (file_path)'
+        )
+        migrations.set_schema_version(
+            connection, migrations.MIGRATIONS.index(migrations.add_unique_track_paths)
+        )
+
+    with Session(engine) as session:
+        session.add(db.Album(id=1, name="al1", album_artist_id=None, total_tracks=3))
+        for id, path, plays in [(1, "a.mp3", 1), (2, "a.mp3", 2), (3, "b.mp3", 0)]:
+            session.add(
+                db.Track(
+                    id=id,
+                    file_path=path,
+                    file_size=10,
+                    type="audio/mpeg",
+                    title=path,
+                    album_id=1,
+                    album_artist_id=None,
+                    album_position=id,
+                    year=None,
+                    plays_count=plays,
+                    bit_rate=128000,
+                    bits_per_sample=16,
+                    sample_rate=44100,
+                    channels=2,
+                    duration=60,
+                )
+            )
+        session.add(db.User(id=1, login="admin", password="admin", avatar=""))
+        session.add(
+            db.Playlist(id=1, name="p", user_id=1, total_tracks=2, create_date="")
+        )
+        session.add(db.PlaylistTrack(playlist_id=1, track_id=1, added_at=""))
+        session.add(db.PlaylistTrack(playlist_id=1, track_id=2, added_at=""))
+        session.add(db.FavouriteTrack(user_id=1, track_id=2, added_at=""))
+        session.commit()
+
+    migrations.migrate(engine)
+
+    indexes = {i["name"]: i for i in inspect(engine).get_indexes("Tracks")}
+    assert indexes["ix_Tracks_file_path"]["unique"]
+    with Session(engine) as session:
+        tracks = session.exec(select(db.Track).order_by(db.Track.id)).all()
+        assert [(t.id, t.plays_count) for t in tracks] == [(1, 3), (3, 0)]
+        assert session.exec(select(db.Album)).one().total_tracks == 2
+        assert session.exec(select(db.Playlist)).one().total_tracks == 1
+        playlist_tracks = session.exec(select(db.PlaylistTrack.track_id)).all()
+        assert playlist_tracks == [1]
+        assert session.exec(select(db.FavouriteTrack.track_id)).all() == [1]
+    engine.dispose()
@@ -0,0 +1,138 @@
+import base64
+import json
+from typing import Any, Callable, Sequence
+
+import pytest
+from sqlmodel import Session, select
+
+from src.app import database as db
+from src.app import db_helpers
+from src.app.db_loading import AudioInfo
+
+from tests.integration.fixtures import fill_library, session
+
+
+def set_tags(i: int, audio_info: AudioInfo) -> None:
+    audio_info.album = f"album{i}"
+    audio_info.album_artist = f"artist{i % 2}"
+    audio_info.artists = [f"artist{i % 2}"]
+    audio_info.genres = ["rock"]
+    audio_info.year = None if i % 5 == 0 else 2000 + i % 2
+
+
+def fill_albums(session: Session) -> int:
+    # Albums sharing artists, years, play counts and timestamps, so pages split ties
+    fill_library(session, 12, set_tags)
+    for album in session.exec(select(db.Album)):
+        album.play_count = album.id % 2
+        album.last_played = None if album.id % 4 == 0 else 1000 + album.id % 3
+    session.commit()
+    artist = session.exec(select(db.Artist).where(db.Artist.name == "artist0")).one()
+    return artist.id
+
+
+PagedCall = Callable[[db_helpers.AlbumDBHelper, int, int, int, Any], Sequence[db.Album]]
+
+LISTS: dict[str, tuple[Sequence[db_helpers.SortColumn], PagedCall]] = {
+    "by_name": (
+        db_helpers.ALBUMS_BY_NAME,
+        lambda h, _, size, offset, after: h.get_albums_by_name(size, offset, after),
+    ),
+    "by_artist": (
+        db_helpers.ALBUMS_BY_ARTIST,
+        lambda h, _, size, offset, after: h.get_albums_by_artist(size, offset, after),
+    ),
+    "by_year": (
+        db_helpers.ALBUMS_BY_YEAR,
+        lambda h, _, size, offset, after: h.get_sorted_by_year_albums(
+            "2000", "2001", size, offset, False, after
+        ),
+    ),
+    "by_year_reversed": (
+        db_helpers.ALBUMS_BY_YEAR_REVERSED,
+        lambda h, _, size, offset, after: h.get_sorted_by_year_albums(
+            "2000", "2001", size, offset, True, after
+        ),
+    ),
+    "by_genre": (
+        db_helpers.ALBUMS_BY_NAME,
+        lambda h, _, size, offset, after: h.get_albums_by_genre(
+            "rock", size, offset, after
+        ),
+    ),
+    "by_frequency": (
+        db_helpers.ALBUMS_BY_FREQUENCY,
+        lambda h, _, size, offset, after: h.get_sorted_albums_by_frequency(
+            size, offset, after
+        ),
+    ),
+    "newest": (
+        db_helpers.ALBUMS_BY_CREATED,
+        lambda h, _, size, offset, after: h.get_newest_albums(size, offset, after),
+    ),
+    "recent": (
+        db_helpers.ALBUMS_BY_LAST_PLAYED,
+        lambda h, _, size, offset, after: h.get_recently_played_albums(
+            size, offset, after
+        ),
+    ),
+    "artist_albums": (
+        db_helpers.ARTIST_ALBUMS,
+        lambda h, artist_id, size, offset, after: h.get_sorted_artist_albums(
+            artist_id, size, offset, after
+        ),
+    ),
+}
+
+
+@pytest.mark.parametrize("name", LISTS)
+def test_cursor_pages_match_offset_pages(name: str, session: Session):
+    artist_id = fill_albums(session)
+    order, get_page = LISTS[name]
+    helper = db_helpers.AlbumDBHelper(session)
+
+    expected = [album.id for album in get_page(helper, artist_id, 100, 0, None)]
+    assert len(expected) > 3
+
+    ids: list[int] = []
+    after = None
+    while True:
+        page = get_page(helper, artist_id, 3, 0, after)
+        ids.extend(album.id for album in page)
+        if len(page) < 3:
+            break
+        cursor = db_helpers.encode_cursor(name, order, page[-1])
+        after = db_helpers.decode_cursor(cursor, name)
+    assert ids == expected
+
+    # An offset counts from the cursor
+    first = get_page(helper, artist_id, 1, 0, None)[0]
+    after = db_helpers.decode_cursor(db_helpers.encode_cursor(name, order, first), name)
+    page = get_page(helper, artist_id, 2, 1, after)
+    assert [album.id for album in page] == expected[2:4]
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        db_helpers.decode_cursor("not a cursor", "by_name")
+    with pytest.raises(ValueError):
+        db_helpers.decode_cursor("", "by_name")
+    for key in [[{}, 1], [10**20, 1], [-(2**63) - 1, 1], [True, 1]]:
+        data = {"list": "by_name", "key": key}
+        cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        with pytest.raises(ValueError):
+            db_helpers.decode_cursor(cursor, "by_name")
+    # Cursors from before lists were named
+    cursor = base64.urlsafe_b64encode(json.dumps(["album1", 1]).encode()).decode()
+    with pytest.raises(ValueError):
+        db_helpers.decode_cursor(cursor, "by_name")
+
+
+def test_cursor_of_another_list(session: Session):
+    fill_albums(session)
+    album = db_helpers.AlbumDBHelper(session).get_albums_by_name(1, 0)[0]
+    # Both orders have two columns, so only the list name tells them apart
+    cursor = db_helpers.encode_cursor("by_name", db_helpers.ALBUMS_BY_NAME, album)
+    assert db_helpers.decode_cursor(cursor, "by_name") == [album.name, album.id]
+    with pytest.raises(ValueError):
+        db_helpers.decode_cursor(cursor, "by_artist")
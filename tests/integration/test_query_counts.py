@@ -0,0 +1,109 @@
+from typing import AsyncIterator, Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, create_engine, event
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.app import database as db
+from src.app import db_helpers
+from src.app.app import app
+from src.app.db_loading import AudioInfo
+from src.app.fuzzy_search import FuzzyIndex
+from src.app.service_layer import create_user
+
+from tests.integration.fixtures import db_uri, fill_library
+
+
+ENDPOINTS = [
+    "getAlbum?id=1",
+    "getAlbumList2?type=alphabeticalByName&size=500",
+    "getAlbumList2?type=frequent&size=500",
+    "getSongsByGenre?genre=rock&count=500",
+    "search3?query=track&songCount=500&albumCount=500&artistCount=500",
+    "search3?query=",
+    "getStarred2?",
+    "getPlaylist?id=1",
+    "getPlaylists?",
+    "getArtist?id=1",
+    "getArtists?",
+    "getIndexes?",
+]
+
+
+def set_tags(i: int, audio_info: AudioInfo) -> None:
+    audio_info.album = f"album{i // 2}"
+    audio_info.artists = ["artist", f"artist{i % 3}"]
+    audio_info.album_artist = "artist"
+    audio_info.genres = ["rock", f"genre{i % 4}"]
+
+
+def fill_user_library(engine: Engine, track_count: int) -> None:
+    with Session(engine) as session:
+        create_user(session, "admin", "admin")
+        fill_library(session, track_count, set_tags)
+
+        user = db_helpers.UserDBHelper(session).get_user_by_username("admin")
+        assert user is not None
+        favourites = db_helpers.FavouriteDBHelper(session)
+        for id in range(1, track_count + 1):
+            favourites.star_track(id, user.id)
+        for id in range(1, track_count // 2 + 1):
+            favourites.star_album(id, user.id)
+        db_helpers.PlaylistDBHelper(session).create_playlist(
+            "playlist", list(range(1, track_count + 1)), user.id
+        )
+
+
+def count_queries(db_uri: str, track_count: int, endpoint: str, monkeypatch) -> int:
+    engine = create_engine(db_uri)
+    async_engine = db.create_async_db_engine(db_uri)
+    index = FuzzyIndex()
+    monkeypatch.setattr("src.app.service_layer.fuzzy_index", index)
+    fill_user_library(engine, track_count)
+    with Session(engine) as session:
+        index.rebuild(session)
+
+    def get_session() -> Iterator[Session]:
+        with Session(engine) as session:
+            yield session
+
+    async def get_async_session() -> AsyncIterator[AsyncSession]:
+        async with AsyncSession(async_engine) as session:
+            yield session
+
+    statements: list[str] = []
+    for listened in (engine, async_engine.sync_engine):
+        event.listen(
+            listened,
+            "before_cursor_execute",
+            lambda connection, cursor, statement, *args: statements.append(statement),
+        )
+    monkeypatch.setitem(app.dependency_overrides, db.get_session, get_session)
+    monkeypatch.setitem(
+        app.dependency_overrides, db.get_async_session, get_async_session
+    )
+    try:
+        with TestClient(app) as client:
+            response = client.get(f"/rest/{endpoint}&u=admin&p=admin")
+            client.portal.call(async_engine.dispose)
+    finally:
+        engine.dispose()
+    assert response.status_code == 200
+    assert response.json()["subsonic-response"]["status"] == "ok"
+    return len(statements)
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_query_count_does_not_grow_with_library(
+    endpoint: str, db_uri: str, tmp_path, monkeypatch
+):
+    larger_db_uri = f"sqlite:///{tmp_path / 'larger.db'}"
+    engine = create_engine(larger_db_uri)
+    db.SQLModel.metadata.create_all(engine)
+    engine.dispose()
+
+    assert count_queries(db_uri, 4, endpoint, monkeypatch) == count_queries(
+        larger_db_uri, 16, endpoint, monkeypatch
+    )
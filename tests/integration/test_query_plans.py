@@ -0,0 +1,190 @@
+from typing import Any, Callable
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+
+from src.app import database as db
+from src.app import db_helpers
+from src.app.db_loading import AudioInfo
+
+from tests.integration.fixtures import fill_library, session
+
+
+# Queries that read a whole table by design, with the tables they may scan
+FULL_SCANS = {
+    "get_all_artists": {"Artists"},
+    "get_artists": {"Artists"},
+    "get_all_albums": {"Albums"},
+    "get_albums": {"Albums"},
+    "get_all_tracks": {"Tracks"},
+    "get_tracks": {"Tracks"},
+    "get_genre_stats": {"Genres"},
+    "get_all_playlists_of_all_users": {"Playlists"},
+    # LIKE on lower(name) can not use an index, genres are few
+    "get_albums_by_genre": {"Genres"},
+}
+
+HELPER_CALLS: dict[str, Callable[[Session], Any]] = {
+    "get_all_artists": lambda s: db_helpers.ArtistDBHelper(s).get_all_artists("a"),
+    "get_artists": lambda s: db_helpers.ArtistDBHelper(s).get_artists(10, 0, "a"),
+    "search_artists": lambda s: db_helpers.ArtistDBHelper(s).search_artists(
+        "art", 10, 0
+    ),
+    "get_artist_by_id": lambda s: db_helpers.ArtistDBHelper(s).get_artist_by_id(1),
+    "get_all_albums": lambda s: db_helpers.AlbumDBHelper(s).get_all_albums("a"),
+    "get_albums": lambda s: db_helpers.AlbumDBHelper(s).get_albums(10, 0, "a"),
+    "search_albums": lambda s: db_helpers.AlbumDBHelper(s).search_albums("alb", 10, 0),
+    "get_album_by_id": lambda s: db_helpers.AlbumDBHelper(s).get_album_by_id(1),
+    "get_random_albums": lambda s: db_helpers.AlbumDBHelper(s).get_random_albums(2),
+    "get_albums_by_name": lambda s: db_helpers.AlbumDBHelper(s).get_albums_by_name(
+        10, 0
+    ),
+    "get_first_track": lambda s: db_helpers.AlbumDBHelper(s).get_first_track(1),
+    "get_albums_by_artist": lambda s: db_helpers.AlbumDBHelper(s).get_albums_by_artist(
+        10, 0
+    ),
+    "get_sorted_artist_albums": lambda s: db_helpers.AlbumDBHelper(
+        s
+    ).get_sorted_artist_albums(1, 10, 0),
+    "get_sorted_by_year_albums": lambda s: db_helpers.AlbumDBHelper(
+        s
+    ).get_sorted_by_year_albums("2000", "2020", 10, 0),
+    "get_albums_by_genre": lambda s: db_helpers.AlbumDBHelper(s).get_albums_by_genre(
+        "rock", 10, 0
+    ),
+    "get_sorted_albums_by_frequency": lambda s: db_helpers.AlbumDBHelper(
+        s
+    ).get_sorted_albums_by_frequency(10, 0),
+    "get_newest_albums": lambda s: db_helpers.AlbumDBHelper(s).get_newest_albums(
+        10, 0, [2000000000, 5]
+    ),
+    "get_recently_played_albums": lambda s: db_helpers.AlbumDBHelper(
+        s
+    ).get_recently_played_albums(10, 0, [2000000000, 5]),
+    "get_all_tracks": lambda s: db_helpers.TrackDBHelper(s).get_all_tracks("t"),
+    "get_tracks": lambda s: db_helpers.TrackDBHelper(s).get_tracks(10, 0, "t"),
+    "search_tracks": lambda s: db_helpers.TrackDBHelper(s).search_tracks("tra", 10, 0),
+    "get_track_by_id": lambda s: db_helpers.TrackDBHelper(s).get_track_by_id(1),
+    "get_track_album_artist": lambda s: db_helpers.TrackDBHelper(s).get_album_artist(2),
+    "get_random_tracks": lambda s: db_helpers.TrackDBHelper(s).get_random_tracks(
+        2, "Rock", "2000", "2020"
+    ),
+    "get_tracks_by_genre_name": lambda s: db_helpers.TrackDBHelper(
+        s
+    ).get_tracks_by_genre_name("Rock", 10, 1),
+    "get_genre_stats": lambda s: db_helpers.GenresDBHelper(s).get_genre_stats(),
+    "star_track": lambda s: db_helpers.FavouriteDBHelper(s).star_track(2, 1),
+    "star_album": lambda s: db_helpers.FavouriteDBHelper(s).star_album(1, 1),
+    "star_artist": lambda s: db_helpers.FavouriteDBHelper(s).star_artist(1, 1),
+    "star_playlist": lambda s: db_helpers.FavouriteDBHelper(s).star_playlist(1, 1),
+    "unstar_track": lambda s: db_helpers.FavouriteDBHelper(s).unstar_track(1, 1),
+    "unstar_album": lambda s: db_helpers.FavouriteDBHelper(s).unstar_album(1, 1),
+    "unstar_artist": lambda s: db_helpers.FavouriteDBHelper(s).unstar_artist(1, 1),
+    "unstar_playlist": lambda s: db_helpers.FavouriteDBHelper(s).unstar_playlist(1, 1),
+    "get_starred_tracks": lambda s: db_helpers.FavouriteDBHelper(s).get_starred_tracks(
+        1
+    ),
+    "get_starred_artists": lambda s: db_helpers.FavouriteDBHelper(
+        s
+    ).get_starred_artists(1),
+    "get_starred_albums": lambda s: db_helpers.FavouriteDBHelper(s).get_starred_albums(
+        1
+    ),
+    "get_starred_playlists": lambda s: db_helpers.FavouriteDBHelper(
+        s
+    ).get_starred_playlists(1),
+    "create_playlist": lambda s: db_helpers.PlaylistDBHelper(s).create_playlist(
+        "new", [1, 2], 1
+    ),
+    "update_playlist": lambda s: db_helpers.PlaylistDBHelper(s).update_playlist(
+        1, "renamed", [2], [1]
+    ),
+    "delete_playlist": lambda s: db_helpers.PlaylistDBHelper(s).delete_playlist(2),
+    "get_playlist": lambda s: db_helpers.PlaylistDBHelper(s).get_playlist(1),
+    "get_all_playlists": lambda s: db_helpers.PlaylistDBHelper(s).get_all_playlists(
+        s.get(db.User, 1)
+    ),
+    "get_all_playlists_of_all_users": lambda s: db_helpers.PlaylistDBHelper(
+        s
+    ).get_all_playlists(None),
+    "get_user_by_username": lambda s: db_helpers.UserDBHelper(s).get_user_by_username(
+        "admin"
+    ),
+}
+
+
+def set_tags(i: int, audio_info: AudioInfo) -> None:
+    audio_info.album = "album"
+    audio_info.album_artist = "artist"
+    audio_info.artists = ["artist"]
+    audio_info.genres = ["Rock"]
+    audio_info.year = 2010
+
+
+def fill_user_library(session: Session) -> None:
+    session.add(db.User(id=1, login="admin", password="admin", avatar=""))
+    fill_library(session, 2, set_tags)
+    session.add(
+        db.Playlist(id=1, name="playlist", user_id=1, total_tracks=1, create_date="")
+    )
+    session.add(
+        db.Playlist(id=2, name="other", user_id=1, total_tracks=1, create_date="")
+    )
+    session.add(db.PlaylistTrack(playlist_id=1, track_id=1, added_at=""))
+    session.add(db.PlaylistTrack(playlist_id=2, track_id=2, added_at=""))
+    session.add(db.FavouriteTrack(user_id=1, track_id=1, added_at=""))
+    session.add(db.FavouriteAlbum(user_id=1, album_id=1, added_at=""))
+    session.add(db.FavouriteArtist(user_id=1, artist_id=1, added_at=""))
+    session.add(db.FavouritePlaylist(user_id=1, playlist_id=1, added_at=""))
+    session.commit()
+
+
+def get_full_scans(session: Session, statement: str, parameters: Any) -> set[str]:
+    """Tables read without an index by the statement."""
+    connection = session.connection()
+    plan = connection.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {statement}", parameters
+    ).all()
+    tables = set()
+    for row in plan:
+        detail = row[-1]
+        # "SCAN <table>" without "USING INDEX" visits every row of the table
+        if detail.startswith("SCAN ") and "INDEX" not in detail:
+            tables.add(detail.split()[1])
+    return tables
+
+
+def record_statements(session: Session, name: str) -> list[tuple[str, Any]]:
+    """Runs the helper call and returns the statements it executed."""
+    statements: list[tuple[str, Any]] = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters))
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        HELPER_CALLS[name](session)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert statements
+    return statements
+
+
+@pytest.mark.parametrize("name", HELPER_CALLS)
+def test_db_helpers_do_not_scan_tables(name: str, session: Session):
+    fill_user_library(session)
+    allowed = FULL_SCANS.get(name, set())
+    for statement, parameters in record_statements(session, name):
+        scanned = get_full_scans(session, statement, parameters) - allowed
+        assert not scanned, f"{name} scans {scanned}:\n{statement}"
+
+
+@pytest.mark.parametrize("name", HELPER_CALLS)
+def test_db_helpers_do_not_load_covers(name: str, session: Session):
+    # Cover images live in the Covers table and are read only by cover endpoints
+    fill_user_library(session)
+    for statement, _ in record_statements(session, name):
+        assert '"Covers"' not in statement, f"{name} loads covers:\n{statement}"
@@ -0,0 +1,48 @@
+from sqlmodel import Session
+
+from src.app import db_helpers
+from src.app.db_loading import AudioInfo
+
+from tests.integration.fixtures import fill_library, session
+
+
+def set_tags(i: int, audio_info: AudioInfo) -> None:
+    audio_info.album = f"album{i // 2}"
+    audio_info.year = 2000 + i
+    audio_info.genres = ["rock" if i % 2 else "pop"]
+
+
+def test_random_tracks(session: Session):
+    fill_library(session, 10, set_tags)
+    helper = db_helpers.TrackDBHelper(session)
+
+    seen: set[str] = set()
+    for _ in range(50):
+        titles = [track.title for track in helper.get_random_tracks(3)]
+        assert len(set(titles)) == 3
+        seen.update(titles)
+    assert len(seen) == 10
+
+    tracks = helper.get_random_tracks(20)
+    assert sorted(track.title for track in tracks) == [f"track{i}" for i in range(10)]
+    assert helper.get_random_tracks(0) == []
+
+
+def test_random_tracks_filters(session: Session):
+    fill_library(session, 10, set_tags)
+    helper = db_helpers.TrackDBHelper(session)
+
+    tracks = helper.get_random_tracks(20, "rock", "2002", "2007")
+    assert sorted(track.title for track in tracks) == ["track3", "track5", "track7"]
+    assert helper.get_random_tracks(20, from_year="2010") == []
+    assert len(helper.get_random_tracks(20, to_year="2001")) == 2
+    assert helper.get_random_tracks(20, "jazz") == []
+
+
+def test_random_albums(session: Session):
+    fill_library(session, 10, set_tags)
+    helper = db_helpers.AlbumDBHelper(session)
+
+    albums = helper.get_random_albums(3)
+    assert len({album.id for album in albums}) == 3
+    assert len(helper.get_random_albums(10)) == 5
@@ -0,0 +1,90 @@
+import time
+
+from sqlalchemy import create_engine
+from sqlmodel import Session, select
+
+from src.app import database as db
+from src.app.db_loading import AudioInfo
+from src.app.scrobbles import ScrobbleRecorder
+
+from tests.integration.fixtures import db_uri, fill_library
+
+
+def set_album(i: int, audio_info: AudioInfo) -> None:
+    audio_info.album = "al1" if i < 2 else "al2"
+
+
+def fill_tracks(db_uri: str) -> None:
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        fill_library(session, 3, set_album)
+    engine.dispose()
+
+
+def get_counts(db_uri: str) -> tuple[dict[str, int], dict[str, int]]:
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        tracks = dict(session.exec(select(db.Track.title, db.Track.plays_count)).all())
+        albums = dict(session.exec(select(db.Album.name, db.Album.play_count)).all())
+    engine.dispose()
+    return tracks, albums
+
+
+def test_flush_writes_buffered_plays(db_uri: str):
+    fill_tracks(db_uri)
+    recorder = ScrobbleRecorder(create_engine(db_uri))
+
+    for id in (1, 1, 2, 3, 1):
+        recorder.record(id)
+    assert get_counts(db_uri) == (
+        {"track0": 0, "track1": 0, "track2": 0},
+        {"al1": 0, "al2": 0},
+    )
+
+    recorder.flush()
+    assert get_counts(db_uri) == (
+        {"track0": 3, "track1": 1, "track2": 1},
+        {"al1": 4, "al2": 1},
+    )
+
+    engine = create_engine(db_uri)
+    with Session(engine) as session:
+        for model in (db.Track, db.Album):
+            for row in session.exec(select(model)):
+                assert row.last_played is not None
+    engine.dispose()
+
+    # An empty buffer writes nothing
+    recorder.flush()
+    assert get_counts(db_uri)[1] == {"al1": 4, "al2": 1}
+
+
+def test_worker_flushes_after_max_events_and_on_stop(db_uri: str):
+    fill_tracks(db_uri)
+    recorder = ScrobbleRecorder(create_engine(db_uri), interval=60, max_events=2)
+    recorder.start()
+
+    recorder.record(1)
+    recorder.record(3)
+    deadline = time.monotonic() + 5
+    while get_counts(db_uri)[1] != {"al1": 1, "al2": 1}:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    recorder.record(2)
+    recorder.stop()
+    assert get_counts(db_uri)[1] == {"al1": 2, "al2": 1}
+
+
+def test_failed_flush_keeps_plays(db_uri: str, tmp_path):
+    fill_tracks(db_uri)
+    # No tables in that database, so the write fails
+    recorder = ScrobbleRecorder(create_engine(f"sqlite:///{tmp_path / 'empty.db'}"))
+    recorder.record(1)
+    recorder.flush()
+    assert recorder.plays == {1: 1}
+
+    recorder.engine = create_engine(db_uri)
+    recorder.record(1)
+    recorder.flush()
+    assert get_counts(db_uri)[0]["track0"] == 2
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import AsyncIterator, Iterator
+
+import httpx
+from fastapi import Depends, Query
+from fastapi.responses import JSONResponse
+from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.app import database as db
+from src.app import service_layer
+from src.app.app import app
+from src.app.auth import authenticate_user
+from src.app.db_loading import LibraryLoader
+from src.app.open_subsonic_formatter import OpenSubsonicFormatter
+from src.app.subsonic_response import SubsonicResponse
+
+from tests.load.loader_benchmark import generate_audio_infos
+from tests.load.scan_read_benchmark import format_latencies
+
+
+@app.get("/benchmark/blockingSearch3")
+async def blocking_search3(
+    query: str = Query(),
+    songCount: int = Query(default=20),
+    current_user: db.User = Depends(authenticate_user),
+    session: Session = Depends(db.get_session),
+) -> JSONResponse:
+    # search3 before the async database path: queries run on the event loop
+    service = service_layer.SearchService(session)
+    artists, albums, tracks = service.search3(
+        query, 20, 0, 20, 0, songCount, 0, current_user
+    )
+    rsp = SubsonicResponse()
+    rsp.data["searchResult3"] = OpenSubsonicFormatter.format_combination(
+        artists, albums, tracks
+    )
+    return rsp.to_json_rsp()
+
+
+def fill_library(url: str, count: int, placeholder: str) -> None:
+    engine = create_engine(url)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        service_layer.create_user(session, "admin", "admin")
+        loader = LibraryLoader(session, preload=True)
+        for audio_info in generate_audio_infos(count, placeholder):
+            loader.load(audio_info)
+        loader.commit()
+    engine.dispose()
+
+
+async def repeat(
+    client: httpx.AsyncClient,
+    url: str,
+    stop: asyncio.Event,
+    latencies: list[float],
+    pause: float = 0,
+) -> int:
+    errors = 0
+    while not stop.is_set():
+        # Time spent waiting for a blocked event loop after the pause counts too
+        started_at = time.monotonic()
+        await asyncio.sleep(pause)
+        response = await client.get(url)
+        if response.status_code != 200:
+            errors += 1
+        latencies.append(time.monotonic() - started_at - pause)
+    return errors
+
+
+async def measure(search_path: str, searchers: int, seconds: float) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        stop = asyncio.Event()
+        ping_latencies: list[float] = []
+        search_latencies: list[float] = []
+        auth = "u=admin&p=admin"
+        tasks = [
+            asyncio.create_task(
+                repeat(
+                    client,
+                    f"{search_path}?query=track1&songCount=500&{auth}",
+                    stop,
+                    search_latencies,
+                )
+            )
+            for _ in range(searchers)
+        ]
+        pings = asyncio.create_task(
+            repeat(client, f"/rest/ping?{auth}", stop, ping_latencies, 0.005)
+        )
+        await asyncio.sleep(seconds)
+        stop.set()
+        search_errors = sum(await asyncio.gather(*tasks))
+        ping_errors = await pings
+
+    print(f"{search_path} with {searchers} concurrent searches:")
+    print("  " + format_latencies("pings", ping_latencies, ping_errors))
+    print("  " + format_latencies("searches", search_latencies, search_errors))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures event loop latency while searches run concurrently"
+    )
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--searchers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir:
+        placeholder = os.path.join(dir, "placeholder.mp3")
+        open(placeholder, "wb").close()
+        url = f"sqlite:///{os.path.join(dir, 'benchmark.db')}"
+        fill_library(url, args.count, placeholder)
+
+        engine = db.create_db_engine(url)
+        async_engine = db.create_async_db_engine(url)
+
+        def get_session() -> Iterator[Session]:
+            with Session(engine) as session:
+                yield session
+
+        async def get_async_session() -> AsyncIterator[AsyncSession]:
+            async with AsyncSession(async_engine) as session:
+                yield session
+
+        app.dependency_overrides[db.get_session] = get_session
+        app.dependency_overrides[db.get_async_session] = get_async_session
+
+        async def main() -> None:
+            await measure("/benchmark/blockingSearch3", args.searchers, args.seconds)
+            await measure("/rest/search3", args.searchers, args.seconds)
+            await async_engine.dispose()
+
+        asyncio.run(main())
+        engine.dispose()
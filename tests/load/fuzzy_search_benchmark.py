@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from sqlalchemy import insert
+from sqlmodel import SQLModel, Session, create_engine
+
+from src.app import database as db
+from src.app.fuzzy_search import FuzzyIndex
+
+
+def generate_titles(count: int) -> list[str]:
+    words = [
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9)))
+        for _ in range(count // 20 + 1)
+    ]
+    return [
+        " ".join(random.choices(words, k=random.randint(1, 4))) for _ in range(count)
+    ]
+
+
+def add_typo(title: str) -> str:
+    position = random.randrange(len(title))
+    return title[:position] + random.choice(string.ascii_lowercase) + title[position:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures fuzzy search latency over track titles"
+    )
+    parser.add_argument("--count", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    random.seed(0)
+    titles = generate_titles(args.count)
+    with tempfile.TemporaryDirectory() as dir:
+        engine = create_engine(f"sqlite:///{os.path.join(dir, 'benchmark.db')}")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.connection().execute(
+                insert(db.Track),
+                [
+                    {
+                        "file_path": f"{i}.mp3",
+                        "file_size": 0,
+                        "type": "audio/mpeg",
+                        "title": title,
+                        "plays_count": 0,
+                        "bit_rate": 0,
+                        "bits_per_sample": 0,
+                        "sample_rate": 0,
+                        "channels": 0,
+                        "duration": 0,
+                    }
+                    for i, title in enumerate(titles)
+                ],
+            )
+            session.commit()
+
+            index = FuzzyIndex()
+            started_at = time.monotonic()
+            index.rebuild(session)
+            print(
+                f"rebuild of {args.count} titles took {time.monotonic() - started_at:.2f}s"
+            )
+
+            latencies = []
+            for _ in range(args.queries):
+                query = add_typo(random.choice(titles))
+                started_at = time.monotonic()
+                index.find(db.Track, query, 20, 0)
+                latencies.append(time.monotonic() - started_at)
+        engine.dispose()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{args.queries} queries, p50 {p50:.1f}ms, p99 {p99:.1f}ms")
@@ -0,0 +1,76 @@
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, Iterator
+
+from sqlmodel import SQLModel, Session, create_engine
+
+from src.app.db_loading import AudioInfo, LibraryLoader, load_audio_data
+
+
+def generate_audio_infos(count: int, placeholder: str) -> Iterator[AudioInfo]:
+    for i in range(count):
+        audio_info = AudioInfo(placeholder)
+        audio_info.file_path = f"tracks/artist{i % 200}/album{i // 10}/{i}.mp3"
+        audio_info.type = "audio/mpeg"
+        audio_info.title = f"track{i}"
+        audio_info.artists = [f"artist{i % 200}", f"artist{(i * 7) % 200}"]
+        audio_info.album_artist = f"artist{i // 10 % 200}"
+        audio_info.album = f"album{i // 10}"
+        audio_info.genres = [f"genre{i % 20}"]
+        audio_info.track_number = i % 10 + 1
+        audio_info.year = str(1970 + i % 50)
+        audio_info.cover = (i // 10).to_bytes(4, "big") * 2048
+        audio_info.cover_type = "jpeg"
+        audio_info.custom_tags = [("mood", f"mood{i % 5}")]
+        audio_info.bit_rate = 320000
+        audio_info.bits_per_sample = 16
+        audio_info.sample_rate = 44100
+        audio_info.channels = 2
+        audio_info.duration = 200
+        yield audio_info
+
+
+def run(
+    name: str, count: int, load: Callable[[Session, Iterator[AudioInfo]], None]
+) -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        placeholder = os.path.join(dir, "placeholder.mp3")
+        open(placeholder, "wb").close()
+
+        engine = create_engine(f"sqlite:///{os.path.join(dir, 'benchmark.db')}")
+        SQLModel.metadata.create_all(engine)
+
+        with Session(engine) as session:
+            started_at = time.monotonic()
+            load(session, generate_audio_infos(count, placeholder))
+            elapsed = time.monotonic() - started_at
+        engine.dispose()
+        db_size = os.path.getsize(os.path.join(dir, "benchmark.db"))
+
+    print(
+        f"{name}: {count} tracks in {elapsed:.2f}s ({count / elapsed:.0f} tracks/sec), "
+        f"database size {db_size / 2**20:.1f} MiB"
+    )
+
+
+def load_one_by_one(session: Session, audio_infos: Iterator[AudioInfo]) -> None:
+    for audio_info in audio_infos:
+        load_audio_data(audio_info, session)
+
+
+def load_in_batches(session: Session, audio_infos: Iterator[AudioInfo]) -> None:
+    loader = LibraryLoader(session, preload=True)
+    for audio_info in audio_infos:
+        loader.load(audio_info)
+    loader.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares track loading speed")
+    parser.add_argument("--count", type=int, default=5000)
+    args = parser.parse_args()
+
+    run("load_audio_data per file", args.count, load_one_by_one)
+    run("LibraryLoader", args.count, load_in_batches)
@@ -0,0 +1,149 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from typing import Callable
+
+from sqlalchemy import Engine, create_engine, update
+from sqlalchemy.exc import OperationalError
+from sqlmodel import SQLModel, Session, col, select
+
+from src.app import database as db
+from src.app.db_loading import LibraryLoader
+
+from tests.load.loader_benchmark import generate_audio_infos
+
+
+def scan(engine: Engine, count: int, placeholder: str, parse_ms: float) -> None:
+    with Session(engine) as session:
+        loader = LibraryLoader(session, preload=True)
+        for audio_info in generate_audio_infos(count, placeholder):
+            # Metadata is extracted by worker processes, the loader only waits
+            time.sleep(parse_ms / 1000)
+            audio_info.file_path = "scan/" + audio_info.file_path
+            loader.load(audio_info)
+        loader.commit()
+
+
+def read(session: Session) -> None:
+    session.exec(select(db.Track).where(db.Track.title == "track42")).all()
+    session.exec(
+        select(db.Track.id).where(col(db.Track.title).contains("99")).limit(20)
+    ).all()
+    session.exec(select(db.Album).limit(50)).all()
+
+
+def scrobble(session: Session) -> None:
+    session.connection().execute(
+        update(db.Track)
+        .where(col(db.Track.id) == 42)
+        .values(plays_count=db.Track.plays_count + 1)
+    )
+    session.commit()
+    time.sleep(0.01)
+
+
+def repeat(
+    engine: Engine,
+    request: Callable[[Session], None],
+    stop: threading.Event,
+    latencies: list[float],
+) -> int:
+    errors = 0
+    while not stop.is_set():
+        started_at = time.monotonic()
+        try:
+            with Session(engine) as session:
+                request(session)
+        except OperationalError:
+            errors += 1
+        latencies.append(time.monotonic() - started_at)
+    return errors
+
+
+def format_latencies(name: str, latencies: list[float], errors: int) -> str:
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    return (
+        f"{len(latencies)} {name}, p50 {p50:.1f}ms, p99 {p99:.1f}ms, "
+        f"max {latencies[-1] * 1000:.1f}ms, {errors} 'database is locked' errors"
+    )
+
+
+def run(
+    name: str,
+    make_engine: Callable[[str], Engine],
+    count: int,
+    readers: int,
+    parse_ms: float,
+) -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        placeholder = os.path.join(dir, "placeholder.mp3")
+        open(placeholder, "wb").close()
+
+        engine = make_engine(f"sqlite:///{os.path.join(dir, 'benchmark.db')}")
+        SQLModel.metadata.create_all(engine)
+        scan(engine, 1000, placeholder, 0)
+
+        stop = threading.Event()
+        read_latencies: list[float] = []
+        write_latencies: list[float] = []
+        read_errors: list[int] = []
+        write_errors: list[int] = []
+        threads = [
+            threading.Thread(
+                target=lambda: read_errors.append(
+                    repeat(engine, read, stop, read_latencies)
+                )
+            )
+            for _ in range(readers)
+        ]
+        threads.append(
+            threading.Thread(
+                target=lambda: write_errors.append(
+                    repeat(engine, scrobble, stop, write_latencies)
+                )
+            )
+        )
+        for thread in threads:
+            thread.start()
+
+        started_at = time.monotonic()
+        scan(engine, count, placeholder, parse_ms)
+        elapsed = time.monotonic() - started_at
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    print(f"{name}: scan of {count} tracks took {elapsed:.2f}s")
+    print("  " + format_latencies("reads", read_latencies, sum(read_errors)))
+    print("  " + format_latencies("writes", write_latencies, sum(write_errors)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures read latency while a scan is writing to the DB"
+    )
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--parse-ms", type=float, default=0.2)
+    args = parser.parse_args()
+
+    run(
+        "default engine",
+        lambda url: create_engine(url),
+        args.count,
+        args.readers,
+        args.parse_ms,
+    )
+    run(
+        "configured engine",
+        db.create_db_engine,
+        args.count,
+        args.readers,
+        args.parse_ms,
+    )
@@ -4,6 +4,7 @@ from unittest.mock import MagicMock
 from parameterized import parameterized
 
 import src.app.database as db
+import src.app.db_helpers as db_helpers
 import src.app.dto as dto
 from src.app.service_layer import AlbumService, RequestType
 
@@ -84,7 +85,7 @@ class TestTrackService(unittest.TestCase):
     def test_get_album_list_random_one(self):
         album, _, _ = get_entities(1)
 
-        self.album_service.album_db_helper.get_all_albums = MagicMock(
+        self.album_service.album_db_helper.get_random_albums = MagicMock(
             return_value=[album]
         )
 
@@ -113,14 +114,17 @@ class TestTrackService(unittest.TestCase):
             album, _, _ = get_entities(1)
             albums.append(album)
 
-        self.album_service.album_db_helper.get_all_albums = MagicMock(
-            return_value=albums
+        self.album_service.album_db_helper.get_random_albums = MagicMock(
+            return_value=albums[:size]
         )
 
         result = self.album_service.get_album_list(RequestType.RANDOM, size)
 
         self.assertIsNotNone(result)
         self.assertEqual(len(result), res_len)
+        self.album_service.album_db_helper.get_random_albums.assert_called_once_with(
+            size
+        )
 
     def test_get_album_list_by_name(self):
         album, _, _ = get_entities(1)
@@ -140,7 +144,7 @@ class TestTrackService(unittest.TestCase):
     def test_get_album_list_by_artist(self):
         album, _, _ = get_entities(1)
 
-        self.album_service.album_db_helper.get_all_albums = MagicMock(
+        self.album_service.album_db_helper.get_albums_by_artist = MagicMock(
             return_value=[album]
         )
 
@@ -163,21 +167,19 @@ class TestTrackService(unittest.TestCase):
     def test_get_album_list_by_artist_size_offset(
         self, size: int, offset: int, res_ids: list[int]
     ):
-        album1, _, _ = get_entities(1)
-        album2, _, _ = get_entities(2)
+        albums = [get_entities(1)[0], get_entities(2)[0]]
 
-        self.album_service.album_db_helper.get_all_albums = MagicMock(
-            return_value=[album1, album2]
-        )
-
-        self.album_service.album_db_helper.get_album_artist = MagicMock(
-            side_effect=lambda id: dto.Artist(id, name=str(id))
+        self.album_service.album_db_helper.get_albums_by_artist = MagicMock(
+            return_value=albums[offset : offset + size]
         )
 
         result = self.album_service.get_album_list(
             RequestType.BY_ARTIST, size=size, offset=offset
         )
 
+        self.album_service.album_db_helper.get_albums_by_artist.assert_called_with(
+            size, offset, after=None
+        )
         self.assertIsNotNone(result)
         self.assertEqual(len(result), len(res_ids))
         for album in result:
@@ -214,7 +216,12 @@ class TestTrackService(unittest.TestCase):
         )
 
         self.album_service.album_db_helper.get_sorted_by_year_albums.assert_called_with(
-            expected_call[0], expected_call[1], size, offset, expected_call[2]
+            expected_call[0],
+            expected_call[1],
+            size,
+            offset,
+            expected_call[2],
+            after=None,
         )
 
         self.assertIsNotNone(result)
@@ -302,6 +309,27 @@ class TestTrackService(unittest.TestCase):
         self.assertEqual(len(result), 1)
         self.check_album(result[0], album, with_tracks=False)
 
+    def test_get_sorted_artist_albums_keeps_id_order(self):
+        newer, _, _ = get_entities(2)
+        newer.year = "2020"
+        older, _, _ = get_entities(1)
+        older.year = "2010"
+
+        self.album_service.album_db_helper.get_sorted_artist_albums = MagicMock(
+            return_value=[newer, older]
+        )
+
+        result = self.album_service.get_sorted_artist_album_page(1, size=2)
+
+        self.assertIsNotNone(result)
+        albums, next_cursor = result
+        self.assertEqual([album.id for album in albums], [1, 2])
+        # The next page starts after the last album in year order
+        self.assertEqual(
+            db_helpers.decode_cursor(next_cursor, "artistAlbums:1"),
+            ["2010", "album1", 1],
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,90 +1,7 @@
 import unittest
 from unittest.mock import MagicMock, patch
 
-from src.app import dto
-from src.app.service_layer import GenreService, fill_genres, fill_genre
-
-
-class TestGenreFunctions(unittest.TestCase):
-
-    def test_fill_genre(self):
-        mock_db_genre = MagicMock()
-        mock_db_genre.name = "Rock"
-        mock_db_genre.tracks = [
-            MagicMock(album_id=1),
-            MagicMock(album_id=1),
-            MagicMock(album_id=2),
-            MagicMock(album_id=3),
-        ]
-
-        expected_genre = dto.Genre(albumCount=3, songCount=4, name="Rock")
-        result = fill_genre(mock_db_genre)
-
-        self.assertEqual(result.albumCount, expected_genre.albumCount)
-        self.assertEqual(result.songCount, expected_genre.songCount)
-        self.assertEqual(result.name, expected_genre.name)
-
-    def test_fill_genres(self):
-
-        mock_db_genre1 = MagicMock()
-        mock_db_genre1.name = "Pop"
-        mock_db_genre1.tracks = [MagicMock(album_id=1), MagicMock(album_id=2)]
-
-        mock_db_genre2 = MagicMock()
-        mock_db_genre2.name = "Jazz"
-        mock_db_genre2.tracks = [
-            MagicMock(album_id=1),
-            MagicMock(album_id=1),
-            MagicMock(album_id=2),
-        ]
-
-        db_genres = [mock_db_genre1, mock_db_genre2]
-
-        result = fill_genres(db_genres)
-
-        self.assertEqual(len(result), 2)
-        self.assertEqual(result[1].albumCount, 2)
-        self.assertEqual(result[1].songCount, 2)
-        self.assertEqual(result[0].albumCount, 2)
-        self.assertEqual(result[0].songCount, 3)
-
-    def test_fill_genre_empty_tracks(self):
-        mock_db_genre = MagicMock()
-        mock_db_genre.name = "Classical"
-        mock_db_genre.tracks = []
-
-        expected_genre = dto.Genre(albumCount=0, songCount=0, name="Classical")
-        result = fill_genre(mock_db_genre)
-
-        self.assertEqual(result.albumCount, expected_genre.albumCount)
-        self.assertEqual(result.songCount, expected_genre.songCount)
-        self.assertEqual(result.name, expected_genre.name)
-
-    def test_fill_genres_with_empty_genre(self):
-        mock_db_genre1 = MagicMock()
-        mock_db_genre1.name = "Pop"
-        mock_db_genre1.tracks = [MagicMock(album_id=1), MagicMock(album_id=2)]
-
-        mock_db_genre2 = MagicMock()
-        mock_db_genre2.name = "Classical"
-        mock_db_genre2.tracks = []
-
-        db_genres = [mock_db_genre1, mock_db_genre2]
-
-        result = fill_genres(db_genres)
-
-        self.assertEqual(len(result), 2)
-        self.assertEqual(result[1].albumCount, 2)
-        self.assertEqual(result[1].songCount, 2)
-        self.assertEqual(result[0].albumCount, 0)
-        self.assertEqual(result[0].songCount, 0)
-
-    def test_fill_genres_empty_list(self):
-        db_genres = []
-
-        result = fill_genres(db_genres)
-
-        self.assertEqual(result, [])
+from src.app.service_layer import GenreService
 
 
 class TestGenreService(unittest.TestCase):
@@ -92,11 +9,7 @@ class TestGenreService(unittest.TestCase):
     @patch("src.app.db_helpers.GenresDBHelper")
     def test_get_genres(self, MockGenresDBHelper):
         mock_session = MagicMock()
-        mock_db_genre = MagicMock()
-        mock_db_genre.name = "Rock"
-        mock_db_genre.tracks = [MagicMock(album_id=1), MagicMock(album_id=2)]
-
-        MockGenresDBHelper.return_value.get_all_genres.return_value = [mock_db_genre]
+        MockGenresDBHelper.return_value.get_genre_stats.return_value = [("Rock", 2, 2)]
 
         genre_service = GenreService(mock_session)
         result = genre_service.get_genres()
@@ -1,5 +1,4 @@
 from typing import List
-import random
 import unittest
 from unittest.mock import MagicMock, patch
 import src.app.database as db
@@ -73,190 +72,48 @@ class TestTrackService(unittest.TestCase):
             assert isinstance(i, dto.Track)
 
     def test_get_random_songs_empty_list(self):
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(return_value=[])
+        self.track_service.track_db_helper.get_random_tracks = MagicMock(
+            return_value=[]
+        )
         result = self.track_service.get_random_songs()
         assert len(result) == 0
 
     def test_get_random_songs_just_random(self):
         songs = []
         size = 5
-        for i in range(1, 11):
-            songs.append(create_track_entity(i))
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs
-        )
-        result = self.track_service.get_random_songs(size=size)
-        assert len(result) == size
-        size = 3
-        result = self.track_service.get_random_songs(size=size)
-        assert len(result) == size
-        size = 7
-        result = self.track_service.get_random_songs(size=size)
-        assert len(result) == size
-
-    def test_get_random_songs_size_eq_tracks(self):
-        songs = []
-        size = 10
-        for i in range(1, 11):
+        for i in range(1, size + 1):
             songs.append(create_track_entity(i))
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
+        self.track_service.track_db_helper.get_random_tracks = MagicMock(
             return_value=songs
         )
         result = self.track_service.get_random_songs(size=size)
-        assert len(result) == size
+        assert [song.id for song in result] == [song.id for song in songs]
+        for song in result:
+            assert isinstance(song, dto.Track)
 
     def test_get_random_songs_size_eq_0(self):
-        songs = []
-        size = 0
-        for i in range(1, 11):
-            songs.append(create_track_entity(i))
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs
+        self.track_service.track_db_helper.get_random_tracks = MagicMock(
+            return_value=[]
         )
-        result = self.track_service.get_random_songs(size=size)
+        result = self.track_service.get_random_songs(size=0)
         assert result == []
 
     def test_get_random_songs_negative_size(self):
-        songs = []
-        size = -15
-        for i in range(1, 11):
-            songs.append(create_track_entity(i))
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs
-        )
-        result = self.track_service.get_random_songs(size=size)
+        self.track_service.track_db_helper.get_random_tracks = MagicMock()
+        result = self.track_service.get_random_songs(size=-15)
         assert result == []
+        self.track_service.track_db_helper.get_random_tracks.assert_not_called()
 
-    def test_get_random_songs_size_more_than_tracks(self):
-        songs = []
-        size = 15
-        for i in range(1, 11):
-            songs.append(create_track_entity(i))
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs
-        )
-        result = self.track_service.get_random_songs(size=size)
-        assert len(result) == len(songs)
-
-    def test_get_random_songs_genre(self):
-        songs_with_target_genre = []
-        songs_without_target_genre = []
-        for i in range(1, 11):
-            songs_without_target_genre.append(create_track_entity(i))
-        for i in range(11, 16):
-            songs_with_target_genre.append(create_track_entity(i))
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs_without_target_genre + songs_with_target_genre
-        )
-        self.track_service.track_db_helper.get_tracks_by_genre_name = MagicMock(
-            return_value=songs_with_target_genre
-        )
-        result = self.track_service.get_random_songs(genre="Genre")
-        assert len(result) == len(songs_with_target_genre)
-        for song in result:
-            assert isinstance(song, dto.Track)
-            assert song.id in [s.id for s in songs_with_target_genre]
-
-    def test_get_random_songs_from_year(self):
-        songs = []
-        songs_with_target_year = []
-        target_year = 2021
-        for i in range(1, 11):
-            song = create_track_entity(i)
-            song.year = "2019"
-            songs.append(song)
-        for i in range(11, 16):
-            song = create_track_entity(i)
-            song.year = "2025"
-            songs_with_target_year.append(song)
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs + songs_with_target_year
-        )
-        result = self.track_service.get_random_songs(from_year=str(target_year))
-        assert len(result) == len(songs_with_target_year)
-        for song in result:
-            assert isinstance(song, dto.Track)
-            assert song.year >= target_year
-            assert song.id in [s.id for s in songs_with_target_year]
-
-    def test_get_random_songs_to_year(self):
-        songs = []
-        songs_with_target_year = []
-        target_year = 2021
-        for i in range(1, 11):
-            song = create_track_entity(i)
-            song.year = "2025"
-            songs.append(song)
-        for i in range(11, 16):
-            song = create_track_entity(i)
-            song.year = "2019"
-            songs_with_target_year.append(song)
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs + songs_with_target_year
-        )
-        result = self.track_service.get_random_songs(to_year=str(target_year))
-        assert len(result) == len(songs_with_target_year)
-        for song in result:
-            assert isinstance(song, dto.Track)
-            assert song.year <= target_year
-            assert song.id in [s.id for s in songs_with_target_year]
-
-    def test_get_random_songs_from_year_to_year(self):
-        songs = []
-        songs_with_target_year = []
-        from_year = 2015
-        to_year = 2025
-        for i in range(1, 11):
-            song = create_track_entity(i)
-            song.year = f"{random.randint(1900, 2014)}"
-            songs.append(song)
-
-        for i in range(16, 26):
-            song = create_track_entity(i)
-            song.year = f"{random.randint(2026, 2100)}"
-            songs.append(song)
-
-        for i in range(11, 16):
-            song = create_track_entity(i)
-            song.year = f"{random.randint(2015, 2025)}"
-            songs_with_target_year.append(song)
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs + songs_with_target_year
-        )
-        result = self.track_service.get_random_songs(
-            from_year=str(from_year), to_year=str(to_year)
+    def test_get_random_songs_filters(self):
+        self.track_service.track_db_helper.get_random_tracks = MagicMock(
+            return_value=[]
         )
-        assert len(result) == len(songs_with_target_year)
-        for song in result:
-            assert isinstance(song, dto.Track)
-            assert song.year <= to_year
-            assert song.year >= from_year
-            assert song.id in [s.id for s in songs_with_target_year]
-
-    def test_get_random_songs_from_year_eaual_to_year(self):
-        songs = []
-        songs_with_target_year = []
-        target_year = 2025
-        for i in range(1, 11):
-            song = create_track_entity(i)
-            song.year = "2021"
-            songs.append(song)
-
-        for i in range(11, 16):
-            song = create_track_entity(i)
-            song.year = "2025"
-            songs_with_target_year.append(song)
-        self.track_service.track_db_helper.get_all_tracks = MagicMock(
-            return_value=songs + songs_with_target_year
+        self.track_service.get_random_songs(
+            size=7, genre="Genre", from_year="2015", to_year="2025"
         )
-        result = self.track_service.get_random_songs(
-            from_year=str(target_year), to_year=str(target_year)
+        self.track_service.track_db_helper.get_random_tracks.assert_called_once_with(
+            7, "Genre", "2015", "2025"
         )
-        assert len(result) == len(songs_with_target_year)
-        for song in result:
-            assert isinstance(song, dto.Track)
-            assert song.year == target_year
-            assert song.id in [s.id for s in songs_with_target_year]
 
     def test_extract_lyrics_no_track(self):
         self.track_service.track_db_helper.get_track_by_id = MagicMock(
@@ -0,0 +1,10 @@
+import pytest
+
+from src.app.cover_cache import get_size_bucket
+
+
+@pytest.mark.parametrize(
+    "size, bucket", [(None, 0), (1, 32), (64, 64), (100, 128), (1024, 1024), (5000, 0)]
+)
+def test_get_size_bucket(size: int | None, bucket: int):
+    assert get_size_bucket(size) == bucket
@@ -0,0 +1,74 @@
+import os
+
+from src.app.file_cache import FileCache
+
+
+def test_file_cache_put_and_get(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=100)
+    assert cache.get("a-64") is None
+
+    path = cache.put("a-64", b"image", "jpeg")
+    assert path == os.path.join(str(tmp_path), "a-64.jpeg")
+    assert cache.get("a-64") == path
+    with open(path, "rb") as f:
+        assert f.read() == b"image"
+    assert os.listdir(tmp_path) == ["a-64.jpeg"]
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=25, min_age=0)
+    cache.put("a-0", bytes(10), "png")
+    cache.put("b-0", bytes(10), "png")
+    cache.get("a-0")
+    cache.put("c-0", bytes(10), "png")
+
+    assert cache.get("b-0") is None
+    assert cache.get("a-0") is not None
+    assert cache.get("c-0") is not None
+    assert sorted(os.listdir(tmp_path)) == ["a-0.png", "c-0.png"]
+    assert cache.total_bytes == 20
+
+
+def test_file_cache_keeps_recently_used_files(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=25)
+    cache.put("a-0", bytes(10), "png")
+    path = cache.get("a-0")
+    cache.put("b-0", bytes(10), "png")
+    cache.put("c-0", bytes(10), "png")
+
+    # "a-0" may still be about to be opened by a response
+    assert path is not None and os.path.exists(path)
+    assert cache.total_bytes == 30
+
+    cache.used_at["a-0"] -= cache.min_age
+    cache.put("d-0", bytes(10), "png")
+    assert not os.path.exists(path)
+    assert cache.get("a-0") is None
+    assert sorted(os.listdir(tmp_path)) == ["b-0.png", "c-0.png", "d-0.png"]
+
+
+def test_file_cache_survives_restart(tmp_path):
+    FileCache(str(tmp_path), max_bytes=100).put("a-0", b"image", "png")
+    os.utime(tmp_path / "a-0.png", ns=(0, 0))
+    FileCache(str(tmp_path), max_bytes=100).put("b-0", b"image", "png")
+
+    cache = FileCache(str(tmp_path), max_bytes=100)
+    assert cache.get("a-0") == os.path.join(str(tmp_path), "a-0.png")
+    assert cache.total_bytes == 10
+    assert list(cache.load_index()) == ["b-0", "a-0"]
+
+
+def test_file_cache_counts_hits_and_misses(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=100)
+    cache.get("a-0")
+    cache.put("a-0", b"image", "png")
+    cache.get("a-0")
+    cache.get("a-0")
+
+    assert cache.get_status() == {
+        "hits": 2,
+        "misses": 1,
+        "files": 1,
+        "size": 5,
+        "maxSize": 100,
+    }
@@ -14,8 +14,6 @@ from src.app.service_layer import (
     fill_genre_items,
     fill_track,
     fill_tracks,
-    fill_genre,
-    fill_genres,
     fill_artists,
     fill_playlist,
     fill_playlists,
@@ -38,6 +36,8 @@ class TestMusicFunctions(unittest.TestCase):
         mock_album.total_tracks = total_tracks
         mock_album.tracks = tracks
         mock_album.play_count = 1
+        mock_album.created = 1700000000
+        mock_album.last_played = None
         return mock_album
 
     def create_mock_track(self, id=1, title="Test Track", album_name="Test Album"):
@@ -53,6 +53,8 @@ class TestMusicFunctions(unittest.TestCase):
         mock_track.file_path = "audio/mpeg"
         mock_track.duration = 180
         mock_track.bit_rate = 320 * 1024
+        mock_track.created = 1700000000
+        mock_track.last_played = 1700000100
         return mock_track
 
     def create_mock_playlist(self, id=1, name="My Playlist", total_tracks=2, tracks=[]):
@@ -108,7 +110,8 @@ class TestMusicFunctions(unittest.TestCase):
         self.assertEqual(album.name, "Test Album")
         self.assertEqual(album.song_count, 10)
         self.assertEqual(album.duration, 3600)
-        self.assertEqual(album.created.date(), datetime.now().date())
+        self.assertEqual(album.created, datetime.fromtimestamp(1700000000))
+        self.assertIsNone(album.played)
         self.assertEqual(album.artist, "Test Artist")
         self.assertEqual(album.artist_id, 2)
         self.assertEqual(album.cover_art_id, 1)
@@ -227,30 +230,14 @@ class TestMusicFunctions(unittest.TestCase):
         self.assertEqual(track.path, "audio/mpeg")
         self.assertEqual(track.duration, 180)
         self.assertEqual(track.bit_rate, 320)
+        self.assertEqual(track.created, datetime.fromtimestamp(1700000000))
+        self.assertEqual(track.played, datetime.fromtimestamp(1700000100))
 
     def test_fill_tracks(self):
         mock_db_tracks = [self.create_mock_track() for _ in range(2)]
         result = fill_tracks(mock_db_tracks, db.User(id=1, name="Test User"))
         self.assertEqual(len(result), 2)
 
-    def test_fill_genre(self):
-        mock_db_track = self.create_mock_track()
-        mock_genre = MagicMock()
-        mock_genre.name = "Rock"
-        mock_genre.tracks = [mock_db_track, mock_db_track]
-        result = fill_genre(mock_genre)
-        self.assertEqual(result.name, "Rock")
-        self.assertEqual(result.albumCount, 1)
-        self.assertEqual(result.songCount, 2)
-
-    def test_fill_genres(self):
-        mock_genre = MagicMock()
-        mock_genre.name = "Rock"
-        db_genres = [mock_genre]
-        result = fill_genres(db_genres)
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0].name, "Rock")
-
     def test_fill_artists(self):
         db_artists = [self.create_mock_artist()]
         result = fill_artists(db_artists, db.User(id=1, name="Test User"))
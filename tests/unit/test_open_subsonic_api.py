@@ -283,18 +283,18 @@ class TestOpenSubsonicAPI(unittest.TestCase):
         result = api.get_cover_art(id=id, size=None, session=self.session_mock)
         self.assertEqual(result.status_code, 404)
 
-    @patch("src.app.db_helpers.TrackDBHelper.get_track_by_id")
-    def test_scrobble(self, mock_get_track_by_id):
-        track = MagicMock(id=1, plays_count=0)
-        mock_get_track_by_id.return_value = track
+    @patch("src.app.scrobbles.scrobble_recorder")
+    def test_scrobble(self, mock_scrobble_recorder):
+        self.session_mock.get.return_value = MagicMock(id=1)
         result = api.scrobble(id=1, session=self.session_mock)
-        self.assertEqual(track.plays_count, 1)
+        mock_scrobble_recorder.record.assert_called_once_with(1)
         self.assertEqual(result.status_code, 200)
 
-    @patch("src.app.db_helpers.TrackDBHelper.get_track_by_id")
-    def test_scrobble_fail_404(self, mock_get_track_by_id):
-        mock_get_track_by_id.return_value = None
+    @patch("src.app.scrobbles.scrobble_recorder")
+    def test_scrobble_fail_404(self, mock_scrobble_recorder):
+        self.session_mock.get.return_value = None
         result = api.scrobble(id=1, session=self.session_mock)
+        mock_scrobble_recorder.record.assert_not_called()
         self.assertEqual(result.status_code, 404)
 
     def test_update_playlist_valid_user(self):
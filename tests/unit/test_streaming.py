@@ -0,0 +1,180 @@
+import asyncio
+import inspect
+import os
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from starlette.responses import FileResponse
+
+from src.app import database as db
+from src.app import streaming
+from src.app.file_cache import FileCache
+from src.app.streaming import AudioFileResponse, PATH_SEND, ZERO_COPY_SEND
+
+
+def call(
+    response: AudioFileResponse, extension: str, headers: list[tuple[bytes, bytes]]
+) -> list[dict[str, Any]]:
+    messages: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request"}
+
+    async def send(message: dict[str, Any]) -> None:
+        if message["type"] == ZERO_COPY_SEND:
+            file = message["file"]
+            file.seek(message.get("offset", 0))
+            message = {**message, "file": file.read(message.get("count", -1))}
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": headers,
+        "extensions": {extension: {}},
+    }
+    asyncio.run(response(scope, receive, send))
+    return messages
+
+
+@pytest.mark.parametrize(
+    "name, parameters",
+    [
+        ("_should_use_range", ["http_if_range", "stat_result"]),
+        ("_handle_simple", ["self", "send", "send_header_only"]),
+        (
+            "_handle_single_range",
+            ["self", "send", "start", "end", "file_size", "send_header_only"],
+        ),
+    ],
+)
+def test_starlette_hooks_are_unchanged(name: str, parameters: list[str]):
+    # AudioFileResponse overrides these private FileResponse methods
+    hook = getattr(FileResponse, name)
+    assert list(inspect.signature(hook).parameters) == parameters
+    assert getattr(AudioFileResponse, name) is not hook
+
+
+def test_zero_copy_range(tmp_path):
+    file_path = str(tmp_path / "t.flac")
+    with open(file_path, "wb") as f:
+        f.write(bytes(range(100)))
+
+    response = AudioFileResponse(file_path, os.stat(file_path))
+    start, body = call(response, ZERO_COPY_SEND, [(b"range", b"bytes=10-19")])
+
+    assert start["status"] == 206
+    assert (b"content-range", b"bytes 10-19/100") in start["headers"]
+    assert body["type"] == ZERO_COPY_SEND
+    assert body["file"] == bytes(range(10, 20))
+
+
+def test_path_send(tmp_path):
+    file_path = str(tmp_path / "t.flac")
+    with open(file_path, "wb") as f:
+        f.write(bytes(100))
+
+    response = AudioFileResponse(file_path, os.stat(file_path))
+    start, body = call(response, PATH_SEND, [])
+
+    assert start["status"] == 200
+    assert body == {"type": PATH_SEND, "path": file_path}
+
+
+@pytest.mark.parametrize(
+    "type, bit_rate, max_bit_rate, format, expected",
+    [
+        ("audio/flac", 900000, 0, None, None),
+        ("audio/flac", 900000, 0, "raw", None),
+        ("audio/flac", 900000, 320, None, ("mp3", 192)),
+        ("audio/flac", 900000, 96, "opus", ("opus", 96)),
+        ("audio/mpeg", 128000, 192, "mp3", None),
+        ("audio/mpeg", 320000, 128, "mp3", ("mp3", 128)),
+        ("audio/mpeg", 128000, 0, "aac", ("aac", 192)),
+        ("audio/flac", 900000, 0, "flac", None),
+        ("audio/flac", 900000, 320, "flac", ("mp3", 192)),
+        ("audio/flac", 900000, 0, "wma", None),
+        ("audio/mpeg", 320000, 128, "wma", ("mp3", 128)),
+    ],
+)
+def test_choose_transcoding(
+    type: str,
+    bit_rate: int,
+    max_bit_rate: int,
+    format: str | None,
+    expected: tuple[str, int] | None,
+):
+    track = db.Track(type=type, bit_rate=bit_rate)
+    assert streaming.choose_transcoding(track, max_bit_rate, format) == expected
+
+
+def test_transcode_is_killed_on_disconnect(tmp_path):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nwhile true; do echo data; sleep 0.01; done\n")
+    ffmpeg.chmod(0o755)
+
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=2**20)
+    with patch.object(streaming, "FFMPEG_PATH", str(ffmpeg)), patch.object(
+        streaming, "transcode_cache", cache
+    ):
+        assert streaming.transcode_slots.acquire(blocking=False)
+        response = streaming.TranscodeResponse("t.flac", "mp3", 128, "key")
+    assert response.command[0] == str(ffmpeg)
+    assert "128k" in response.command
+
+    sent: list[dict[str, Any]] = []
+    disconnected = asyncio.Event()
+
+    async def receive() -> dict[str, Any]:
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict[str, Any]) -> None:
+        sent.append(message)
+        if len(sent) == 3:
+            disconnected.set()
+
+    scope = {"type": "http", "method": "GET", "headers": []}
+    with patch.object(streaming, "transcode_cache", cache):
+        asyncio.run(response(scope, receive, send))
+
+    assert sent[0]["status"] == 200
+    assert sent[1]["body"].startswith(b"data")
+    assert response.process is not None
+    assert response.process.returncode is not None
+    assert streaming.transcode_slots.acquire(blocking=False)
+    streaming.transcode_slots.release()
+    assert os.listdir(tmp_path / "cache") == []
+
+
+def test_finished_transcode_is_cached(tmp_path):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\necho data\n")
+    ffmpeg.chmod(0o755)
+
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=2**20)
+    sent: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict[str, Any]) -> None:
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "headers": []}
+    with patch.object(streaming, "FFMPEG_PATH", str(ffmpeg)), patch.object(
+        streaming, "transcode_cache", cache
+    ):
+        assert streaming.transcode_slots.acquire(blocking=False)
+        response = streaming.TranscodeResponse("t.flac", "mp3", 128, "key")
+        asyncio.run(response(scope, receive, send))
+
+    assert b"".join(m.get("body", b"") for m in sent[1:]) == b"data\n"
+    cached = cache.get("key")
+    assert cached is not None
+    with open(cached, "rb") as f:
+        assert f.read() == b"data\n"
+    assert streaming.transcode_slots.acquire(blocking=False)
+    streaming.transcode_slots.release()